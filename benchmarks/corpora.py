@@ -0,0 +1,140 @@
+"""
+Synthetic corpora and typing sessions for the benchmarks.
+
+Corpora are generated from a fixed seed, so every run (and the stored
+baseline) measures the same lines.  Each kind comes with the keystrokes of
+a typing session that looks for something in it.
+"""
+import os
+import random
+
+
+LEVELS = ['DEBUG', 'INFO', 'INFO', 'INFO', 'WARN', 'ERROR']
+SERVICES = ['auth', 'billing', 'gateway', 'scheduler', 'search', 'storage']
+EVENTS = [
+    'request completed in {n}ms',
+    'connection reset by peer {ip}',
+    'retrying job {n} after timeout',
+    'cache miss for key user:{n}',
+    'disk usage at {p}%',
+    'user {n} logged in from {ip}',
+]
+
+DIRECTORIES = ['src', 'src/core', 'src/net', 'tests', 'docs', 'tools/build', 'vendor/lib']
+WORDS = ['search', 'filter', 'index', 'buffer', 'parser', 'server', 'client', 'config',
+         'corpus', 'session', 'window', 'stream', 'handler', 'loader']
+EXTENSIONS = ['.py', '.py', '.c', '.h', '.md', '.toml']
+
+UNICODE_WORDS = ['Straße', 'café', 'naïve', 'Ærøskøbing', 'Ελληνικά', 'русский', '日本語',
+                 '検索', 'フィルタ', '한국어', 'emoji😀', 'İstanbul', 'ﬁle', 'Ωmega']
+
+
+def _log_line(rng, i):
+    event = rng.choice(EVENTS).format(
+        n=rng.randrange(100000),
+        ip=f'10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}',
+        p=rng.randrange(100),
+    )
+    return (f'2024-05-{i % 28 + 1:02d}T{i % 24:02d}:{i % 60:02d}:{i * 7 % 60:02d}Z '
+            f'{rng.choice(LEVELS)} [{rng.choice(SERVICES)}] {event}')
+
+
+def _code_line(rng, i):
+    words = rng.sample(WORDS, rng.randint(1, 3))
+    return f'{rng.choice(DIRECTORIES)}/{"_".join(words)}{i % 97}{rng.choice(EXTENSIONS)}'
+
+
+def _unicode_line(rng, i):
+    words = [rng.choice(UNICODE_WORDS) for _ in range(rng.randint(2, 6))]
+    return f'{i} ' + ' '.join(words)
+
+
+GENERATORS = {
+    'log': _log_line,
+    'code': _code_line,
+    'unicode': _unicode_line,
+}
+
+
+def generate_lines(kind, count, seed=0):
+    """Return count synthetic lines of the given kind."""
+    make_line = GENERATORS[kind]
+    rng = random.Random(f'{kind}-{seed}')
+    return [make_line(rng, i) for i in range(count)]
+
+
+def write_corpus(filename, kind, count, seed=0):
+    """Write a synthetic corpus to filename as UTF-8."""
+    with open(filename, 'w', encoding='utf-8', newline='\n') as f:
+        for line in generate_lines(kind, count, seed):
+            f.write(line)
+            f.write('\n')
+
+
+def write_corpus_files(directory, kind, count, files=64, seed=0):
+    """Write the lines of write_corpus() split over files in directory."""
+    lines = generate_lines(kind, count, seed)
+    per_file = -(-count // files)
+    os.makedirs(directory, exist_ok=True)
+    for i in range(0, count, per_file):
+        with open(os.path.join(directory, f'{i // per_file:04d}.txt'), 'w', encoding='utf-8',
+                  newline='\n') as f:
+            for line in lines[i:i + per_file]:
+                f.write(line)
+                f.write('\n')
+
+
+def _type(pattern, text):
+    """Patterns seen while typing text one character at a time after pattern."""
+    patterns = []
+    for char in text:
+        pattern += char
+        patterns.append(pattern)
+    return patterns
+
+
+def _backspace(pattern, count):
+    """Patterns seen while deleting count characters from the end of pattern."""
+    return [pattern[:len(pattern) - i] for i in range(1, count + 1)]
+
+
+# (typed text, characters deleted afterwards) steps, then a pasted pattern
+SESSIONS = {
+    'log': ([('error', 2), ('or timeout', 0)], 'connection reset'),
+    'code': ([('src/se', 3), ('/core/pa', 0)], 'handler'),
+    'unicode': ([('straße', 4), ('asse', 0)], '日本語'),
+}
+# Typing sessions in fuzzy mode, where patterns skip characters
+FUZZY_SESSIONS = {
+    'log': ([('errtim', 3), ('out', 0)], 'gwretry'),
+    'code': ([('srcsrch', 2), ('py', 0)], 'cfgload'),
+    'unicode': ([('strcf', 2), ('afe', 0)], '検フ'),
+}
+# Typing sessions in query mode, where terms are added one by one
+QUERY_SESSIONS = {
+    'log': ([('error', 0), (' !auth', 2), ('th ^2024', 0)], 'WARN re:/\\d{4}ms/'),
+    'code': ([('src', 0), (' !tests', 0), (' .py', 0)], '^docs config'),
+    'unicode': ([('café', 0), (' !русский', 0)], 're:/^\\d+ Straße/'),
+}
+
+
+def typing_session(kind, mode='substring'):
+    """Return the patterns searched for, in order, while a user types.
+    
+    The session types a pattern character by character, deletes part of it
+    with backspace, types more, then clears the field and pastes a new
+    pattern in one keystroke.
+    """
+    sessions = {'fuzzy': FUZZY_SESSIONS, 'query': QUERY_SESSIONS}.get(mode, SESSIONS)
+    steps, pasted = sessions[kind]
+    patterns = []
+    pattern = ''
+    for text, deleted in steps:
+        patterns.extend(_type(pattern, text))
+        pattern = patterns[-1]
+        if deleted:
+            patterns.extend(_backspace(pattern, deleted))
+            pattern = patterns[-1]
+    patterns.extend(_backspace(pattern, len(pattern)))
+    patterns.append(pasted)
+    return patterns
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the search engine and the wire protocol.
+
+Every case loads a synthetic corpus (see corpora.py) with one engine
+configuration and replays a typing session against it, one search per
+keystroke.  A case records its init time, the time until background
+indexes are built, p50/p99/max per-keystroke latency and the peak RSS of
+the process that ran it.  Each case runs in a fresh process, so the peak
+memory of one does not hide another's.
+
+Results can be compared against a stored baseline; a metric that got worse
+than its baseline by more than the tolerance fails the run.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCHMARKS_DIR)
+sys.path.insert(0, os.path.join(os.path.dirname(BENCHMARKS_DIR), 'src'))
+
+from corpora import GENERATORS, typing_session, write_corpus, write_corpus_files
+from corpus_loader import CorpusLoader
+from corpus_pool import CorpusPool
+from server import PipeServer
+from session import FilterSession
+from transport import connect
+
+
+# name -> (CorpusLoader options, search mode, framing of requests sent to a
+# PipeServer over a local socket or None to call the session directly)
+ENGINES = {
+    'list': ({'backend': 'list'}, 'substring', None),
+    'buffer': ({'backend': 'buffer'}, 'substring', None),
+    'mmap': ({'backend': 'mmap'}, 'substring', None),
+    'trigram': ({'backend': 'list', 'trigram_index': True}, 'substring', None),
+    'parallel': ({'backend': 'buffer', 'workers': 0}, 'substring', None),
+    'progressive': ({'backend': 'list'}, 'progressive', None),
+    'fuzzy': ({'backend': 'list', 'fuzzy_prefilter': True}, 'fuzzy', None),
+    'query': ({'backend': 'list'}, 'query', None),
+    'protocol': ({'backend': 'list'}, 'substring', 'json'),
+    'binary': ({'backend': 'list'}, 'substring', 'binary'),
+    'files': ({'backend': 'list'}, 'substring', None),
+    'files-buffer': ({'backend': 'buffer'}, 'substring', None),
+}
+# Engines that load the corpus split over a directory of files, whose init
+# time covers reading them in parallel
+DIRECTORY_ENGINES = {'files', 'files-buffer'}
+
+# Lines of the page around the selection each search over a socket asks for
+WIRE_WINDOW = 50
+
+SIZES = [10000, 100000, 1000000]
+QUICK_SIZES = [10000]
+
+# A metric regresses when it exceeds baseline * (1 + tolerance) + slack;
+# the slack keeps timer noise on tiny values from failing the run
+METRIC_SLACK = {
+    'init_s': 0.05,
+    'ready_s': 0.1,
+    'p50_ms': 1.0,
+    'p99_ms': 2.0,
+    'peak_rss_mb': 16.0,
+}
+TOLERANCE = 0.25
+
+
+def percentile(values, percent):
+    """Return the nearest-rank percentile of values."""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+
+
+def _search_request(pattern, mode, framing):
+    if mode == 'progressive':
+        request = {'type': 'search', 'pattern': pattern, 'progressive': True}
+    else:
+        request = {'type': 'search', 'pattern': pattern, 'mode': mode}
+    if framing:
+        # Like a list view, which shows a page of matches per keystroke
+        request['window'] = WIRE_WINDOW
+    return request
+
+
+class _DirectClient:
+    """Calls a session's handler directly, without a connection."""
+    
+    def __init__(self, options, mode):
+        self._loader = CorpusLoader(**options)
+        self._pool = CorpusPool(self._loader)
+        self.session = FilterSession(self._pool, mode=mode)
+        self.request = self.session.handle_message
+    
+    def close(self):
+        self.session.close()
+        self._pool.close()
+        self._loader.close()
+
+
+class _ServerClient:
+    """Sends requests, one at a time, to a PipeServer running in this process.
+    
+    The server runs its asyncio event loop in a thread and listens on a unix
+    socket (a named pipe on Windows), so requests take the path of a real
+    client: start_server(), serve_stream() and the session executor.
+    """
+    
+    def __init__(self, options, mode, directory):
+        if sys.platform == 'win32':
+            transport, pipe_name, socket_path = 'pipe', rf'\\.\pipe\isf-bench-{os.getpid()}', None
+        else:
+            transport, pipe_name, socket_path = 'unix', None, os.path.join(directory, 'bench.sock')
+        self._server = PipeServer(pipe_name, transport=transport, socket_path=socket_path,
+                                  mode=mode, **options)
+        self._loop = asyncio.new_event_loop()
+        self._serving = self._loop.create_task(self._server.serve())
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._client = self._connect(transport, pipe_name, socket_path)
+    
+    def _run(self):
+        # The server prints each connection, which would interleave with the results
+        with contextlib.redirect_stdout(io.StringIO()):
+            try:
+                self._loop.run_until_complete(self._serving)
+            except asyncio.CancelledError:
+                pass
+    
+    def _connect(self, transport, pipe_name, socket_path):
+        # The server notes its listen time once it accepts clients
+        deadline = time.monotonic() + 10
+        while 'listen' not in self._server.startup:
+            if self._serving.done() or time.monotonic() > deadline:
+                raise RuntimeError("Benchmark server did not start")
+            time.sleep(0.01)
+        return connect(transport, pipe_name, socket_path)
+    
+    @property
+    def session(self):
+        return next(iter(self._server.sessions))
+    
+    def request(self, msg_obj):
+        self._client.send_message(msg_obj)
+        response = self._client.recv_message()
+        if 'framing' in response:
+            self._client.framing = response['framing']
+        return response
+    
+    def close(self):
+        self._client.close()
+        # Let the server see the disconnect and close the session first
+        deadline = time.monotonic() + 10
+        while self._server.sessions and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self._loop.call_soon_threadsafe(self._serving.cancel)
+        self._thread.join()
+        self._loop.close()
+
+
+def run_case(filename, kind, engine, repeat):
+    """Load filename, a file or directory, with engine and replay the typing session repeat times."""
+    options, mode, framing = ENGINES[engine]
+    session_mode = 'substring' if mode == 'progressive' else mode
+    with tempfile.TemporaryDirectory() as directory:
+        client = _ServerClient(options, session_mode, directory) if framing \
+            else _DirectClient(options, session_mode)
+        try:
+            start = time.perf_counter()
+            init = {'type': 'init', 'directory' if os.path.isdir(filename) else 'filename': filename}
+            if framing:
+                init['framing'] = framing
+            response = client.request(init)
+            init_s = time.perf_counter() - start
+            if response['status'] != 'ok':
+                raise RuntimeError(f"init failed: {response}")
+            # Steady-state typing is measured once background indexes are built
+            loaded = client.session.loaded
+            if loaded.index is not None:
+                loaded.index.wait()
+            loaded.masks.wait()
+            ready_s = time.perf_counter() - start
+            
+            patterns = typing_session(kind, session_mode)
+            latencies = []
+            for _ in range(repeat):
+                for pattern in patterns:
+                    request = _search_request(pattern, mode, framing)
+                    start = time.perf_counter()
+                    client.request(request)
+                    latencies.append((time.perf_counter() - start) * 1000)
+            lines = len(loaded.corpus)
+        finally:
+            client.close()
+    
+    return {
+        'lines': lines,
+        'keystrokes': len(latencies),
+        'init_s': round(init_s, 4),
+        'ready_s': round(ready_s, 4),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'max_ms': round(max(latencies), 3),
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+
+
+def run_isolated(filename, kind, engine, repeat):
+    """Run one case in a fresh process and return its results."""
+    with ProcessPoolExecutor(1, mp_context=get_context('spawn')) as executor:
+        return executor.submit(run_case, filename, kind, engine, repeat).result()
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Return a description of every metric that regressed against baseline."""
+    regressions = []
+    for case, metrics in sorted(results.items()):
+        expected = baseline.get(case)
+        if expected is None:
+            continue
+        for metric, slack in METRIC_SLACK.items():
+            value, reference = metrics.get(metric), expected.get(metric)
+            if value is None or reference is None:
+                continue
+            if value > reference * (1 + tolerance) + slack:
+                regressions.append(f"{case} {metric}: {value} (baseline {reference})")
+    return regressions
+
+
+def load_baseline(filename):
+    """Return the cases of a stored baseline, or {} if there is none."""
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            return json.load(f)['cases']
+    except FileNotFoundError:
+        return {}
+
+
+def save_results(filename, results):
+    """Write results, with the environment they were measured in."""
+    document = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cases': results,
+    }
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the search engine and wire protocol")
+    parser.add_argument('--sizes', type=int, nargs='+', help=f'corpus sizes in lines (default {SIZES})')
+    parser.add_argument('--quick', action='store_true', help=f'only corpora of {QUICK_SIZES} lines')
+    parser.add_argument('--kinds', nargs='+', choices=sorted(GENERATORS), default=sorted(GENERATORS))
+    parser.add_argument('--engines', nargs='+', choices=list(ENGINES), default=list(ENGINES))
+    parser.add_argument('--repeat', type=int, default=3, help='replays of each typing session')
+    parser.add_argument('--baseline', default=os.path.join(BENCHMARKS_DIR, 'baseline.json'))
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help='allowed relative slowdown before a metric fails')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='store these results as the baseline instead of comparing')
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    parser.add_argument('--check', action='store_true',
+                        help='also fail when the baseline is missing or lacks a case that was run')
+    args = parser.parse_args()
+    sizes = args.sizes or (QUICK_SIZES if args.quick else SIZES)
+    
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for kind in args.kinds:
+            for size in sizes:
+                filename = os.path.join(tmpdir, f'{kind}-{size}.txt')
+                write_corpus(filename, kind, size)
+                directory = os.path.join(tmpdir, f'{kind}-{size}')
+                if DIRECTORY_ENGINES.intersection(args.engines):
+                    write_corpus_files(directory, kind, size)
+                for engine in args.engines:
+                    case = f'{kind}/{size}/{engine}'
+                    source = directory if engine in DIRECTORY_ENGINES else filename
+                    results[case] = metrics = run_isolated(source, kind, engine, args.repeat)
+                    print(f"{case:32} init {metrics['init_s']:8.3f}s  ready {metrics['ready_s']:8.3f}s  "
+                          f"p50 {metrics['p50_ms']:9.3f}ms  p99 {metrics['p99_ms']:9.3f}ms  "
+                          f"peak {metrics['peak_rss_mb'] or 0:8.1f}MB", flush=True)
+    
+    if args.output:
+        save_results(args.output, results)
+    if args.update_baseline:
+        baseline = load_baseline(args.baseline)
+        baseline.update(results)
+        save_results(args.baseline, baseline)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    
+    baseline = load_baseline(args.baseline)
+    if not baseline:
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one")
+        return 1 if args.check else 0
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    missing = sorted(set(results) - set(baseline))
+    if missing:
+        print(f"No baseline for {', '.join(missing)}", file=sys.stderr if args.check else sys.stdout)
+    print(f"{len(regressions)} regressions against {args.baseline}")
+    return 1 if regressions or (args.check and missing) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,95 +1,90 @@
 #!/usr/bin/env python3
 """
 Test client for incremental search filter server.
-Connects to server via named pipe and displays filtered results in tkinter window.
+Connects to server via named pipe or Unix socket and displays filtered results in tkinter window.
 """
 import argparse
 import sys
 import tkinter as tk
-import win32file
-import win32pipe
-import pywintypes
-import tomli
-import json
 import os
 import threading
 
+from search_client import CACHE_SIZE, DEBOUNCE, SearchClient
+from transport import connect
+
 
 class TestClient:
     """Test client with minimal tkinter UI."""
     
-    def __init__(self, pipe_name, source_filename, encoding='utf-8'):
+    def __init__(self, pipe_name, source_filename, encoding='utf-8', transport='pipe',
+                 socket_path=None, debounce=DEBOUNCE, cache_size=CACHE_SIZE, prefetch=True):
         self.pipe_name = pipe_name
         self.source_filename = source_filename
         self.encoding = encoding
-        self.pipe_handle = None
+        self.transport = transport
+        self.socket_path = socket_path
+        self.debounce = debounce
+        self.cache_size = cache_size
+        self.prefetch = prefetch
+        # One connection is kept open for the whole session; its I/O runs on
+        # the search client's threads, not on the Tk thread
+        self.connection = None
+        self.search_client = None
         self.root = None
         self.entry = None
         self.current_line = ""
         
     def connect(self):
-        """Connect to the named pipe server."""
+        """Connect to the server."""
+        address = self.pipe_name if self.transport == 'pipe' else self.socket_path
         try:
-            print(f"Connecting to pipe: {self.pipe_name}")
-            self.pipe_handle = win32file.CreateFile(
-                self.pipe_name,
-                win32file.GENERIC_READ | win32file.GENERIC_WRITE,
-                0,
-                None,
-                win32file.OPEN_EXISTING,
-                0,
-                None
-            )
-            
-            # Set pipe to message mode
-            win32pipe.SetNamedPipeHandleState(
-                self.pipe_handle,
-                win32pipe.PIPE_READMODE_MESSAGE,
-                None,
-                None
+            print(f"Connecting to {self.transport}: {address}")
+            self.connection = connect(self.transport, self.pipe_name, self.socket_path)
+            self.search_client = SearchClient(
+                self.connection, self.on_result, encoding=self.encoding,
+                debounce=self.debounce, cache_size=self.cache_size, prefetch=self.prefetch,
             )
-            
             print("Connected to server")
             return True
-        except pywintypes.error as e:
+        except Exception as e:
             print(f"Failed to connect to server: {e}", file=sys.stderr)
             return False
     
-    def send_message(self, msg_obj):
-        """Send a message to the server and receive response."""
+    def send_messages(self, msg_objs):
+        """Send several requests at once and return their responses in order."""
         try:
-            message = json.dumps(msg_obj) + '\n'
-            win32file.WriteFile(self.pipe_handle, message.encode(self.encoding))
-            
-            # Read response
-            result, data = win32file.ReadFile(self.pipe_handle, 65536)
-            response = json.loads(data.decode(self.encoding).strip())
-            return response
+            futures = [self.search_client.send(msg_obj) for msg_obj in msg_objs]
+            return [future.result() for future in futures]
         except Exception as e:
             print(f"Error communicating with server: {e}", file=sys.stderr)
-            return None
+            return [None] * len(msg_objs)
+    
+    def send_message(self, msg_obj):
+        """Send a message to the server and receive response."""
+        return self.send_messages([msg_obj])[0]
     
     def init_server(self):
         """Initialize server with source filename."""
-        response = self.send_message({
-            'type': 'init',
-            'filename': self.source_filename
-        })
-        if response and response.get('status') == 'ok':
+        try:
+            response = self.search_client.init(self.source_filename)
+        except Exception as e:
+            print(f"Error communicating with server: {e}", file=sys.stderr)
+            return False
+        if response.get('status') == 'ok':
             self.current_line = response.get('line', '')
             return True
         return False
     
     def on_search_change(self, event=None):
-        """Handle search input changes."""
-        pattern = self.entry.get()
-        response = self.send_message({
-            'type': 'search',
-            'pattern': pattern
-        })
-        if response and response.get('status') == 'ok':
+        """Handle search input changes; keys that leave the text unchanged send nothing."""
+        self.search_client.search(self.entry.get())
+    
+    def on_result(self, response):
+        """Show the selected line of a search response, from any thread."""
+        if response.get('status') == 'ok':
             self.current_line = response.get('line', '')
-            self.update_title()
+            if self.root:
+                self.root.after(0, self.update_title)
     
     def update_title(self):
         """Update window title with current line."""
@@ -129,9 +124,9 @@ class TestClient:
     
     def on_close(self):
         """Clean up on window close."""
-        if self.pipe_handle:
+        if self.search_client:
             try:
-                win32file.CloseHandle(self.pipe_handle)
+                self.search_client.close()
             except:
                 pass
         if self.root:
@@ -141,8 +136,13 @@ class TestClient:
 def load_config(config_filename):
     """Load configuration from TOML file."""
     try:
+        try:
+            import tomllib
+        except ImportError:
+            # Python before 3.11
+            import tomli as tomllib
         with open(config_filename, 'rb') as f:
-            return tomli.load(f)
+            return tomllib.load(f)
     except Exception as e:
         print(f"Error loading config file: {e}", file=sys.stderr)
         sys.exit(1)
@@ -164,12 +164,18 @@ def main():
     
     pipe_name = config.get('pipe', {}).get('name', '\\\\.\\pipe\\cat_incremental_search_filter')
     encoding = config.get('encoding', {}).get('default', 'utf-8')
+    transport = config.get('transport', {}).get('kind', 'pipe')
+    socket_path = config.get('transport', {}).get('socket_path', '/tmp/cat_incremental_search_filter.sock')
+    debounce = config.get('client', {}).get('debounce', DEBOUNCE)
+    cache_size = config.get('client', {}).get('cache_size', CACHE_SIZE)
+    prefetch = config.get('client', {}).get('prefetch', True)
     
     # Get source filename (this client's source file)
     source_filename = os.path.abspath(__file__)
     
     # Create and run client
-    client = TestClient(pipe_name, source_filename, encoding)
+    client = TestClient(pipe_name, source_filename, encoding, transport, socket_path,
+                        debounce, cache_size, prefetch)
     
     if not client.connect():
         print("Failed to connect to server. Make sure the server is running.", file=sys.stderr)
@@ -0,0 +1,739 @@
+"""
+Corpus backends for the incremental search filter (platform-independent).
+
+A corpus owns the lines of the input file together with their case-folded
+comparison form, and answers "which line indices contain this pattern".
+"""
+import mmap
+import os
+import re
+import sys
+import threading
+from array import array
+from bisect import bisect_right
+from itertools import accumulate, chain
+
+
+# Lines (or candidate indices) handled per chunk by search_chunks()
+CHUNK_LINES = 1 << 16
+# Characters or bytes of a joined buffer handled per chunk by search_chunks()
+CHUNK_BYTES = 1 << 20
+
+
+def make_fold(case_sensitive=False, casefold=False):
+    """Return the function that normalizes text for comparison."""
+    if case_sensitive:
+        return None
+    if casefold:
+        return str.casefold
+    return str.lower
+
+
+def byte_searchable(encoding):
+    """Return True if matching encoded bytes gives the same hits as matching decoded text.
+    
+    That holds for UTF-8, whose multibyte sequences never contain ASCII
+    bytes or start inside another sequence, and for ASCII-compatible
+    single-byte encodings.  In encodings such as cp932 or EUC-JP a pattern
+    can match the second byte of one character and the first of the next.
+    """
+    try:
+        if bytes(range(128)).decode(encoding) != ''.join(map(chr, range(128))):
+            return False
+        # Stateful encodings such as ISO-2022-JP write other characters as ASCII bytes
+        for char in ('\u00e9', '\u0416', '\u3042'):
+            try:
+                if any(b < 0x80 for b in char.encode(encoding)):
+                    return False
+            except UnicodeEncodeError:
+                pass
+    except (LookupError, UnicodeDecodeError):
+        return False
+    # A repeated high byte is one character in most double-byte encodings
+    return all(len(bytes([b, b]).decode(encoding, 'surrogateescape')) == 2 for b in range(0x80, 0x100))
+
+
+# Non-ASCII characters whose lower() contains an ASCII letter: KELVIN SIGN
+# lowers to "k", and LATIN CAPITAL LETTER I WITH DOT ABOVE to "i" followed
+# by a combining dot, so it only matches a pattern's last character
+_LOWERED_TO_ASCII = {'k': '\u212a', 'i': '\u0130'}
+
+
+def _ignorecase_regex(pattern, encoding, present=()):
+    """Compile a bytes regex finding a lowercase ASCII pattern in text as str.lower() would.
+    
+    present holds the characters of _LOWERED_TO_ASCII that occur in the
+    text; the others are left out, as they slow the regex down.  Returns
+    the regex and the length of its longest match.
+    """
+    parts = []
+    longest = 0
+    for position, char in enumerate(pattern):
+        alternatives = [char.encode(encoding)]
+        special = _LOWERED_TO_ASCII.get(char)
+        if special in present and (char == 'k' or position == len(pattern) - 1):
+            alternatives.append(special.encode(encoding))
+        parts.append(b'(?:' + b'|'.join(map(re.escape, alternatives)) + b')')
+        longest += max(map(len, alternatives))
+    return re.compile(b''.join(parts), re.IGNORECASE), longest
+
+
+def _chunked(candidates, size):
+    """Split a sequence of candidate indices into slices of at most size items."""
+    for start in range(0, len(candidates), size):
+        yield candidates[start:start + size]
+
+
+def _scan_windows(find, needle, size, line_index, next_line_start, window):
+    """Yield matching line indices of a joined buffer, one list per window.
+    
+    find(needle, start, end) searches the buffer; each hit is mapped to its
+    line with line_index() and the scan resumes at the next line's start.
+    """
+    pos = 0
+    while pos < size:
+        window_end = min(pos + window, size)
+        # Let a match that starts inside the window run past its end
+        limit = min(window_end + len(needle) - 1, size)
+        hits = []
+        hit = find(needle, pos, limit)
+        while hit != -1:
+            index = line_index(hit)
+            hits.append(index)
+            pos = next_line_start(index)
+            if pos >= window_end:
+                break
+            hit = find(needle, pos, limit)
+        else:
+            pos = window_end
+        yield hits
+
+
+class CorpusLines:
+    """Read-only list-like view of the lines of a corpus."""
+    
+    def __init__(self, corpus):
+        self._corpus = corpus
+    
+    def __len__(self):
+        return len(self._corpus)
+    
+    def __bool__(self):
+        # Avoid len(), which may have to scan the whole file
+        return self._corpus.has_line(0)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if index == slice(None):
+                # The view is read-only, so a full copy can share it
+                return self
+            return [self._corpus.line(i) for i in range(*index.indices(len(self._corpus)))]
+        if index < 0:
+            index += len(self._corpus)
+            if index < 0:
+                raise IndexError("corpus line index out of range")
+        return self._corpus.line(index)
+    
+    def __iter__(self):
+        index = 0
+        while self._corpus.has_line(index):
+            yield self._corpus.line(index)
+            index += 1
+
+
+class FoldedLines:
+    """Read-only list-like view of the comparison form of a corpus's lines.
+    
+    line_at(index) returns the folded text of a line; only non-negative
+    indices are supported.
+    """
+    
+    def __init__(self, corpus, line_at):
+        self._corpus = corpus
+        self._line_at = line_at
+    
+    def __len__(self):
+        return len(self._corpus)
+    
+    def __getitem__(self, index):
+        return self._line_at(index)
+
+
+class LineCorpus:
+    """Corpus stored as a Python list of line strings."""
+    
+    def __init__(self, lines, case_sensitive=False, casefold=False):
+        self.lines = lines
+        self.case_sensitive = case_sensitive
+        self.casefold = casefold
+        self.fold = make_fold(case_sensitive, casefold)
+        # Case-folded copy of lines, built on the first search.
+        # Index i of the folded corpus maps back to lines[i].
+        self._search_lines = None
+        # Keeps the folded copy in step with append_lines()
+        self._fold_lock = threading.Lock()
+    
+    def __len__(self):
+        return len(self.lines)
+    
+    def line(self, index):
+        """Return the original text of a line."""
+        return self.lines[index]
+    
+    def has_line(self, index):
+        """Return True if the corpus has a line at index."""
+        return 0 <= index < len(self.lines)
+    
+    @property
+    def search_lines(self):
+        """Lines in comparison form, index-aligned with lines."""
+        if self._search_lines is None:
+            with self._fold_lock:
+                if self._search_lines is None:
+                    self._search_lines = self._fold_lines(self.lines)
+        return self._search_lines
+    
+    def _fold_lines(self, lines):
+        fold = self.fold
+        if fold is None:
+            return lines
+        folded = []
+        for line in lines:
+            folded_line = fold(line)
+            # Share the original string when folding is a no-op
+            folded.append(line if folded_line == line else folded_line)
+        return folded
+    
+    def append_lines(self, lines):
+        """Add lines to the end of the corpus; existing indices stay valid."""
+        with self._fold_lock:
+            # Extend the folded copy first, so every line index is searchable
+            if self._search_lines is not None and self._search_lines is not self.lines:
+                self._search_lines.extend(self._fold_lines(lines))
+            self.lines.extend(lines)
+    
+    def replace_last_line(self, line):
+        """Replace the text of the last line, e.g. once the rest of it is written."""
+        with self._fold_lock:
+            if self._search_lines is not None and self._search_lines is not self.lines:
+                self._search_lines[-1] = self._fold_lines([line])[0]
+            self.lines[-1] = line
+    
+    def search(self, search_pattern, candidates=None):
+        """Return indices of lines containing an already-folded pattern."""
+        lines = self.search_lines
+        if candidates is None:
+            return [i for i, line in enumerate(lines) if search_pattern in line]
+        return [i for i in candidates if search_pattern in lines[i]]
+    
+    def search_chunks(self, search_pattern, candidates=None):
+        """Yield lists of matching line indices, one list per chunk scanned."""
+        if candidates is None:
+            candidates = range(len(self.lines))
+        for chunk in _chunked(candidates, CHUNK_LINES):
+            yield self.search(search_pattern, chunk)
+    
+    def memory_usage(self):
+        """Return approximate bytes held by the lines and their folded copy."""
+        original_bytes = sys.getsizeof(self.lines)
+        original_bytes += sum(sys.getsizeof(line) for line in self.lines)
+        
+        folded_bytes = 0
+        if self._search_lines is not None and self._search_lines is not self.lines:
+            folded_bytes = sys.getsizeof(self._search_lines)
+            for folded_line, line in zip(self._search_lines, self.lines):
+                if folded_line is not line:
+                    folded_bytes += sys.getsizeof(folded_line)
+        
+        return {
+            'original_bytes': original_bytes,
+            'folded_bytes': folded_bytes,
+            'total_bytes': original_bytes + folded_bytes,
+        }
+
+
+class BufferCorpus:
+    """Corpus stored as one newline-joined string plus an array of line offsets.
+    
+    Matching runs as str.find over the whole buffer, and each hit is mapped
+    back to its line with bisect, so the scan loop stays in C.  Lines added
+    by following the file are kept in a list, the tail, and only they are
+    folded; the tail is joined onto the buffer once it grows too long.
+    """
+    
+    # The tail is joined onto the buffer once it has more than TAIL_LINES
+    # lines and more than 1/TAIL_RATIO of the lines in the buffer, so the
+    # copies cost a constant per appended line
+    TAIL_LINES = 4096
+    TAIL_RATIO = 32
+    
+    def __init__(self, lines, case_sensitive=False, casefold=False):
+        self.case_sensitive = case_sensitive
+        self.casefold = casefold
+        self.fold = make_fold(case_sensitive, casefold)
+        self._text, self._offsets = self._join(lines)
+        self._count = len(self._offsets) - 1
+        # (first line, lines, folded lines) of the tail, replaced as a whole
+        # so that readers see a consistent one.  Lines of the buffer from
+        # the first tail line on are out of date and never read.
+        self._tail = self._new_tail(self._count, [])
+        # Folded buffer and its offsets, built on the first search.
+        # Folding may change line lengths, so the offsets are kept separately.
+        self._search_text = None
+        self._search_offsets = None
+        self._fold_lock = threading.Lock()
+        self.lines = CorpusLines(self)
+    
+    @classmethod
+    def from_text(cls, text, offsets, case_sensitive=False, casefold=False):
+        """Create a corpus from an already joined buffer and its line offsets."""
+        corpus = cls([], case_sensitive, casefold)
+        corpus._text, corpus._offsets = text, offsets
+        corpus._count = len(offsets) - 1
+        corpus._tail = corpus._new_tail(corpus._count, [])
+        return corpus
+    
+    @staticmethod
+    def _join(lines):
+        """Join lines into one buffer; offsets[i] is where line i starts."""
+        offsets = array('Q', [0])
+        offsets.extend(accumulate(len(line) + 1 for line in lines))
+        return '\n'.join(lines), offsets
+    
+    @staticmethod
+    def _extend(text, offsets, count, lines):
+        """Return the buffer and offsets of the first count lines followed by lines."""
+        end = offsets[count]
+        joined, joined_offsets = BufferCorpus._join(lines)
+        text = (text[:end - 1] + '\n' if count else '') + joined
+        offsets = offsets[:count + 1]
+        offsets.extend(end + offset for offset in joined_offsets[1:])
+        return text, offsets
+    
+    def _new_tail(self, start, lines):
+        fold = self.fold
+        return start, lines, ([fold(line) for line in lines] if fold else lines)
+    
+    def __len__(self):
+        return self._count
+    
+    def line(self, index):
+        """Return the original text of a line."""
+        start, tail, _ = self._tail
+        if not 0 <= index < self._count:
+            raise IndexError("corpus line index out of range")
+        if index >= start:
+            return tail[index - start]
+        return self._text[self._offsets[index]:self._offsets[index + 1] - 1]
+    
+    def has_line(self, index):
+        """Return True if the corpus has a line at index."""
+        return 0 <= index < self._count
+    
+    def line_offsets(self):
+        """Return the offsets where each line starts in the buffer."""
+        with self._fold_lock:
+            self._merge_tail()
+            return self._offsets
+    
+    def append_lines(self, lines):
+        """Add lines to the end of the corpus; existing indices stay valid.
+        
+        The lines go to the tail, so only they are folded and the buffer is
+        not copied.
+        """
+        if not lines:
+            return
+        fold = self.fold
+        with self._fold_lock:
+            start, tail, search_tail = self._tail
+            # Extend the folded tail first, so every line index is searchable
+            if search_tail is not tail:
+                search_tail.extend(fold(line) for line in lines)
+            tail.extend(lines)
+            self._count += len(lines)
+            if len(tail) > max(self.TAIL_LINES, start // self.TAIL_RATIO):
+                self._merge_tail()
+    
+    def replace_last_line(self, line):
+        """Replace the text of the last line, e.g. once the rest of it is written.
+        
+        A last line still in the buffer is moved to the tail rather than
+        copying the buffer.
+        """
+        with self._fold_lock:
+            start, tail, search_tail = self._tail
+            if tail:
+                if search_tail is not tail:
+                    search_tail[-1] = self.fold(line)
+                tail[-1] = line
+            else:
+                self._tail = self._new_tail(start - 1, [line])
+    
+    def _merge_tail(self):
+        """Join the tail onto the buffers; the caller holds _fold_lock."""
+        start, tail, search_tail = self._tail
+        if start == len(self._offsets) - 1 and not tail:
+            return
+        text, offsets = self._extend(self._text, self._offsets, start, tail)
+        if self.fold is None:
+            if self._search_text is not None:
+                self._search_text, self._search_offsets = text, offsets
+        elif self._search_text is not None:
+            search_text, search_offsets = self._extend(self._search_text, self._search_offsets,
+                                                       start, search_tail)
+            # Share the offsets again if folding kept every line length
+            self._search_text = search_text
+            self._search_offsets = offsets if search_offsets == offsets else search_offsets
+        self._text, self._offsets = text, offsets
+        self._tail = self._new_tail(self._count, [])
+    
+    @property
+    def search_lines(self):
+        """Lines in comparison form, sliced from the folded buffer as they are read."""
+        start, _, search_tail = self._tail
+        text, offsets = self._ensure_search_buffer()
+        fold = self.fold
+        
+        def line_at(index):
+            if index < start:
+                return text[offsets[index]:offsets[index + 1] - 1]
+            if index - start < len(search_tail):
+                return search_tail[index - start]
+            # Appended after the tail was taken
+            line = self.line(index)
+            return fold(line) if fold else line
+        
+        return FoldedLines(self, line_at)
+    
+    def _ensure_search_buffer(self):
+        with self._fold_lock:
+            if self._search_text is None:
+                self._build_search_buffer()
+            return self._search_text, self._search_offsets
+    
+    def _build_search_buffer(self):
+        if self.fold is None:
+            self._search_text, self._search_offsets = self._text, self._offsets
+        else:
+            folded = self.fold(self._text)
+            if len(folded) == len(self._text):
+                # Folding kept every line length, so the offsets are shared
+                self._search_text, self._search_offsets = folded, self._offsets
+            else:
+                start = self._tail[0]
+                self._search_text, self._search_offsets = self._join(
+                    [self.fold(self.line(i)) for i in range(start)]
+                )
+    
+    def search(self, search_pattern, candidates=None):
+        """Return indices of lines containing an already-folded pattern."""
+        return list(chain.from_iterable(self.search_chunks(search_pattern, candidates)))
+    
+    def search_chunks(self, search_pattern, candidates=None):
+        """Yield lists of matching line indices, one list per chunk scanned."""
+        if '\n' in search_pattern:
+            return
+        # The tail first: a merge meanwhile only adds lines to the buffers
+        start, _, search_tail = self._tail
+        text, offsets = self._ensure_search_buffer()
+        find = text.find
+        
+        if candidates is not None:
+            for chunk in _chunked(candidates, CHUNK_LINES):
+                yield [i for i in chunk
+                       if (find(search_pattern, offsets[i], offsets[i + 1] - 1) != -1 if i < start
+                           else search_pattern in search_tail[i - start])]
+            return
+        
+        yield from _scan_windows(
+            find, search_pattern, offsets[start] - 1 if start else 0,
+            lambda pos: bisect_right(offsets, pos) - 1,
+            lambda index: offsets[index + 1],
+            CHUNK_BYTES,
+        )
+        for first in range(0, len(search_tail), CHUNK_LINES):
+            yield [i for i, line in enumerate(search_tail[first:first + CHUNK_LINES], start + first)
+                   if search_pattern in line]
+    
+    def memory_usage(self):
+        """Return approximate bytes held by the buffers, their offsets and the tail."""
+        _, tail, search_tail = self._tail
+        original_bytes = sys.getsizeof(self._text)
+        original_bytes += self._offsets.buffer_info()[1] * self._offsets.itemsize
+        original_bytes += sys.getsizeof(tail) + sum(map(sys.getsizeof, tail))
+        
+        folded_bytes = 0
+        if self._search_text is not None and self._search_text is not self._text:
+            folded_bytes = sys.getsizeof(self._search_text)
+            if self._search_offsets is not self._offsets:
+                folded_bytes += self._search_offsets.buffer_info()[1] * self._search_offsets.itemsize
+        if search_tail is not tail:
+            folded_bytes += sys.getsizeof(search_tail) + sum(map(sys.getsizeof, search_tail))
+        
+        return {
+            'original_bytes': original_bytes,
+            'folded_bytes': folded_bytes,
+            'total_bytes': original_bytes + folded_bytes,
+        }
+
+
+class MmapCorpus:
+    """Corpus backed by a read-only memory map of the input file.
+    
+    Lines are never decoded up front: line boundaries are found with a
+    newline scan that only advances as far as a lookup needs, matching runs
+    over the raw bytes, and only the lines that are returned get decoded.
+    Case-insensitive matching of ASCII patterns is done on the bytes;
+    casefold mode and non-ASCII patterns fall back to decoding each line
+    unless a prebuilt case-folded copy is attached with attach_folded().
+    Only encodings for which byte_searchable() holds are supported.
+    """
+    
+    # Bytes examined per step of the lazy newline scan
+    SCAN_CHUNK = 1 << 20
+    
+    def __init__(self, filename, encoding='utf-8', case_sensitive=False, casefold=False,
+                 offsets=None):
+        # offsets: complete line offsets from an earlier scan of the same file
+        if not byte_searchable(encoding):
+            raise ValueError(f"Encoding {encoding} is not supported by the mmap backend")
+        self.filename = filename
+        self.encoding = encoding
+        self.case_sensitive = case_sensitive
+        self.casefold = casefold
+        self.fold = make_fold(case_sensitive, casefold)
+        with open(filename, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            # Empty files cannot be mapped
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self._size = size
+        # offsets[i] is where line i starts; the newline scan has covered
+        # every byte before _scanned.  Once complete, offsets ends with a
+        # sentinel one past the end of the last line.
+        self._offsets = array('Q', [0])
+        self._scanned = 0
+        self._complete = False
+        if offsets is not None and len(offsets) and offsets[-1] in (size, size + 1):
+            self._offsets = offsets
+            self._scanned = size
+            self._complete = True
+        # Background searches and line lookups both advance the scan
+        self._scan_lock = threading.Lock()
+        # Case-folded UTF-8 copy: (data, start, length, offsets), see attach_folded()
+        self._folded = None
+        # Characters of _LOWERED_TO_ASCII in the file, found on first use
+        self._lowered_to_ascii = None
+        self.lines = CorpusLines(self)
+    
+    def close(self):
+        """Release the memory map."""
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+    
+    def _scan_to(self, pos):
+        """Advance the newline scan until the line containing byte pos is bounded."""
+        if self._complete or self._scanned > pos:
+            return
+        offsets = self._offsets
+        find = self._data.find
+        with self._scan_lock:
+            while not self._complete and self._scanned <= pos:
+                end = min(self._scanned + self.SCAN_CHUNK, self._size)
+                nl = find(b"\n", self._scanned, end)
+                while nl != -1:
+                    offsets.append(nl + 1)
+                    nl = find(b"\n", nl + 1, end)
+                self._scanned = end
+                if end >= self._size:
+                    if offsets[-1] < self._size:
+                        # Last line has no trailing newline
+                        offsets.append(self._size + 1)
+                    self._complete = True
+    
+    def line_offsets(self):
+        """Return the complete line offsets, finishing the newline scan if needed."""
+        self._scan_to(self._size)
+        return self._offsets
+    
+    def attach_folded(self, data, start, length, offsets):
+        """Search a case-folded UTF-8 copy of the file instead of decoding lines.
+        
+        The copy is data[start:start + length]; offsets[i] is where line i
+        starts in it, relative to start.
+        """
+        if len(offsets) == len(self.line_offsets()):
+            self._folded = (data, start, length, offsets)
+    
+    @property
+    def search_lines(self):
+        """Lines in comparison form, read from the case-folded copy if one is attached."""
+        if self.fold is None:
+            return self.lines
+        if self._folded is not None:
+            data, base, _, offsets = self._folded
+            return FoldedLines(
+                self, lambda index: data[base + offsets[index]:base + offsets[index + 1] - 1].decode('utf-8'),
+            )
+        fold, line = self.fold, self.line
+        return FoldedLines(self, lambda index: fold(line(index)))
+    
+    def _special_chars(self):
+        """Return the non-ASCII characters in the file that lower() turns into ASCII."""
+        if self._lowered_to_ascii is None:
+            present = set()
+            for char in _LOWERED_TO_ASCII.values():
+                try:
+                    if self._data.find(char.encode(self.encoding)) != -1:
+                        present.add(char)
+                except UnicodeEncodeError:
+                    pass
+            self._lowered_to_ascii = present
+        return self._lowered_to_ascii
+    
+    def _scan_lines(self, count):
+        """Advance the newline scan until at least count lines are bounded."""
+        while not self._complete and len(self._offsets) <= count:
+            self._scan_to(self._scanned)
+    
+    def __len__(self):
+        self._scan_to(self._size)
+        return len(self._offsets) - 1
+    
+    def has_line(self, index):
+        """Return True if the corpus has a line at index."""
+        if index < 0:
+            return False
+        self._scan_lines(index + 1)
+        return index + 1 < len(self._offsets)
+    
+    def _line_bounds(self, index):
+        if not self.has_line(index):
+            raise IndexError("corpus line index out of range")
+        start = self._offsets[index]
+        end = self._offsets[index + 1] - 1
+        if end > start and self._data[end - 1] == 0x0D:
+            end -= 1  # CRLF line ending
+        return start, end
+    
+    def line(self, index):
+        """Decode and return the original text of a line."""
+        start, end = self._line_bounds(index)
+        return self._data[start:end].decode(self.encoding, errors='replace')
+    
+    def _line_index(self, pos):
+        """Return the index of the line containing byte pos."""
+        self._scan_to(pos)
+        return bisect_right(self._offsets, pos) - 1
+    
+    def search(self, search_pattern, candidates=None):
+        """Return indices of lines containing an already-folded pattern."""
+        return list(chain.from_iterable(self.search_chunks(search_pattern, candidates)))
+    
+    def search_chunks(self, search_pattern, candidates=None):
+        """Yield lists of matching line indices, one list per chunk scanned."""
+        if '\n' in search_pattern:
+            return
+        if self.fold is not None and self._folded is not None:
+            yield from self._search_folded(search_pattern, candidates)
+            return
+        if self.fold is not None and (self.casefold or not search_pattern.isascii()):
+            yield from self._search_decoded(search_pattern, candidates)
+            return
+        
+        needle = search_pattern.encode(self.encoding)
+        if self.fold is None:
+            find = self._data.find
+        else:
+            regex, longest = _ignorecase_regex(search_pattern, self.encoding, self._special_chars())
+            # Only the length of the needle is used, to let matches run past a window
+            needle = bytes(longest)
+            
+            def find(_needle, start, end):
+                match = regex.search(self._data, start, end)
+                return match.start() if match else -1
+        
+        if candidates is not None:
+            for chunk in _chunked(candidates, CHUNK_LINES):
+                indices = []
+                for i in chunk:
+                    start, end = self._line_bounds(i)
+                    if find(needle, start, end) != -1:
+                        indices.append(i)
+                yield indices
+            return
+        
+        def next_line_start(index):
+            self._scan_lines(index + 1)
+            return self._offsets[index + 1]
+        
+        yield from _scan_windows(
+            find, needle, self._size, self._line_index, next_line_start, CHUNK_BYTES,
+        )
+    
+    def _search_folded(self, search_pattern, candidates):
+        """Match exactly against the attached case-folded copy."""
+        data, base, length, offsets = self._folded
+        needle = search_pattern.encode('utf-8')
+        
+        def find(needle, start, end):
+            pos = data.find(needle, base + start, base + end)
+            return pos - base if pos != -1 else -1
+        
+        if candidates is not None:
+            for chunk in _chunked(candidates, CHUNK_LINES):
+                yield [i for i in chunk if find(needle, offsets[i], offsets[i + 1] - 1) != -1]
+            return
+        
+        yield from _scan_windows(
+            find, needle, length,
+            lambda pos: bisect_right(offsets, pos) - 1,
+            lambda index: offsets[index + 1],
+            CHUNK_BYTES,
+        )
+    
+    def _search_decoded(self, search_pattern, candidates):
+        """Slow path: decode and fold each line before matching."""
+        fold = self.fold
+        if candidates is None:
+            start = 0
+            while self.has_line(start):
+                stop = start + CHUNK_LINES
+                yield [i for i in range(start, stop)
+                       if self.has_line(i) and search_pattern in fold(self.line(i))]
+                start = stop
+            return
+        for chunk in _chunked(candidates, CHUNK_LINES):
+            yield [i for i in chunk if search_pattern in fold(self.line(i))]
+    
+    def memory_usage(self):
+        """Return approximate heap bytes; mapped files live in the page cache."""
+        offsets_bytes = memoryview(self._offsets).nbytes
+        mapped_bytes = self._size
+        if not isinstance(self._offsets, array):
+            # Offsets loaded from the on-disk cache are mapped too
+            mapped_bytes += offsets_bytes
+            offsets_bytes = 0
+        if self._folded is not None:
+            mapped_bytes += self._folded[2] + memoryview(self._folded[3]).nbytes
+        return {
+            'original_bytes': offsets_bytes,
+            'folded_bytes': 0,
+            'total_bytes': offsets_bytes,
+            'mapped_bytes': mapped_bytes,
+        }
+
+
+BACKENDS = {
+    'list': LineCorpus,
+    'buffer': BufferCorpus,
+}
+
+
+def create_corpus(lines, backend='list', case_sensitive=False, casefold=False):
+    """Create a corpus for lines using the named backend."""
+    try:
+        corpus_class = BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown corpus backend: {backend}")
+    return corpus_class(lines, case_sensitive, casefold)
@@ -0,0 +1,325 @@
+"""
+Loading input files into searchable corpora (platform-independent).
+
+Turns a filename into a corpus plus optional trigram index according to the
+server's [search] settings, reusing artifacts from the on-disk cache when one
+is configured and filling the cache in the background otherwise.  A FileSet
+is loaded into one corpus combining the lines of all its files.
+"""
+import os
+import sys
+import threading
+from array import array
+
+from corpus import BufferCorpus, MmapCorpus, byte_searchable, create_corpus
+from follow import POLL_INTERVAL, FileFollower
+from fuzzy import CharMasks
+from multi_file import FileSet, read_files, read_files_joined
+from trigram_index import TrigramIndex
+
+# index_cache and parallel_scan (which imports multiprocessing) are only
+# imported once a cache or scan workers are used, to keep startup short
+
+
+class LoadedCorpus:
+    """A loaded file: its corpus, optional trigram index, fuzzy masks and source fingerprint."""
+    
+    def __init__(self, filename, corpus, index=None, fingerprint=None, masks=None,
+                 size=None, encoding='utf-8', files=None):
+        self.filename = filename
+        self.corpus = corpus
+        self.index = index
+        self.fingerprint = fingerprint
+        # Built on the first fuzzy search unless the loader started it already
+        self.masks = masks if masks is not None else CharMasks(corpus)
+        # Bytes of the file that were loaded (None if it cannot be followed),
+        # and how they were decoded
+        self.size = size
+        self.encoding = encoding
+        # FileTable of the source files when loaded from a FileSet, else None
+        self.files = files
+        # FileFollower shared by every session following the file
+        self.follower = None
+        self._follow_lock = threading.Lock()
+    
+    @property
+    def following(self):
+        """True while lines appended to the file are being added."""
+        return self.follower is not None and not self.follower.truncated
+    
+    def follow(self, interval=POLL_INTERVAL):
+        """Start following the file, unless already started, and return the FileFollower.
+        
+        Raises ValueError if the corpus backend or encoding cannot be followed.
+        """
+        if self.files is not None:
+            raise ValueError("Follow mode needs a single file")
+        with self._follow_lock:
+            if self.follower is None:
+                follower = FileFollower(self, self.encoding, interval)
+                follower.start()
+                self.follower = follower
+            return self.follower
+    
+    def append_lines(self, lines, replace_last=False):
+        """Add lines to the corpus and bring the index and masks up to date.
+        
+        With replace_last, the first line replaces the last line of the
+        corpus instead, e.g. when a partially written line is completed.
+        """
+        if replace_last and lines:
+            self.corpus.replace_last_line(lines[0])
+            last = len(self.corpus) - 1
+            if self.index is not None:
+                self.index.update_line(last)
+            self.masks.update_line(last)
+            lines = lines[1:]
+        self.corpus.append_lines(lines)
+        if self.index is not None:
+            self.index.update()
+        self.masks.update()
+    
+    def close(self):
+        """Stop background indexing and release the corpus."""
+        if self.follower is not None:
+            self.follower.stop()
+        if self.index is not None:
+            self.index.stop()
+        self.masks.stop()
+        if hasattr(self.corpus, 'close'):
+            self.corpus.close()
+
+
+class CorpusLoader:
+    """Builds LoadedCorpus objects using the configured backend and engines."""
+    
+    # Multi-file buffers from this many bytes are decoded by worker processes
+    LOAD_POOL_BYTES = 16 << 20
+    
+    def __init__(self, encoding='utf-8', case_sensitive=False, casefold=False, backend='list',
+                 workers=1, chunk_size=4 << 20, parallel_threshold=200000,
+                 trigram_index=False, cache=None, fuzzy_prefilter=False, load_workers=0):
+        self.encoding = encoding
+        self.case_sensitive = case_sensitive
+        self.casefold = casefold
+        if backend == 'mmap' and not byte_searchable(encoding):
+            # Encodings whose bytes cannot be matched directly, such as cp932
+            backend = 'buffer'
+        self.backend = backend
+        # Parallel scanning: workers=1 scans serially, 0 uses every core
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.parallel_threshold = parallel_threshold
+        self.scan_pool = None
+        self._scan_pool_lock = threading.Lock()
+        # Build a trigram index in the background when a file is loaded
+        self.trigram_index = trigram_index
+        # Optional IndexCache of prebuilt artifacts
+        self.cache = cache
+        # Build the fuzzy character masks when a file is loaded
+        self.fuzzy_prefilter = fuzzy_prefilter
+        # Threads or processes reading the files of a FileSet, 0 for one per core
+        self.load_workers = load_workers
+        self.load_pool = None
+    
+    @property
+    def fold_kind(self):
+        """Name of the comparison form, used to key folded cache artifacts."""
+        if self.case_sensitive:
+            return 'exact'
+        return 'casefold' if self.casefold else 'lower'
+    
+    def load(self, filename):
+        """Load input file, or every file of a FileSet, into a LoadedCorpus."""
+        if isinstance(filename, FileSet):
+            return self.load_files(filename)
+        fingerprint = None
+        if self.cache:
+            from index_cache import file_fingerprint
+            fingerprint = file_fingerprint(filename)
+        corpus, size = self._open_corpus(filename, fingerprint)
+        index = self.open_index(filename, fingerprint, corpus) if self.trigram_index else None
+        masks = CharMasks(corpus)
+        if self.fuzzy_prefilter:
+            masks.start()
+        return LoadedCorpus(filename, corpus, index, fingerprint, masks, size, self.encoding)
+    
+    def load_files(self, file_set):
+        """Load the files of file_set into one LoadedCorpus, reading them in parallel.
+        
+        With more than one worker, a buffer corpus of at least
+        LOAD_POOL_BYTES is decoded and split by worker processes.  A list corpus needs a string object per line,
+        which only this process can create, so its files are read on threads.
+        """
+        # There is no single file to memory-map
+        backend = 'buffer' if self.backend == 'mmap' else self.backend
+        if backend == 'buffer' and (self.load_workers or os.cpu_count() or 1) > 1 \
+                and sum(size for _, size, _ in file_set.stat_key()) >= self.LOAD_POOL_BYTES:
+            text, offsets, files, skipped = read_files_joined(file_set, self._load_pool(), self.encoding)
+            corpus = BufferCorpus.from_text(text, offsets, self.case_sensitive, self.casefold)
+            del text
+        else:
+            lines, files, skipped = read_files(file_set, self.encoding, self.load_workers or None)
+            corpus = create_corpus(lines, backend, self.case_sensitive, self.casefold)
+            del lines
+        if not len(files):
+            raise ValueError(f"No text files in {file_set.key}")
+        for filename in skipped:
+            print(f"Skipped binary or unreadable file {filename}", file=sys.stderr)
+        corpus = self._parallel(corpus)
+        index = None
+        if self.trigram_index:
+            # Artifacts are cached per file, so the combined index is built
+            index = TrigramIndex(corpus)
+            index.start()
+        masks = CharMasks(corpus)
+        if self.fuzzy_prefilter:
+            masks.start()
+        return LoadedCorpus(file_set.key, corpus, index, None, masks, None, self.encoding, files)
+    
+    def open_corpus(self, filename, fingerprint=None):
+        """Load input file into a corpus using the configured backend."""
+        return self._open_corpus(filename, fingerprint)[0]
+    
+    def _open_corpus(self, filename, fingerprint):
+        """Return the corpus and the number of bytes it was loaded from."""
+        if self.backend == 'mmap':
+            # A memory map cannot grow, so the file cannot be followed.  It is
+            # not scanned in parallel either: the shared copy would need every
+            # line decoded up front, which the lazy backend exists to avoid.
+            return self._open_mmap(filename, fingerprint), None
+        
+        with open(filename, 'rb') as f:
+            data = f.read()
+        size = len(data)
+        text = data.decode(self.encoding)
+        del data
+        if self.backend == 'buffer' and self.cache:
+            corpus = self._open_buffer(filename, fingerprint, text)
+        else:
+            lines = text.splitlines()
+            del text
+            corpus = create_corpus(lines, self.backend, self.case_sensitive, self.casefold)
+        return self._parallel(corpus), size
+    
+    def _parallel(self, corpus):
+        """Wrap corpus for parallel scanning if configured and it is large enough."""
+        if self.workers != 1 and len(corpus) >= self.parallel_threshold:
+            from parallel_scan import ParallelCorpus, ScanPool
+            with self._scan_pool_lock:
+                # Sessions may load files concurrently
+                if self.scan_pool is None:
+                    self.scan_pool = ScanPool(self.workers or None)
+            corpus = ParallelCorpus(corpus, self.scan_pool, self.chunk_size, self.parallel_threshold)
+        return corpus
+    
+    def _load_pool(self):
+        """Return the worker processes that read multi-file buffers, starting them once."""
+        from parallel_scan import ScanPool
+        with self._scan_pool_lock:
+            if self.load_pool is None:
+                self.load_pool = ScanPool(self.load_workers or None)
+            return self.load_pool
+    
+    def _open_mmap(self, filename, fingerprint):
+        cache = self.cache
+        if cache is None:
+            return MmapCorpus(filename, self.encoding, self.case_sensitive, self.casefold)
+        
+        from index_cache import folded_parts, load_folded, load_offsets, offsets_parts
+        artifact = cache.load(filename, 'offsets', fingerprint)
+        offsets = load_offsets(artifact) if artifact else None
+        corpus = MmapCorpus(filename, self.encoding, self.case_sensitive, self.casefold, offsets)
+        
+        folded_kind = None if self.case_sensitive else f'folded-{self.fold_kind}'
+        folded = cache.load(filename, folded_kind, fingerprint) if folded_kind else None
+        if folded:
+            corpus.attach_folded(*load_folded(folded))
+        if offsets is not None and (folded_kind is None or folded):
+            return corpus
+        
+        def fill_cache():
+            try:
+                if offsets is None:
+                    cache.store(filename, 'offsets', fingerprint, offsets_parts(corpus.line_offsets()))
+                if folded_kind and not folded:
+                    cache.store(filename, folded_kind, fingerprint, folded_parts(corpus.lines, corpus.fold))
+                    artifact = cache.load(filename, folded_kind, fingerprint)
+                    if artifact:
+                        corpus.attach_folded(*load_folded(artifact))
+            except Exception as e:
+                print(f"Error caching {filename}: {e}", file=sys.stderr)
+        
+        threading.Thread(target=fill_cache, daemon=True).start()
+        return corpus
+    
+    def _open_buffer(self, filename, fingerprint, text):
+        """Build a BufferCorpus from the decoded file, reusing cached line offsets.
+        
+        With the offsets, the file text is the buffer as it is, which saves
+        splitting it into lines and joining them again.
+        """
+        cache = self.cache
+        from index_cache import load_offsets, offsets_parts
+        kind = f'line-starts-{self.encoding}'
+        artifact = cache.load(filename, kind, fingerprint)
+        if artifact:
+            offsets = array('Q')
+            offsets.frombytes(load_offsets(artifact).cast('B'))
+            del artifact
+            if text.endswith('\n'):
+                text = text[:-1]
+            if offsets[-1] == (len(text) + 1 if len(offsets) > 1 else 0):
+                return BufferCorpus.from_text(text, offsets, self.case_sensitive, self.casefold)
+        
+        corpus = BufferCorpus(text.splitlines(), self.case_sensitive, self.casefold)
+        offsets = corpus.line_offsets()
+        # The offsets only describe the file text if every line ends with
+        # one '\n', rather than '\r\n' or another line boundary
+        end = len(text) - text.endswith('\n')
+        if end == max(offsets[-1] - 1, 0) and text.count('\n', 0, end) == max(len(corpus) - 1, 0):
+            # Copied, since following the file may extend the array meanwhile
+            parts = offsets_parts(offsets[:])
+            
+            def fill_cache():
+                try:
+                    cache.store(filename, kind, fingerprint, parts)
+                except Exception as e:
+                    print(f"Error caching {filename}: {e}", file=sys.stderr)
+            
+            threading.Thread(target=fill_cache, daemon=True).start()
+        return corpus
+    
+    def open_index(self, filename, fingerprint, corpus):
+        """Load the trigram index from the cache, or start building it."""
+        cache = self.cache
+        if cache is None:
+            index = TrigramIndex(corpus)
+            index.start()
+            return index
+        
+        from index_cache import CachedPostings, postings_parts
+        # Line numbering depends on the backend, matching on the fold mode
+        kind = f'trigrams-{self.backend}-{self.fold_kind}'
+        artifact = cache.load(filename, kind, fingerprint)
+        if artifact:
+            return TrigramIndex.from_postings(corpus, CachedPostings(artifact))
+        
+        def store(index):
+            try:
+                cache.store(filename, kind, fingerprint, postings_parts(index.postings))
+            except Exception as e:
+                print(f"Error caching index for {filename}: {e}", file=sys.stderr)
+        
+        index = TrigramIndex(corpus, on_complete=store)
+        index.start()
+        return index
+    
+    def close(self):
+        """Stop the parallel scan and load workers."""
+        if self.scan_pool is not None:
+            self.scan_pool.close()
+            self.scan_pool = None
+        if self.load_pool is not None:
+            self.load_pool.close()
+            self.load_pool = None
@@ -0,0 +1,181 @@
+"""
+Bounded in-memory pool of loaded corpora (platform-independent).
+
+Keeps recently used files loaded so that switching between them does not
+reload, evicting the least recently used ones once their combined memory
+exceeds a budget.  Entries are reloaded when the file changes on disk.
+Pinned entries, e.g. files preloaded at startup, are never evicted, and a
+file requested while it is being loaded waits for that load.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from multi_file import FileSet
+
+
+class _PoolEntry:
+    def __init__(self, loaded, stat_key):
+        self.loaded = loaded
+        self.stat_key = stat_key
+        # Measured at load and again when its background builds finish
+        self.resident_bytes = 0
+        # Filters currently using the corpus; evicted entries close at zero
+        self.users = 0
+        self.evicted = False
+        # Kept regardless of the memory budget
+        self.pinned = False
+
+
+def _stat_key(filename):
+    st = os.stat(filename)
+    return st.st_size, st.st_mtime_ns
+
+
+def _resident_bytes(loaded):
+    usage = loaded.corpus.memory_usage()
+    total = usage['total_bytes']
+    if loaded.index is not None:
+        total += loaded.index.memory_usage()['index_bytes']
+    total += loaded.masks.memory_usage()['mask_bytes']
+    return total
+
+
+class CorpusPool:
+    """LRU pool of LoadedCorpus objects keyed by absolute filename."""
+    
+    def __init__(self, loader, memory_budget=1 << 30):
+        self.loader = loader
+        self.memory_budget = memory_budget
+        self._entries = OrderedDict()
+        # Evicted entries still in use, closed on their last release()
+        self._evicted = []
+        self._lock = threading.Lock()
+        # Keys being loaded; notified when a load ends
+        self._loading = set()
+        self._load_done = threading.Condition(self._lock)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+    
+    def acquire(self, filename, pin=False):
+        """Return the loaded corpus for filename or a FileSet, loading it if needed.
+        
+        Pair every acquire() with a release() once the corpus is no longer used.
+        With pin, the entry is never evicted to stay within the memory budget.
+        """
+        if isinstance(filename, FileSet):
+            key, stat_key = filename.key, filename.stat_key()
+        else:
+            key = os.path.abspath(filename)
+            stat_key = _stat_key(key)
+        with self._lock:
+            while key in self._loading:
+                # Attach to the copy being loaded instead of loading another
+                self._load_done.wait()
+            entry = self._entries.get(key)
+            if entry is not None and entry.stat_key != stat_key and not entry.loaded.following:
+                # File changed on disk since it was loaded; followed files
+                # are kept up to date instead
+                self.invalidations += 1
+                pin = pin or entry.pinned
+                self._evict(key)
+                entry = None
+            if entry is not None:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                entry.users += 1
+                entry.pinned = entry.pinned or pin
+                return entry.loaded
+            self.misses += 1
+            self._loading.add(key)
+        
+        try:
+            loaded = self.loader.load(filename if isinstance(filename, FileSet) else key)
+            entry = _PoolEntry(loaded, stat_key)
+            entry.resident_bytes = _resident_bytes(loaded)
+            entry.users = 1
+            entry.pinned = pin
+            with self._lock:
+                self._entries[key] = entry
+                self._shrink()
+            if loaded.index is not None or self.loader.fuzzy_prefilter:
+                threading.Thread(target=self._measure_when_built, args=(entry,), daemon=True).start()
+        finally:
+            with self._lock:
+                self._loading.discard(key)
+                self._load_done.notify_all()
+        return loaded
+    
+    def _measure_when_built(self, entry):
+        """Measure an entry again once the index and masks built after its load are done."""
+        loaded = entry.loaded
+        if loaded.index is not None:
+            loaded.index.wait()
+        loaded.masks.wait()
+        resident_bytes = _resident_bytes(loaded)
+        with self._lock:
+            entry.resident_bytes = resident_bytes
+            if not entry.evicted:
+                self._shrink()
+    
+    def release(self, loaded):
+        """Give back a corpus returned by acquire()."""
+        with self._lock:
+            entry = self._entries.get(loaded.filename)
+            if entry is None or entry.loaded is not loaded:
+                entry = next((e for e in self._evicted if e.loaded is loaded), None)
+            if entry is None:
+                return
+            entry.users -= 1
+            if entry.evicted and entry.users == 0:
+                entry.loaded.close()
+                self._evicted.remove(entry)
+    
+    def _evict(self, key):
+        entry = self._entries.pop(key)
+        entry.evicted = True
+        self.evictions += 1
+        if entry.users == 0:
+            entry.loaded.close()
+        else:
+            self._evicted.append(entry)
+    
+    def _shrink(self):
+        """Evict least recently used unpinned entries until the pool fits the budget."""
+        # The most recently used entry is kept even if it alone exceeds the budget
+        newest = next(reversed(self._entries), None)
+        for key in [key for key, entry in self._entries.items() if not entry.pinned and key != newest]:
+            if self.resident_bytes() <= self.memory_budget:
+                break
+            self._evict(key)
+    
+    def resident_bytes(self):
+        """Return the approximate memory held by pooled corpora."""
+        return sum(entry.resident_bytes for entry in self._entries.values())
+    
+    def stats(self):
+        """Return hit rate, residency and eviction counters."""
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'files': list(self._entries),
+                'pinned': [key for key, entry in self._entries.items() if entry.pinned],
+                'resident_bytes': self.resident_bytes(),
+                'memory_budget': self.memory_budget,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / requests if requests else 0.0,
+                'invalidations': self.invalidations,
+                'evictions': self.evictions,
+            }
+    
+    def close(self):
+        """Release every pooled corpus."""
+        with self._lock:
+            for key in list(self._entries):
+                entry = self._entries.pop(key)
+                entry.loaded.close()
+            self._evicted.clear()
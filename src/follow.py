@@ -0,0 +1,138 @@
+"""
+Following files that grow while they are searched (platform-independent).
+
+A FileFollower polls a loaded file for bytes appended since it was read and
+adds the new lines to its corpus, trigram index and fuzzy masks.  Existing
+line indices never change, so filters only have to check the new lines
+against their pattern (see IncrementalSearchFilter.refresh()).
+
+Only complete lines are added: bytes after the last newline wait for the
+next poll.  A last line that was still being written when the file was
+loaded is already in the corpus; when its newline arrives, the completed
+line replaces it, so filters also recheck the line before the new ones.
+A file that shrinks was truncated or replaced, which cannot be
+followed in place; the follower then stops and sets truncated.
+"""
+import os
+import sys
+import threading
+
+
+# Seconds between checks of the file size
+POLL_INTERVAL = 1.0
+
+
+class FileFollower:
+    """Appends the lines written to a loaded file, polling it in a daemon thread."""
+    
+    def __init__(self, loaded, encoding='utf-8', interval=POLL_INTERVAL):
+        if '\n'.encode(encoding) != b'\n':
+            raise ValueError(f"Encoding {encoding} is not supported in follow mode")
+        if loaded.size is None:
+            raise ValueError("Follow mode needs the list or buffer backend")
+        self.loaded = loaded
+        self.encoding = encoding
+        self.interval = interval
+        # Bytes of the file read so far
+        self.offset = loaded.size
+        self.truncated = False
+        # Start of a line whose newline has not been written yet, and the
+        # number of lines the corpus already holds from it
+        self._partial = self._read_tail()
+        self._partial_lines = len(self._decode(self._partial))
+        # Called without arguments, on the polling thread, after lines are added
+        self._subscribers = []
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def subscribe(self, callback):
+        """Call callback() whenever lines are added or the file is truncated."""
+        self._subscribers.append(callback)
+    
+    def unsubscribe(self, callback):
+        """Stop calling a callback passed to subscribe()."""
+        try:
+            self._subscribers.remove(callback)
+        except ValueError:
+            pass
+    
+    def _notify(self):
+        for callback in list(self._subscribers):
+            callback()
+    
+    def _decode(self, data):
+        return data.decode(self.encoding, errors='replace').splitlines()
+    
+    def _read_tail(self, block_size=65536):
+        """Return the loaded bytes after the last newline."""
+        tail = b''
+        try:
+            with open(self.loaded.filename, 'rb') as f:
+                end = self.offset
+                while end > 0:
+                    start = max(0, end - block_size)
+                    f.seek(start)
+                    block = f.read(end - start)
+                    newline = block.rfind(b'\n')
+                    if newline != -1:
+                        return block[newline + 1:] + tail
+                    tail = block + tail
+                    end = start
+        except OSError:
+            # Being rotated; the first poll sees whether it shrank
+            pass
+        return tail
+    
+    def poll(self):
+        """Read the bytes appended since the last poll and return the number of lines added."""
+        if self.truncated:
+            return 0
+        try:
+            size = os.stat(self.loaded.filename).st_size
+        except OSError:
+            # Being rotated; look again on the next poll
+            return 0
+        if size < self.offset:
+            self.truncated = True
+            self._stop.set()
+            self._notify()
+            return 0
+        if size == self.offset:
+            return 0
+        
+        with open(self.loaded.filename, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+        self.offset += len(data)
+        data = self._partial + data
+        end = data.rfind(b'\n') + 1
+        self._partial = data[end:]
+        if not end:
+            return 0
+        
+        lines = self._decode(data[:end])
+        # Lines split off the partial line at load time are in the corpus
+        # already; the last of them is replaced by its completed text
+        replace_last = self._partial_lines > 0
+        if replace_last:
+            lines = lines[self._partial_lines - 1:]
+            self._partial_lines = 0
+        self.loaded.append_lines(lines, replace_last)
+        self._notify()
+        return len(lines) - replace_last
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Error following {self.loaded.filename}: {e}", file=sys.stderr)
+    
+    def start(self):
+        """Poll the file in a daemon thread every interval seconds."""
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """Stop polling."""
+        self._stop.set()
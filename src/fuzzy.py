@@ -0,0 +1,232 @@
+"""
+Fuzzy (subsequence) matching with fzf-style scoring (platform-independent).
+
+A line matches a fuzzy pattern when the pattern's characters appear in it
+in order, not necessarily next to each other.  Matches are scored higher
+for consecutive characters and for characters at word boundaries, and
+lower for gaps, and only the best few are ranked with a bounded heap.
+Once the heap is full, a line is only scored if a cheap upper bound of its
+score beats the worst match kept.
+
+Each line has a 64-bit mask of the characters it contains (by code point
+modulo 64), so most lines are rejected by a single AND before any
+matching runs.
+"""
+import heapq
+import re
+import sys
+import threading
+from array import array
+from functools import reduce
+from itertools import compress, count, islice
+from operator import or_
+
+from corpus import CHUNK_LINES
+
+
+SCORE_MATCH = 16
+# Match at the start of the line or right after a separator
+BONUS_BOUNDARY = 8
+# Match right after the previous matched character
+BONUS_CONSECUTIVE = 4
+# Gap between matched characters: first skipped character, then each further one
+PENALTY_GAP_START = 3
+PENALTY_GAP_EXTENSION = 1
+SEPARATORS = frozenset(' \t/\\_-.:,;|()[]{}<>"\'')
+
+
+class _CharBits(dict):
+    """Character -> mask bit, filled in on first use."""
+    
+    def __missing__(self, char):
+        bit = self[char] = 1 << (ord(char) & 63)
+        return bit
+
+
+_BITS = _CharBits()
+
+
+def char_mask(text):
+    """Return the mask of the characters in text."""
+    return reduce(or_, map(_BITS.__getitem__, set(text)), 0)
+
+
+class CharMasks:
+    """Per-line character masks of a corpus, built in the background and shared by its filters."""
+    
+    # Lines masked between checks for cancellation
+    BATCH_LINES = 4096
+    
+    def __init__(self, corpus):
+        self._corpus = corpus
+        self._masks = array('Q')
+        # Lines [0, masked_lines) have masks; later lines are not yet masked
+        self.masked_lines = 0
+        self.complete = False
+        # Held while a batch is built, so update_line() never runs mid-batch
+        self._batch_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+        self._thread = None
+    
+    def build(self):
+        """Mask every remaining line of the corpus."""
+        masks = self._masks
+        fold = self._corpus.fold
+        lines = self._corpus.lines
+        index = self.masked_lines
+        while not self._stop.is_set() and self._corpus.has_line(index):
+            stop = index + self.BATCH_LINES
+            with self._batch_lock:
+                while index < stop and self._corpus.has_line(index):
+                    line = lines[index]
+                    masks.append(char_mask(fold(line) if fold else line))
+                    index += 1
+                # Publish the batch only after all its masks are appended
+                self.masked_lines = index
+        if not self._corpus.has_line(index):
+            self.complete = True
+    
+    def start(self):
+        """Build the masks in a daemon thread, unless already started."""
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.build, daemon=True)
+                self._thread.start()
+    
+    def stop(self):
+        """Stop a background build after the current batch."""
+        self._stop.set()
+    
+    def wait(self):
+        """Block until a background build has finished."""
+        if self._thread is not None:
+            self._thread.join()
+    
+    def update(self):
+        """Mask lines appended to the corpus after the build completed."""
+        if self.complete:
+            self.complete = False
+            self.build()
+    
+    def update_line(self, index):
+        """Mask the new text of a line after the corpus replaced it."""
+        with self._batch_lock:
+            if index < self.masked_lines:
+                fold = self._corpus.fold
+                line = self._corpus.lines[index]
+                self._masks[index] = char_mask(fold(line) if fold else line)
+    
+    def candidates(self, search_pattern, candidates=None):
+        """Return indices of lines that may contain every character of search_pattern.
+        
+        candidates limits the check to those line indices.  Lines not yet
+        masked are always included.
+        """
+        masked = self.masked_lines
+        masks = self._masks
+        wanted = char_mask(search_pattern)
+        if candidates is not None:
+            return [i for i in candidates if i >= masked or masks[i] & wanted == wanted]
+        
+        result = list(compress(count(), map(wanted.__eq__, map(wanted.__and__, islice(masks, masked)))))
+        if not self.complete or self._corpus.has_line(masked):
+            result.extend(range(masked, len(self._corpus)))
+        return result
+    
+    def memory_usage(self):
+        """Return approximate bytes held by the masks."""
+        return {'mask_bytes': sys.getsizeof(self._masks), 'masked_lines': self.masked_lines}
+
+
+def is_subsequence(needle, text):
+    """Return True if the characters of needle appear in text in order."""
+    it = iter(text)
+    return all(char in it for char in needle)
+
+
+def compile_pattern(search_pattern):
+    """Return a regex finding the first in-order occurrence of each character."""
+    parts = [re.escape(search_pattern[0])]
+    for char in search_pattern[1:]:
+        char = re.escape(char)
+        parts.append(f'[^{char}]*{char}')
+    return re.compile(''.join(parts))
+
+
+def score_match(search_pattern, text, end):
+    """Score the tightest match of search_pattern in text ending at index end.
+    
+    Characters continuing a run of consecutive matches share the boundary
+    bonus of its first one, so "main" scores higher in "main.py" than in
+    "m_a_i_n".
+    """
+    score = SCORE_MATCH * len(search_pattern)
+    # Walk back from the last character so the match starts as late as possible
+    pos = end
+    run = 0
+    for char in search_pattern[-2::-1]:
+        prev = text.rfind(char, 0, pos)
+        if prev == pos - 1:
+            run += 1
+        else:
+            # A run starts at pos, after a gap
+            bonus = BONUS_BOUNDARY if pos == 0 or text[pos - 1] in SEPARATORS else 0
+            score += bonus + run * (bonus or BONUS_CONSECUTIVE)
+            score -= PENALTY_GAP_START + (pos - prev - 2) * PENALTY_GAP_EXTENSION
+            run = 0
+        pos = prev
+    bonus = BONUS_BOUNDARY if pos == 0 or text[pos - 1] in SEPARATORS else 0
+    return score + bonus + run * (bonus or BONUS_CONSECUTIVE)
+
+
+def best_possible(search_pattern, text, end):
+    """Return an upper bound of score_match(search_pattern, text, end), in one rfind.
+    
+    Every character may earn the boundary bonus, but the match cannot start
+    after the last occurrence of the first character that leaves room for
+    the rest, which bounds its gaps from below.
+    """
+    length = len(search_pattern)
+    start = text.rfind(search_pattern[0], 0, end - length + 2)
+    gaps = end - start + 1 - length
+    return (SCORE_MATCH + BONUS_BOUNDARY) * length - gaps - (2 if gaps else 0)
+
+
+def fuzzy_search(corpus, masks, search_pattern, candidates=None, cancelled=None, limit=None):
+    """Return (indices, best) for the lines matching an already-folded pattern.
+    
+    indices lists every matching line in file order, and best the limit
+    best of them (all if limit is None), best first with ties in file
+    order.  Once limit matches are scored, a line is only scored if
+    best_possible() says it could beat the worst of them.
+    
+    cancelled is polled between chunks, as in update_filter(); None is
+    returned when it reports True.
+    """
+    masks.start()
+    candidates = masks.candidates(search_pattern, candidates)
+    if limit is None:
+        limit = len(candidates)
+    search = compile_pattern(search_pattern).search
+    lines = corpus.search_lines
+    # No line scores higher than a run of boundary matches
+    top_score = (SCORE_MATCH + BONUS_BOUNDARY) * len(search_pattern)
+    indices = array('I')
+    # (score, -index) of the best matches so far; heap[0] is the worst
+    heap = []
+    for start in range(0, len(candidates), CHUNK_LINES):
+        if cancelled is not None and cancelled():
+            return None
+        for i in candidates[start:start + CHUNK_LINES]:
+            text = lines[i]
+            match = search(text)
+            if not match:
+                continue
+            indices.append(i)
+            end = match.end() - 1
+            if len(heap) < limit:
+                heapq.heappush(heap, (score_match(search_pattern, text, end), -i))
+            elif heap and heap[0][0] < top_score and best_possible(search_pattern, text, end) > heap[0][0]:
+                heapq.heappushpop(heap, (score_match(search_pattern, text, end), -i))
+    return indices, [-i for _, i in sorted(heap, reverse=True)]
@@ -0,0 +1,222 @@
+"""
+Persistent on-disk cache of prebuilt corpus artifacts (platform-independent).
+
+Artifacts (line offsets, the case-folded corpus, trigram posting lists) are
+stored one per file in a compact binary format: a fixed header recording the
+source file's size, mtime and a content hash, followed by the raw payload.
+They are opened with mmap, so loading costs a header check instead of a
+rebuild.  Writers go through a temporary file and an atomic rename, so
+concurrent servers never see a partial artifact, and the directory is kept
+under a size limit by evicting the least recently used artifacts.
+"""
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+from itertools import accumulate
+
+
+MAGIC = b'ISFC'
+VERSION = 1
+# magic, version, reserved, source size, source mtime_ns, content hash, payload length
+HEADER = struct.Struct('<4sHHQQ16sQ')
+# Bytes hashed at the start, middle and end of the source file
+SAMPLE_BYTES = 1 << 16
+
+# Trigram table record: UTF-8 trigram padded with NULs, postings offset, postings length
+TRIGRAM_RECORD = struct.Struct('<12sQI')
+
+CachedArtifact = namedtuple('CachedArtifact', ['data', 'start', 'view'])
+CachedArtifact.__doc__ = """Mapped artifact: payload is data[start:], also exposed as a memoryview."""
+
+
+def file_fingerprint(filename):
+    """Return (size, mtime_ns, content_hash) identifying a file's contents.
+    
+    The hash covers the size plus samples from the start, middle and end of
+    the file, which catches in-place edits that keep size and mtime without
+    reading a multi-GB file on every init.
+    """
+    st = os.stat(filename)
+    digest = hashlib.blake2b(str(st.st_size).encode(), digest_size=16)
+    with open(filename, 'rb') as f:
+        middle = max(0, st.st_size // 2 - SAMPLE_BYTES // 2)
+        end = max(0, st.st_size - SAMPLE_BYTES)
+        for pos in sorted({0, middle, end}):
+            f.seek(pos)
+            digest.update(f.read(SAMPLE_BYTES))
+    return st.st_size, st.st_mtime_ns, digest.digest()
+
+
+class IndexCache:
+    """Directory of cached artifacts keyed by source path and artifact kind."""
+    
+    SUFFIX = '.isfc'
+    
+    def __init__(self, directory, max_bytes=1 << 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+    
+    def _path(self, filename, kind):
+        key = hashlib.blake2b(os.path.abspath(filename).encode('utf-8'), digest_size=16).hexdigest()
+        return os.path.join(self.directory, f"{key}.{kind}{self.SUFFIX}")
+    
+    def load(self, filename, kind, fingerprint):
+        """Return the mapped artifact if it matches fingerprint, else None."""
+        path = self._path(filename, kind)
+        try:
+            with open(path, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        
+        if len(data) < HEADER.size:
+            data.close()
+            return None
+        magic, version, _, size, mtime_ns, content_hash, length = HEADER.unpack_from(data)
+        if (magic, version) != (MAGIC, VERSION) or (size, mtime_ns, content_hash) != fingerprint \
+                or HEADER.size + length != len(data):
+            data.close()
+            return None
+        
+        try:
+            # Touch the artifact so eviction sees it as recently used
+            os.utime(path)
+        except OSError:
+            pass
+        return CachedArtifact(data, HEADER.size, memoryview(data)[HEADER.size:])
+    
+    def store(self, filename, kind, fingerprint, parts):
+        """Write an artifact built from the byte strings in parts."""
+        parts = [memoryview(part).cast('B') for part in parts]
+        length = sum(part.nbytes for part in parts)
+        size, mtime_ns, content_hash = fingerprint
+        path = self._path(filename, kind)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, VERSION, 0, size, mtime_ns, content_hash, length))
+                for part in parts:
+                    f.write(part)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            # Another server may hold the old artifact open (Windows)
+            print(f"Error writing cache file {path}: {e}", file=sys.stderr)
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return False
+        self.evict()
+        return True
+    
+    def evict(self):
+        """Remove least recently used artifacts until the cache fits max_bytes."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(self.SUFFIX):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+
+def offsets_parts(offsets):
+    """Serialize an array('Q') of line offsets."""
+    return [offsets]
+
+
+def load_offsets(artifact):
+    """Return the line offsets stored in an artifact."""
+    return artifact.view.cast('Q')
+
+
+def folded_parts(lines, fold):
+    """Serialize lines as case-folded UTF-8 text followed by its line offsets."""
+    encoded = [fold(line).encode('utf-8') for line in lines]
+    offsets = array('Q', [0])
+    offsets.extend(accumulate(len(line) + 1 for line in encoded))
+    text = b'\n'.join(encoded)
+    padding = b'\0' * (-len(text) % 8)
+    return [struct.pack('<Q', len(text)), text, padding, offsets]
+
+
+def load_folded(artifact):
+    """Return (data, start, length, offsets) of a folded-text artifact.
+    
+    The folded text is data[start:start + length]; offsets are relative to start.
+    """
+    (length,) = struct.unpack_from('<Q', artifact.view)
+    offsets_at = 8 + length + (-length % 8)
+    return artifact.data, artifact.start + 8, length, artifact.view[offsets_at:].cast('Q')
+
+
+class _TrigramKeys:
+    """Sequence of the sorted trigram keys in a mapped table, for bisect."""
+    
+    def __init__(self, view, count):
+        self._view = view
+        self._count = count
+    
+    def __len__(self):
+        return self._count
+    
+    def __getitem__(self, i):
+        return TRIGRAM_RECORD.unpack_from(self._view, 4 + i * TRIGRAM_RECORD.size)[0]
+
+
+class CachedPostings:
+    """Read-only trigram -> posting list mapping backed by a mapped artifact."""
+    
+    def __init__(self, artifact):
+        view = artifact.view
+        (count,) = struct.unpack_from('<I', view)
+        self._view = view
+        self._count = count
+        self._keys = _TrigramKeys(view, count)
+        self._postings_at = 4 + count * TRIGRAM_RECORD.size
+        self.nbytes = view.nbytes
+    
+    def __len__(self):
+        return self._count
+    
+    def get(self, trigram, default=None):
+        key = trigram.encode('utf-8').ljust(12, b'\0')
+        i = bisect_left(self._keys, key)
+        if i == self._count:
+            return default
+        found, offset, length = TRIGRAM_RECORD.unpack_from(self._view, 4 + i * TRIGRAM_RECORD.size)
+        if found != key:
+            return default
+        start = self._postings_at + offset
+        return self._view[start:start + length * 4].cast('I')
+
+
+def postings_parts(postings):
+    """Serialize a trigram -> array('I') mapping as a sorted key table plus postings."""
+    keys = sorted((trigram.encode('utf-8').ljust(12, b'\0'), trigram) for trigram in postings)
+    table = bytearray(struct.pack('<I', len(keys)))
+    blobs = []
+    offset = 0
+    for key, trigram in keys:
+        posting = postings[trigram]
+        table += TRIGRAM_RECORD.pack(key, offset, len(posting))
+        blobs.append(posting)
+        offset += len(posting) * 4
+    return [table] + blobs
@@ -0,0 +1,95 @@
+"""
+Low-overhead request instrumentation (platform-independent).
+
+Metrics collects named counters and timing histograms.  Recording a
+timing appends to a bounded window of recent samples, so it costs about a
+microsecond; percentiles are only computed when a snapshot is taken, e.g.
+for the server's "stats" message.
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+# Recent samples per histogram used for its percentiles
+WINDOW = 1024
+
+
+class Histogram:
+    """Durations with all-time totals and percentiles over the most recent window."""
+    
+    def __init__(self, window=WINDOW):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._recent = deque(maxlen=window)
+    
+    def record(self, seconds):
+        """Add one duration."""
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self._recent.append(seconds)
+    
+    def snapshot(self):
+        """Return counts and millisecond statistics."""
+        recent = sorted(self._recent)
+        
+        def percentile(percent):
+            if not recent:
+                return 0.0
+            return round(recent[min(len(recent) - 1, int(percent / 100 * len(recent)))] * 1000, 3)
+        
+        return {
+            'count': self.count,
+            'total_ms': round(self.total * 1000, 3),
+            'mean_ms': round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            'p50_ms': percentile(50),
+            'p90_ms': percentile(90),
+            'p99_ms': percentile(99),
+            'max_ms': round(self.max * 1000, 3),
+        }
+
+
+class Metrics:
+    """Named counters and timing histograms, safe to update from any thread."""
+    
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self.started = time.monotonic()
+        self._counters = {}
+        self._timings = {}
+        self._lock = threading.Lock()
+    
+    def count(self, name, n=1):
+        """Add n to a counter."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+    
+    def record(self, name, seconds):
+        """Add a duration to a timing histogram."""
+        with self._lock:
+            histogram = self._timings.get(name)
+            if histogram is None:
+                histogram = self._timings[name] = Histogram(self.window)
+            histogram.record(seconds)
+    
+    @contextmanager
+    def span(self, name):
+        """Time the body of a with statement."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+    
+    def snapshot(self):
+        """Return uptime, counters and timing statistics."""
+        with self._lock:
+            return {
+                'uptime_s': round(time.monotonic() - self.started, 3),
+                'counters': dict(self._counters),
+                'timings': {name: histogram.snapshot() for name, histogram in self._timings.items()},
+            }
@@ -0,0 +1,191 @@
+"""
+Corpora combined from many files (platform-independent).
+
+A FileSet names the files of a multi-file init: an explicit list, or a
+directory walked with include and exclude globs.  read_files() reads and
+decodes them on a thread pool, so the time spent waiting for the disk
+overlaps, and concatenates their lines into one list.  read_files_joined()
+decodes and splits them in worker processes instead, which do not contend
+for the GIL, and concatenates them into one buffer.  A FileTable maps each
+line back to the file it came from.
+"""
+import os
+from array import array
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatchcase
+from itertools import accumulate, islice
+
+
+# Never searched in directory walks
+DEFAULT_EXCLUDE = ['.git', '.hg', '.svn', '__pycache__', 'node_modules']
+
+# Files with a NUL byte in their first bytes are taken to be binary
+BINARY_SNIFF = 8192
+
+
+def _matches(path, patterns):
+    """True if the relative path, or its last component, matches one of the globs."""
+    name = path.rsplit('/', 1)[-1]
+    return any(fnmatchcase(path, pattern) or fnmatchcase(name, pattern) for pattern in patterns)
+
+
+class FileSet:
+    """Files searched together as one corpus: a list of files or a directory walk."""
+    
+    def __init__(self, files=None, directory=None, include=None, exclude=None):
+        if (files is None) == (directory is None):
+            raise ValueError("Give either files or a directory")
+        if files is not None and not isinstance(files, list):
+            raise TypeError("files must be a list of filenames")
+        self.files = [os.path.abspath(name) for name in files] if files is not None else None
+        self.directory = os.path.abspath(directory) if directory is not None else None
+        # Globs matched against paths relative to directory, with "/" separators
+        self.include = list(include) if include else ['*']
+        self.exclude = DEFAULT_EXCLUDE + list(exclude or [])
+        self._filenames = None
+    
+    def __str__(self):
+        return self.key
+    
+    @property
+    def key(self):
+        """Name of the set, unique for its files and rules."""
+        if self.files is not None:
+            return ' + '.join(self.files)
+        return f"{self.directory}{os.sep} include {self.include} exclude {self.exclude}"
+    
+    def expand(self):
+        """Return the matching filenames in a stable order; a walk is only done once."""
+        if self._filenames is None:
+            self._filenames = self.files if self.files is not None else self._walk()
+        return self._filenames
+    
+    def _walk(self):
+        filenames = []
+        for root, dirs, files in os.walk(self.directory):
+            relative_root = os.path.relpath(root, self.directory).replace(os.sep, '/')
+            prefix = '' if relative_root == '.' else relative_root + '/'
+            # Pruned directories are not descended into
+            dirs[:] = sorted(d for d in dirs if not _matches(prefix + d, self.exclude))
+            for name in sorted(files):
+                path = prefix + name
+                if _matches(path, self.include) and not _matches(path, self.exclude):
+                    filenames.append(os.path.join(root, name))
+        return filenames
+    
+    def display_name(self, filename):
+        """Name reported for a file: relative to the directory, else absolute."""
+        if self.directory is None:
+            return filename
+        return os.path.relpath(filename, self.directory).replace(os.sep, '/')
+    
+    def stat_key(self):
+        """Return the size and mtime of every file, to notice changes since loading."""
+        key = []
+        for filename in self.expand():
+            try:
+                st = os.stat(filename)
+            except OSError:
+                continue
+            key.append((filename, st.st_size, st.st_mtime_ns))
+        return tuple(key)
+
+
+class FileTable:
+    """Maps line numbers of a combined corpus to their source files."""
+    
+    def __init__(self, names, starts, skipped=()):
+        self.names = names
+        # First corpus line of each file, ascending
+        self.starts = starts
+        # Files left out as binary or unreadable
+        self.skipped = list(skipped)
+    
+    def __len__(self):
+        return len(self.names)
+    
+    def locate(self, index):
+        """Return (file name, 1-based line number in that file) of corpus line index."""
+        file_id = bisect_right(self.starts, index) - 1
+        return self.names[file_id], index - self.starts[file_id] + 1
+    
+    def name_of(self, index):
+        """Return the name of the file corpus line index came from."""
+        return self.names[bisect_right(self.starts, index) - 1]
+
+
+def _read_lines(filename, encoding):
+    """Return the lines of a text file, or None if it is binary or unreadable."""
+    try:
+        with open(filename, 'rb') as f:
+            data = f.read()
+        if b'\0' in data[:BINARY_SNIFF]:
+            return None
+        return data.decode(encoding).splitlines()
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+def read_files(file_set, encoding='utf-8', workers=None):
+    """Read the files of file_set in parallel.
+    
+    Returns (lines, FileTable, skipped filenames); binary files and files
+    that cannot be read or decoded are skipped.
+    """
+    filenames = file_set.expand()
+    with ThreadPoolExecutor(workers) as executor:
+        contents = list(executor.map(_read_lines, filenames, [encoding] * len(filenames)))
+    
+    lines = []
+    names = []
+    starts = array('I')
+    skipped = []
+    for filename, file_lines in zip(filenames, contents):
+        if file_lines is None:
+            skipped.append(file_set.display_name(filename))
+            continue
+        names.append(file_set.display_name(filename))
+        starts.append(len(lines))
+        lines.extend(file_lines)
+    return lines, FileTable(names, starts, skipped), skipped
+
+
+def _read_joined(task):
+    """Worker: return a text file as its newline-joined lines and their offsets, or None."""
+    filename, encoding = task
+    lines = _read_lines(filename, encoding)
+    if lines is None:
+        return None
+    offsets = array('Q', [0])
+    offsets.extend(accumulate(len(line) + 1 for line in lines))
+    return '\n'.join(lines), offsets
+
+
+def read_files_joined(file_set, pool, encoding='utf-8'):
+    """Read the files of file_set on a process pool (e.g. a ScanPool) into one buffer.
+    
+    The workers send back one string and an array per file rather than line
+    objects, which would cost more to unpickle than to split here.  Returns
+    (text, line offsets, FileTable, skipped filenames), as taken by
+    BufferCorpus.from_text().
+    """
+    filenames = file_set.expand()
+    texts = []
+    offsets = array('Q', [0])
+    names = []
+    starts = array('I')
+    skipped = []
+    results = pool.imap(_read_joined, [(filename, encoding) for filename in filenames])
+    for filename, result in zip(filenames, results):
+        if result is None:
+            skipped.append(file_set.display_name(filename))
+            continue
+        text, file_offsets = result
+        names.append(file_set.display_name(filename))
+        starts.append(len(offsets) - 1)
+        if len(file_offsets) > 1:
+            base = offsets[-1]
+            offsets.extend(map(base.__add__, islice(file_offsets, 1, None)))
+            texts.append(text)
+    return '\n'.join(texts), offsets, FileTable(names, starts, skipped), skipped
@@ -0,0 +1,275 @@
+"""
+Multi-core corpus scanning with a persistent process pool (platform-independent).
+
+The case-folded corpus is encoded once into a multiprocessing.shared_memory
+segment (UTF-8 text followed by an array of line offsets).  Workers attach
+to the segment by name, so a search only sends the pattern and a byte range
+to each worker; the corpus itself is never pickled.  Each search holds a
+token in shared memory, so the workers skip the chunks still queued for a
+search that was abandoned.
+"""
+import re
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate, chain
+from multiprocessing import get_context, shared_memory
+
+
+# Worker side: segments attached so far, most recently used last
+_attached = {}
+_MAX_ATTACHED = 4
+# Worker side: the pool's search tokens, see ScanPool.begin()
+_tokens = None
+
+# Searches per pool whose queued chunks can be skipped; more run to the end
+CANCEL_SLOTS = 64
+
+
+def _init_worker(tokens):
+    global _tokens
+    _tokens = tokens
+
+
+def _cancelled(slot, token):
+    """Return True if the search owning a task has ended, so the task can be skipped."""
+    return slot is not None and _tokens is not None and _tokens[slot] != token
+
+
+def _attach(name):
+    """Attach to a shared memory segment, reusing earlier attachments."""
+    shm = _attached.pop(name, None)
+    if shm is None:
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Before Python 3.13 attaching registers the segment with the
+            # resource tracker, which would unlink it when the worker exits
+            from multiprocessing import resource_tracker
+            register = resource_tracker.register
+            resource_tracker.register = lambda *args, **kwargs: None
+            try:
+                shm = shared_memory.SharedMemory(name=name)
+            finally:
+                resource_tracker.register = register
+        while len(_attached) >= _MAX_ATTACHED:
+            _attached.pop(next(iter(_attached))).close()
+    _attached[name] = shm
+    return shm
+
+
+def _views(name, offsets_at, count):
+    buf = _attach(name).buf
+    return buf, buf[offsets_at:offsets_at + (count + 1) * 8].cast('Q')
+
+
+def _scan_range(task):
+    """Worker: return indices of lines in a byte range that contain needle."""
+    name, offsets_at, count, slot, token, start, stop, needle = task
+    if _cancelled(slot, token):
+        return []
+    buf, offsets = _views(name, offsets_at, count)
+    regex = re.compile(re.escape(needle))
+    hits = []
+    match = regex.search(buf, start, stop)
+    while match:
+        index = bisect_right(offsets, match.start()) - 1
+        hits.append(index)
+        # Continue from the start of the next line
+        match = regex.search(buf, offsets[index + 1], stop)
+    return hits
+
+
+def _scan_candidates(task):
+    """Worker: return the candidate line indices that contain needle."""
+    name, offsets_at, count, slot, token, candidates, needle = task
+    if _cancelled(slot, token):
+        return []
+    buf, offsets = _views(name, offsets_at, count)
+    search = re.compile(re.escape(needle)).search
+    indices = array('I')
+    indices.frombytes(candidates)
+    return [i for i in indices if search(buf, offsets[i], offsets[i + 1] - 1)]
+
+
+class ScanPool:
+    """Persistent pool of worker processes shared by all parallel corpora."""
+    
+    def __init__(self, workers=None):
+        context = get_context('spawn')
+        # Token of the search in each slot, 0 while the slot is free
+        self._tokens = context.RawArray('Q', CANCEL_SLOTS)
+        self._free_slots = list(range(CANCEL_SLOTS))
+        self._last_token = 0
+        self._slot_lock = threading.Lock()
+        # Spawned workers do not inherit the server's threads or open files
+        self._pool = context.Pool(workers, _init_worker, (self._tokens,))
+        self.workers = self._pool._processes
+    
+    def imap(self, func, tasks):
+        """Run tasks on the workers, yielding results in task order."""
+        return self._pool.imap(func, tasks)
+    
+    def begin(self):
+        """Return the (slot, token) a search passes with its tasks; see end()."""
+        with self._slot_lock:
+            if not self._free_slots:
+                return None, 0
+            slot = self._free_slots.pop()
+            self._last_token += 1
+            self._tokens[slot] = self._last_token
+            return slot, self._last_token
+    
+    def end(self, slot):
+        """Make the workers skip a search's queued tasks and free its slot."""
+        if slot is not None:
+            with self._slot_lock:
+                self._tokens[slot] = 0
+                self._free_slots.append(slot)
+    
+    def close(self):
+        """Stop the worker processes."""
+        self._pool.terminate()
+        self._pool.join()
+
+
+class ParallelCorpus:
+    """Corpus wrapper that runs large scans on a ScanPool.
+    
+    Scans over fewer than threshold lines (or candidates) use the wrapped
+    corpus directly, since dispatching to workers costs more than it saves.
+    """
+    
+    def __init__(self, corpus, pool, chunk_size=4 << 20, threshold=200000):
+        self._corpus = corpus
+        self._pool = pool
+        self.chunk_size = chunk_size
+        self.threshold = threshold
+        self.lines = corpus.lines
+        self.case_sensitive = corpus.case_sensitive
+        self.casefold = corpus.casefold
+        self.fold = corpus.fold
+        # Shared segment, built on the first parallel scan
+        self._shm_lock = threading.Lock()
+        self._shm = None
+        self._offsets_at = 0
+        self._count = 0
+        # Leading lines of the shared copy whose text is still current
+        self._current = 0
+        self._chunks = []
+    
+    def __len__(self):
+        return len(self._corpus)
+    
+    def line(self, index):
+        """Return the original text of a line."""
+        return self._corpus.line(index)
+    
+    def has_line(self, index):
+        """Return True if the corpus has a line at index."""
+        return self._corpus.has_line(index)
+    
+    @property
+    def search_lines(self):
+        """Lines of the wrapped corpus in comparison form."""
+        return self._corpus.search_lines
+    
+    def append_lines(self, lines):
+        """Add lines to the wrapped corpus; the shared copy keeps the old ones."""
+        self._corpus.append_lines(lines)
+    
+    def replace_last_line(self, line):
+        """Replace the last line of the wrapped corpus, leaving it out of the shared copy."""
+        self._corpus.replace_last_line(line)
+        with self._shm_lock:
+            if self._current == len(self._corpus):
+                self._current -= 1
+    
+    def _ensure_shared(self):
+        """Copy the folded corpus into shared memory and plan the chunks."""
+        with self._shm_lock:
+            if self._shm is None:
+                self._build_shared()
+    
+    def _build_shared(self):
+        fold = self.fold
+        encoded = [(fold(line) if fold else line).encode('utf-8') for line in self._corpus.lines]
+        offsets = array('Q', [0])
+        offsets.extend(accumulate(len(line) + 1 for line in encoded))
+        text = b'\n'.join(encoded)
+        del encoded
+        
+        # Offsets follow the text, aligned to 8 bytes
+        offsets_at = (len(text) + 7) & ~7
+        offsets_bytes = offsets.tobytes()
+        shm = shared_memory.SharedMemory(create=True, size=offsets_at + len(offsets_bytes))
+        shm.buf[:len(text)] = text
+        shm.buf[offsets_at:offsets_at + len(offsets_bytes)] = offsets_bytes
+        
+        # Chunk boundaries fall on line starts near multiples of chunk_size
+        chunks = []
+        start_line = 0
+        count = len(offsets) - 1
+        while start_line < count:
+            stop_line = bisect_left(offsets, offsets[start_line] + self.chunk_size, start_line + 1, count)
+            chunks.append((offsets[start_line], offsets[stop_line]))
+            start_line = stop_line
+        
+        self._shm = shm
+        self._offsets_at = offsets_at
+        self._count = self._current = count
+        self._chunks = chunks
+    
+    def search(self, search_pattern, candidates=None):
+        """Return indices of lines containing an already-folded pattern."""
+        return list(chain.from_iterable(self.search_chunks(search_pattern, candidates)))
+    
+    def search_chunks(self, search_pattern, candidates=None):
+        """Yield lists of matching line indices, one list per chunk scanned."""
+        size = len(self._corpus) if candidates is None else len(candidates)
+        if size < self.threshold or '\n' in search_pattern:
+            yield from self._corpus.search_chunks(search_pattern, candidates)
+            return
+        
+        self._ensure_shared()
+        needle = search_pattern.encode('utf-8')
+        count = self._current
+        slot, token = self._pool.begin()
+        header = (self._shm.name, self._offsets_at, self._count, slot, token)
+        try:
+            if candidates is None:
+                tasks = [header + (start, stop, needle) for start, stop in self._chunks]
+                for hits in self._pool.imap(_scan_range, tasks):
+                    # Drop a replaced last line, which the shared copy holds in its old form
+                    yield [i for i in hits if i < count] if hits and hits[-1] >= count else hits
+                # Lines appended after the shared copy was made
+                if self._corpus.has_line(count):
+                    yield from self._corpus.search_chunks(search_pattern, range(count, len(self._corpus)))
+                return
+            
+            # Candidates are in file order; those past the shared copy are scanned here
+            shared = bisect_left(candidates, count)
+            step = max(1, -(-shared // (self._pool.workers * 4)))
+            tasks = [header + (array('I', candidates[i:min(i + step, shared)]).tobytes(), needle)
+                     for i in range(0, shared, step)]
+            yield from self._pool.imap(_scan_candidates, tasks)
+            if shared < len(candidates):
+                yield from self._corpus.search_chunks(search_pattern, candidates[shared:])
+        finally:
+            # Runs when the caller stops iterating, e.g. on cancellation
+            self._pool.end(slot)
+    
+    def memory_usage(self):
+        """Return approximate bytes held by the corpus and its shared copy."""
+        usage = dict(self._corpus.memory_usage())
+        usage['shared_bytes'] = self._shm.size if self._shm is not None else 0
+        return usage
+    
+    def close(self):
+        """Release the shared segment and the wrapped corpus."""
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+        if hasattr(self._corpus, 'close'):
+            self._corpus.close()
@@ -0,0 +1,94 @@
+"""
+Sampling profiler that can be switched on in a running server (platform-independent).
+
+A daemon thread looks at the current frame of every other thread at a fixed
+interval and counts the functions it finds.  The overhead only depends on
+the interval, not on how much code runs, so it is cheap enough to turn on
+in production while a slow search is investigated.
+"""
+import os
+import sys
+import threading
+from collections import Counter
+
+
+# Seconds between samples
+INTERVAL = 0.005
+
+# Threads waiting in these modules are idle, not working
+_IDLE_FILES = {'threading.py', 'selectors.py', 'queue.py', 'thread.py', 'base_events.py'}
+
+
+def _describe(code):
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class SamplingProfiler:
+    """Counts where busy threads spend their time."""
+    
+    def __init__(self, interval=INTERVAL):
+        self.interval = interval
+        self.samples = 0
+        # Samples with the function on top of the stack / anywhere on it
+        self._self = Counter()
+        self._total = Counter()
+        # Guards the counts, which report() reads while the sampler adds to them
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+    
+    @property
+    def running(self):
+        """True while sampling."""
+        return self._thread is not None and self._thread.is_alive()
+    
+    def sample(self):
+        """Take one sample of every other thread."""
+        own = threading.get_ident()
+        tops = []
+        stacks = []
+        for ident, frame in sys._current_frames().items():
+            if ident == own or os.path.basename(frame.f_code.co_filename) in _IDLE_FILES:
+                continue
+            tops.append(frame.f_code)
+            # Count recursive functions once per sample
+            seen = set()
+            while frame is not None:
+                seen.add(frame.f_code)
+                frame = frame.f_back
+            stacks.append(seen)
+        with self._lock:
+            self.samples += len(tops)
+            self._self.update(tops)
+            for seen in stacks:
+                self._total.update(seen)
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+    
+    def start(self):
+        """Start sampling in a daemon thread."""
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """Stop sampling; the samples taken so far are kept."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+    
+    def report(self, limit=20):
+        """Return the functions seen most often, with their self and total sample counts."""
+        with self._lock:
+            samples = self.samples
+            top = self._total.most_common(limit)
+            self_counts = [self._self[code] for code, _ in top]
+        return {
+            'samples': samples,
+            'interval': self.interval,
+            'functions': [
+                {'function': _describe(code), 'self': count, 'total': total}
+                for (code, total), count in zip(top, self_counts)
+            ],
+        }
@@ -0,0 +1,126 @@
+"""
+Multi-term query language (platform-independent).
+
+A query is whitespace-separated terms, all of which must match a line:
+
+    foo         the line contains "foo"
+    ^src        the line starts with "src"
+    re:/\\d+ms/  the line matches the regular expression
+    !bar        the line does not match the term (also !^src, !re:/.../)
+
+Queries compile to a cached Query plan.  The plan scans the corpus only for
+its longest literal term, which can use the trigram index and earlier
+results, and checks the remaining terms on those lines, cheapest first.
+"""
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+from corpus import make_fold
+
+
+class QueryError(ValueError):
+    """Raised for a query that cannot be compiled."""
+
+
+# kind is 'substring', 'prefix' or 'regex'; literal text is folded
+Term = namedtuple('Term', ['kind', 'text', 'negated'])
+
+# Order in which the per-line checks run
+_KIND_COST = {'prefix': 0, 'substring': 1, 'regex': 2}
+
+
+def parse_term(token, fold):
+    """Parse one whitespace-free token into a Term."""
+    negated = token.startswith('!') and len(token) > 1
+    if negated:
+        token = token[1:]
+    if token.startswith('re:') and len(token) > 3:
+        source = token[3:]
+        if source.startswith('/'):
+            # The closing slash may still be missing while typing
+            source = source[1:-1] if len(source) > 1 and source.endswith('/') else source[1:]
+        return Term('regex', source, negated)
+    if token.startswith('^') and len(token) > 1:
+        token = token[1:]
+        kind = 'prefix'
+    else:
+        kind = 'substring'
+    return Term(kind, fold(token) if fold else token, negated)
+
+
+def implies(new, old):
+    """Return True if every line matching term new also matches term old."""
+    if new == old:
+        return True
+    if new.negated or old.negated or 'regex' in (new.kind, old.kind):
+        return False
+    if old.kind == 'prefix':
+        return new.kind == 'prefix' and new.text.startswith(old.text)
+    return old.text in new.text
+
+
+class Query:
+    """Compiled plan of a query."""
+    
+    def __init__(self, terms, case_sensitive=False):
+        self.terms = terms
+        # The longest literal term is the most selective one to scan for; a
+        # prefix term is scanned for as a substring and checked again per line
+        literal = [term for term in terms if term.kind != 'regex' and not term.negated]
+        self.driver = max(literal, key=lambda term: len(term.text)) if literal else None
+        
+        checks = sorted(
+            (term for term in terms if term is not self.driver or term.kind == 'prefix'),
+            key=lambda term: (_KIND_COST[term.kind], term.negated, -len(term.text)),
+        )
+        self._literal_checks = []
+        self._regex_checks = []
+        flags = 0 if case_sensitive else re.IGNORECASE
+        for term in checks:
+            if term.kind == 'regex':
+                try:
+                    search = re.compile(term.text, flags).search
+                except re.error as e:
+                    raise QueryError(f"Invalid regex {term.text!r}: {e}") from None
+                self._regex_checks.append((search, term.negated))
+            elif term.kind == 'prefix':
+                self._literal_checks.append((term.text, True, term.negated))
+            else:
+                self._literal_checks.append((term.text, False, term.negated))
+    
+    def narrows(self, other):
+        """Return True if every line matching this query also matches other."""
+        return all(any(implies(new, old) for new in self.terms) for old in other.terms)
+    
+    def select(self, corpus, indices):
+        """Return the indices whose lines pass every check but the driver scan."""
+        literal_checks = self._literal_checks
+        regex_checks = self._regex_checks
+        if not literal_checks and not regex_checks:
+            return list(indices)
+        
+        # Literal checks read the corpus's folded copy, regex checks the line
+        search_lines = corpus.search_lines
+        lines = corpus.lines
+        selected = []
+        for i in indices:
+            if literal_checks:
+                text = search_lines[i]
+                # Short-circuit on the first failing check
+                if not all(
+                    (text.startswith(needle) if prefix else needle in text) != negated
+                    for needle, prefix, negated in literal_checks
+                ):
+                    continue
+            if not regex_checks or all(bool(search(lines[i])) != negated for search, negated in regex_checks):
+                selected.append(i)
+        return selected
+
+
+@lru_cache(maxsize=256)
+def compile_query(pattern, case_sensitive=False, casefold=False):
+    """Parse pattern into a Query plan; plans are cached by pattern and fold mode."""
+    fold = make_fold(case_sensitive, casefold)
+    terms = tuple(parse_term(token, fold) for token in pattern.split())
+    return Query(terms, case_sensitive)
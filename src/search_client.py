@@ -0,0 +1,261 @@
+"""
+Non-blocking search client for interactive front ends (platform-independent).
+
+SearchClient keeps server round trips off the UI thread.  search() returns
+at once; a background thread sends the latest pattern once typing pauses
+for the debounce interval, and responses are passed to a callback.  Search
+responses are cached per pattern, so backspacing to a pattern seen before
+is answered locally.  After each search the client peeks at the pattern
+without its last character, the most likely next state, so that it is
+cached before the user gets there.
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from itertools import count
+
+
+# Seconds without a new pattern before a search is sent
+DEBOUNCE = 0.02
+# Search responses kept for local answers
+CACHE_SIZE = 256
+
+
+class SearchClient:
+    """Sends searches from background threads and caches their responses.
+    
+    on_result(response) gets the response for the current pattern, from
+    the thread that called search() when it was cached, else from the
+    reader thread.  on_notification(msg_obj) gets messages without an id,
+    e.g. updates of a followed file.  Callbacks must not wait for requests
+    of the same client.
+    """
+    
+    def __init__(self, connection, on_result=None, on_notification=None, encoding='utf-8',
+                 debounce=DEBOUNCE, cache_size=CACHE_SIZE, prefetch=True, fields=None):
+        self.connection = connection
+        self.on_result = on_result
+        self.on_notification = on_notification
+        self.encoding = encoding
+        self.debounce = debounce
+        self.cache_size = cache_size
+        # Extra fields of every search request, e.g. mode
+        self.fields = dict(fields or {})
+        # Peeks answer with the selected line only, not with a window
+        self.prefetch = prefetch and 'window' not in self.fields
+        self._cache = OrderedDict()
+        self._request_ids = count(1)
+        # Request id -> Future of its response, until the connection ends
+        self._pending = {}
+        self._connected = True
+        self._pending_lock = threading.Lock()
+        # Held while sending, and by init() until it is answered
+        self._send_lock = threading.RLock()
+        # Guards the pattern state below and wakes the sender thread
+        self._changed = threading.Condition()
+        # Latest pattern given to search(), when it was given, and the
+        # pattern of the last search sent to the server
+        self._pattern = None
+        self._changed_at = 0.0
+        self._sent_pattern = None
+        # Last response passed to on_result
+        self._delivered = None
+        # Patterns to peek at once no search is waiting
+        self._peeks = []
+        # Bumped by init(), so responses about the previous file are dropped
+        self._generation = 0
+        self._closed = False
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._sender = threading.Thread(target=self._send_searches, daemon=True)
+        self._reader.start()
+        self._sender.start()
+    
+    def _send(self, msg_obj):
+        """Send a request and return the Future of its response."""
+        future = Future()
+        with self._send_lock:
+            if self._closed:
+                raise ConnectionError("Client is closed")
+            request_id = next(self._request_ids)
+            with self._pending_lock:
+                if not self._connected:
+                    raise ConnectionError("Server closed the connection")
+                self._pending[request_id] = future
+            self.connection.send_message({**msg_obj, 'id': request_id}, self.encoding)
+        return future
+    
+    def _read(self):
+        try:
+            while True:
+                msg_obj = self.connection.recv_message(self.encoding)
+                if msg_obj is None:
+                    break
+                if 'framing' in msg_obj:
+                    # Later messages use the framing the init negotiated
+                    self.connection.framing = msg_obj['framing']
+                future = self._pending.pop(msg_obj.get('id'), None)
+                if future is not None:
+                    future.set_result(msg_obj)
+                    continue
+                if msg_obj.get('type') == 'update':
+                    # The file changed, so cached answers are stale
+                    self._clear_cache()
+                if self.on_notification is not None:
+                    self.on_notification(msg_obj)
+        except (OSError, ValueError):
+            pass
+        finally:
+            with self._pending_lock:
+                self._connected = False
+                pending, self._pending = self._pending, {}
+            for future in pending.values():
+                future.set_exception(ConnectionError("Server closed the connection"))
+    
+    def _clear_cache(self):
+        with self._changed:
+            self._cache.clear()
+            self._delivered = None
+    
+    def _store(self, pattern, response):
+        with self._changed:
+            self._cache[pattern] = response
+            self._cache.move_to_end(pattern)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+    
+    def _deliver(self, pattern, response):
+        """Pass response to on_result if pattern is still current and it is news."""
+        with self._changed:
+            if pattern != self._pattern or response == self._delivered:
+                return
+            self._delivered = response
+        if self.on_result is not None:
+            self.on_result(response)
+    
+    def init(self, filename, framing='binary', **fields):
+        """Load filename on the server and return the response; the cache is cleared."""
+        msg_obj = {'type': 'init', 'filename': filename, **fields}
+        if framing:
+            msg_obj['framing'] = framing
+        with self._send_lock:
+            with self._changed:
+                self._generation += 1
+                # A new file starts with an empty pattern
+                self._pattern = self._sent_pattern = ''
+                self._peeks = []
+            self._clear_cache()
+            # Nothing else is sent until the framing is settled
+            return self._send(msg_obj).result()
+    
+    def search(self, pattern):
+        """Search for pattern without waiting; the response goes to on_result.
+        
+        Repeating the current pattern, e.g. for a key that did not change the
+        text, does nothing.
+        """
+        with self._changed:
+            if pattern == self._pattern:
+                return
+            self._pattern = pattern
+            self._changed_at = time.monotonic()
+            self._changed.notify()
+            cached = self._cache.get(pattern)
+            if cached is not None:
+                self._cache.move_to_end(pattern)
+        if cached is not None:
+            self._deliver(pattern, cached)
+    
+    def send(self, msg_obj):
+        """Send any request after the pending search and return the Future of its response."""
+        with self._send_lock:
+            self._flush()
+            if msg_obj.get('type') == 'move':
+                # Searches keep the selection's position, so cached answers are stale
+                self._clear_cache()
+            return self._send(msg_obj)
+    
+    def request(self, msg_obj, timeout=None):
+        """Send any request after the pending search and return its response."""
+        return self.send(msg_obj).result(timeout)
+    
+    def _flush(self):
+        """Send the search for the latest pattern if it has not been sent; returns True if sent."""
+        with self._changed:
+            pattern = self._pattern
+            if pattern == self._sent_pattern:
+                return False
+            self._sent_pattern = pattern
+            generation = self._generation
+        future = self._send({**self.fields, 'type': 'search', 'pattern': pattern})
+        future.add_done_callback(lambda f: self._search_done(pattern, generation, f))
+        return True
+    
+    def _search_done(self, pattern, generation, future):
+        if future.exception() is not None or generation != self._generation:
+            return
+        response = future.result()
+        del response['id']
+        if response.get('status') == 'superseded':
+            return
+        if response.get('status') == 'ok':
+            self._store(pattern, response)
+            if self.prefetch and pattern:
+                with self._changed:
+                    self._peeks.append(pattern[:-1])
+                    self._changed.notify()
+        self._deliver(pattern, response)
+    
+    def _peek(self):
+        """Send peeks for likely next patterns that are not cached yet."""
+        with self._changed:
+            patterns = [p for p in self._peeks if p not in self._cache]
+            self._peeks = []
+            generation = self._generation
+        for pattern in patterns:
+            request = {'type': 'peek', 'pattern': pattern}
+            if 'mode' in self.fields:
+                request['mode'] = self.fields['mode']
+            future = self._send(request)
+            future.add_done_callback(lambda f, p=pattern: self._peek_done(p, generation, f))
+    
+    def _peek_done(self, pattern, generation, future):
+        if future.exception() is not None or generation != self._generation:
+            return
+        response = future.result()
+        del response['id']
+        if response.get('status') == 'ok':
+            self._store(pattern, response)
+        elif response.get('status') == 'error':
+            # E.g. the server searches in a mode that cannot be peeked
+            self.prefetch = False
+    
+    def _send_searches(self):
+        while True:
+            with self._changed:
+                while True:
+                    if self._closed:
+                        return
+                    if self._pattern != self._sent_pattern:
+                        remaining = self._changed_at + self.debounce - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._changed.wait(remaining)
+                    elif self._peeks:
+                        break
+                    else:
+                        self._changed.wait()
+            try:
+                with self._send_lock:
+                    if not self._flush():
+                        self._peek()
+            except (ConnectionError, OSError):
+                return
+    
+    def close(self):
+        """Stop the background threads and close the connection."""
+        with self._changed:
+            self._closed = True
+            self._changed.notify()
+        self._sender.join()
+        self.connection.close()
@@ -1,51 +1,674 @@
 """
 Core incremental search filter logic (platform-independent).
 """
+import threading
+from array import array
+from collections.abc import Sequence
+
+from corpus import CHUNK_LINES, create_corpus
+from fuzzy import CharMasks, fuzzy_search, is_subsequence
+from query import compile_query
+
+
+# Ranked lines kept by a fuzzy search
+FUZZY_LIMIT = 1000
+# Lines per page returned by get_window() when no limit is given
+WINDOW_LIMIT = 50
+
+
+class SearchCancelled(Exception):
+    """Raised when a search is abandoned because a newer one superseded it."""
+
+
+class _BackgroundSearch:
+    """Finishes scanning the remaining chunks of a progressive search in a thread."""
+    
+    def __init__(self, search_pattern, indices, chunks, narrowed=()):
+        self.search_pattern = search_pattern
+        # Grows while the thread runs; appends are atomic, so readers may
+        # look at a prefix of the final result at any time.
+        self.indices = indices
+        self.complete = False
+        # Narrowing stack entries for shorter patterns that are complete
+        # once this search is, see IncrementalSearchFilter._take_over()
+        self.narrowed = list(narrowed)
+        self._chunks = chunks
+        self._cancelled = threading.Event()
+        self._detached = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+    
+    def _run(self):
+        for hits in self._chunks:
+            self.indices.extend(hits)
+            if self._cancelled.is_set():
+                if not self._detached:
+                    # Lets a parallel scan skip the chunks still queued
+                    self._chunks.close()
+                return
+        self.complete = True
+    
+    def cancel(self):
+        """Stop scanning after the current chunk."""
+        self._cancelled.set()
+    
+    def detach(self):
+        """Stop the thread after the current chunk and return the chunks it has not scanned."""
+        self._detached = True
+        self._cancelled.set()
+        self._thread.join()
+        return self._chunks
+    
+    def wait(self):
+        """Block until the scan has finished."""
+        self._thread.join()
+
+
+def _extend_sorted(indices, hits):
+    """Append the hits past the last index, which a racing scan may have found already."""
+    last = indices[-1] if indices else -1
+    indices.extend(i for i in hits if i > last)
+
+
+class MatchedLines(Sequence):
+    """Read-only list-like view of the lines at a sequence of indices."""
+    
+    def __init__(self, corpus, indices):
+        self._corpus = corpus
+        self._indices = indices
+    
+    def __len__(self):
+        return len(self._indices)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._corpus.line(i) for i in self._indices[index]]
+        return self._corpus.line(self._indices[index])
+    
+    def __eq__(self, other):
+        if isinstance(other, (MatchedLines, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+    
+    def __repr__(self):
+        return f'MatchedLines({list(self)!r})'
 
 
 class IncrementalSearchFilter:
     """Manages the incremental search filtering logic."""
     
-    def __init__(self, lines, case_sensitive=False):
-        self.original_lines = lines
-        self.filtered_lines = lines[:]
+    def __init__(self, lines=None, case_sensitive=False, casefold=False, backend='list',
+                 corpus=None, index=None, masks=None, metrics=None, files=None):
+        # casefold: full Unicode case folding (e.g. "ß" matches "ss") instead of lower()
+        # backend: corpus storage, 'list' of lines or one joined 'buffer'
+        # corpus: an already built corpus (e.g. MmapCorpus); lines is then ignored
+        # index: optional TrigramIndex over the corpus to narrow full scans
+        # masks: CharMasks shared with other filters, else built on first fuzzy search
+        # metrics: optional metrics.Metrics counting scans and narrowing cache hits
+        # files: FileTable of a corpus combined from several files; results then
+        #        name the file of each line
+        if corpus is None:
+            corpus = create_corpus(lines, backend, case_sensitive, casefold)
+        self.corpus = corpus
+        self.index = index
+        self.masks = masks
+        self.metrics = metrics
+        self.files = files
+        self.original_lines = self.corpus.lines
+        # array('I') of matched line indices, or None for every line in file order
+        self.matches = None
         self.selected_index = 0
-        self.case_sensitive = case_sensitive
+        self.case_sensitive = corpus.case_sensitive
+        self.casefold = corpus.casefold
         self.current_pattern = ""
+        # Stack of (search_pattern, matched_indices); each pattern contains
+        # the one below it, so its matches are a subset of the previous set.
+        self._narrowing_stack = []
+        # Like _narrowing_stack for fuzzy patterns, each a subsequence of the next
+        self._fuzzy_stack = []
+        # Like _narrowing_stack for (Query, matched_indices), each query narrowing the one below
+        self._query_stack = []
+        # Total fuzzy matches, of which only the best are in matches
+        self._match_count = None
+        # Limit of the ranked fuzzy results shown, None for results in file order
+        self._fuzzy_limit = None
+        # Corpus lines covered by the results when following a growing file
+        self._line_count = None
+        # Text of the last of those lines, to notice when it is completed
+        self._last_line = None
+        # Progressive search still scanning in the background
+        self._pending = None
     
-    def update_filter(self, pattern):
-        """Update the filter pattern and return the currently selected line."""
-        self.current_pattern = pattern
+    def update_filter(self, pattern, cancelled=None):
+        """Update the filter pattern and return the currently selected line.
         
+        cancelled is an optional callable polled between chunks of the scan;
+        when it returns True the search stops with SearchCancelled and the
+        previous results, including a running progressive search, are kept.
+        """
         if not pattern:
-            self.filtered_lines = self.original_lines[:]
+            self._cancel_pending()
+            self._narrowing_stack = []
+            self._fuzzy_stack = []
+            self._query_stack = []
+            self._match_count = None
+            self._fuzzy_limit = None
+            self.matches = None
             self.selected_index = 0
         else:
             # Perform incremental search
-            self.filtered_lines = []
-            search_pattern = pattern if self.case_sensitive else pattern.lower()
-            
-            for line in self.original_lines:
-                search_line = line if self.case_sensitive else line.lower()
-                if search_pattern in search_line:
-                    self.filtered_lines.append(line)
-            
-            # Reset selection if out of bounds
-            if self.selected_index >= len(self.filtered_lines):
-                self.selected_index = 0
+            fold = self.corpus.fold
+            search_pattern = fold(pattern) if fold else pattern
+            indices = self._narrow(search_pattern, cancelled)
+            # Only a search that finished replaces a running progressive one
+            self._cancel_pending()
+            self._set_results(indices)
+        self.current_pattern = pattern
+        
+        return self.get_selected_line()
+    
+    def update_filter_progressive(self, pattern, cancelled=None):
+        """Update the filter pattern, returning as soon as the selected line is known.
+        
+        The rest of the corpus is scanned in a background thread, which a later
+        update cancels.  Use get_results() for the count found so far.
+        """
+        if not pattern:
+            return self.update_filter(pattern)
+        fold = self.corpus.fold
+        search_pattern = fold(pattern) if fold else pattern
+        job = self._pending
+        if job is not None and job.search_pattern == search_pattern and not job.complete:
+            self.current_pattern = pattern
+            return self.get_selected_line()
+        taken = self._take_over(search_pattern)
+        if taken is not None:
+            chunks, narrowed, restore = taken
+            depth = len(self._narrowing_stack)
+        else:
+            cached, candidates, depth = self._narrowing_base(search_pattern)
+            if cached is not None:
+                self._cancel_pending()
+                del self._narrowing_stack[depth:]
+                self._set_results(cached)
+                self.current_pattern = pattern
+                return self.get_selected_line()
+            self._note_scan(candidates)
+            chunks = self.corpus.search_chunks(search_pattern, candidates)
+            narrowed = []
+            restore = None
+        
+        indices = array('I')
+        try:
+            for hits in chunks:
+                if cancelled is not None and cancelled():
+                    raise SearchCancelled(pattern)
+                indices.extend(hits)
+                if len(indices) > self.selected_index:
+                    break
+            else:
+                self._cancel_pending()
+                # Scan finished before the selected line was known
+                self.current_pattern = pattern
+                del self._narrowing_stack[depth:]
+                self._narrowing_stack.extend(narrowed)
+                self._narrowing_stack.append((search_pattern, indices))
+                self._set_results(indices)
+                return self.get_selected_line()
+        except SearchCancelled:
+            if restore is not None:
+                # The search taken over keeps scanning for the results shown
+                self._pending = restore()
+            raise
+        
+        self._cancel_pending()
+        del self._narrowing_stack[depth:]
+        self.current_pattern = pattern
+        self._pending = _BackgroundSearch(search_pattern, indices, chunks, narrowed)
+        # The background scan only appends, so the selected line stays put
+        self.matches = indices
+        self._match_count = None
+        self._fuzzy_limit = None
+        return self.get_selected_line()
+    
+    def update_filter_fuzzy(self, pattern, cancelled=None, limit=FUZZY_LIMIT):
+        """Update the filter to the best fuzzy (subsequence) matches of pattern.
+        
+        matches holds at most limit matches, best first; get_results()
+        still counts every match.
+        """
+        if not pattern:
+            return self.update_filter(pattern)
+        fold = self.corpus.fold
+        search_pattern = fold(pattern) if fold else pattern
+        
+        # Lines matching a longer pattern also match its subsequences; the
+        # others are dropped once the search can no longer be cancelled.
+        # Entries are (search_pattern, indices, best, limit); best is None
+        # once refresh() has added matches that were never ranked.
+        stack = self._fuzzy_stack
+        depth = len(stack)
+        while depth and not is_subsequence(stack[depth - 1][0], search_pattern):
+            depth -= 1
+        candidates = stack[depth - 1][1] if depth else None
+        best = None
+        if depth and stack[depth - 1][0] == search_pattern:
+            _, indices, best, ranked = stack[depth - 1]
+            if best is None or ranked != limit:
+                # Ranking the same matches again, e.g. after refresh()
+                best = None
+                depth -= 1
+        
+        if best is not None:
+            self._note('cache_hits')
+            del stack[depth:]
+        else:
+            if self.masks is None:
+                self.masks = CharMasks(self.corpus)
+            self._note_scan(candidates)
+            result = fuzzy_search(self.corpus, self.masks, search_pattern, candidates, cancelled, limit)
+            if result is None:
+                raise SearchCancelled(pattern)
+            indices, best = result
+            del stack[depth:]
+            stack.append((search_pattern, indices, best, limit))
+        
+        self._cancel_pending()
+        self._set_results(array('I', best))
+        self._match_count = len(indices)
+        self._fuzzy_limit = limit
+        self.current_pattern = pattern
+        return self.get_selected_line()
+    
+    def update_filter_query(self, pattern, cancelled=None):
+        """Update the filter to the lines matching a multi-term query.
+        
+        See the query module for the syntax; raises QueryError for an
+        invalid query.
+        """
+        query = compile_query(pattern, self.case_sensitive, self.casefold)
+        if not query.terms:
+            return self.update_filter('')
         
+        # Adding a term or extending a plain one only removes matches; the
+        # other queries are dropped once the scan can no longer be cancelled
+        stack = self._query_stack
+        depth = len(stack)
+        while depth and not query.narrows(stack[depth - 1][0]):
+            depth -= 1
+        if depth and stack[depth - 1][0].terms == query.terms:
+            self._note('cache_hits')
+            indices = stack[depth - 1][1]
+            del stack[depth:]
+        else:
+            candidates = stack[depth - 1][1] if depth else None
+            indices = self._scan_query(query, candidates, cancelled)
+            del stack[depth:]
+            stack.append((query, indices))
+        
+        self._cancel_pending()
+        self._set_results(indices)
+        self.current_pattern = pattern
         return self.get_selected_line()
     
+    def _scan_query(self, query, candidates, cancelled, use_index=True):
+        """Return the indices of lines matching query among candidates."""
+        driver = query.driver
+        if driver is not None:
+            if use_index and self.index is not None:
+                indexed = self.index.candidates(driver.text, None if candidates is None else len(candidates))
+                if indexed is not None:
+                    self._note('index_hits')
+                    candidates = indexed
+            self._note_scan(candidates)
+            chunks = self.corpus.search_chunks(driver.text, candidates)
+        else:
+            # No literal term to scan for, so every candidate is checked
+            self._note_scan(candidates)
+            if candidates is None:
+                candidates = range(len(self.corpus))
+            chunks = (candidates[i:i + CHUNK_LINES] for i in range(0, len(candidates), CHUNK_LINES))
+        
+        indices = array('I')
+        for hits in chunks:
+            if cancelled is not None and cancelled():
+                raise SearchCancelled(query)
+            indices.extend(query.select(self.corpus, hits))
+        return indices
+    
+    @property
+    def filtered_lines(self):
+        """The matched lines in display order, as a read-only view."""
+        if self.matches is None:
+            return self.original_lines
+        return MatchedLines(self.corpus, self.matches)
+    
+    def _lines(self, matches, offset, stop):
+        """Return the matched lines in [offset, stop); stop None means to the end."""
+        if matches is None:
+            return list(self.original_lines[offset:stop])
+        return [self.corpus.line(i) for i in matches[offset:stop]]
+    
+    def _page(self, matches, offset, stop):
+        """Return the 'lines' in [offset, stop), and their 'files' for a multi-file corpus."""
+        page = {'lines': self._lines(matches, offset, stop)}
+        if self.files is not None:
+            if matches is None:
+                indices = range(offset, offset + len(page['lines']))
+            else:
+                indices = matches[offset:stop]
+            page['files'] = [self.files.name_of(i) for i in indices]
+        return page
+    
+    def _count(self, matches):
+        if matches is None:
+            return len(self.corpus)
+        return len(matches) if self._match_count is None else self._match_count
+    
+    def get_results(self, offset=0, limit=None, wait=False):
+        """Return the match count and a slice of matched lines.
+        
+        While a progressive search is still running, the count covers the
+        lines found so far and 'complete' is False, unless wait is True.
+        Raises ValueError for a negative offset or limit.
+        """
+        if offset < 0 or (limit is not None and limit < 0):
+            raise ValueError(f"offset and limit must not be negative, got {offset} and {limit}")
+        job = self._pending
+        if job is not None and (wait or job.complete):
+            self._finish_pending()
+            job = None
+        
+        stop = None if limit is None else offset + limit
+        if job is not None:
+            indices = job.indices[:]
+            return {'count': len(indices), 'complete': False, **self._page(indices, offset, stop)}
+        return {
+            'count': self._count(self.matches),
+            'complete': True,
+            **self._page(self.matches, offset, stop),
+        }
+    
+    def get_window(self, offset=None, limit=WINDOW_LIMIT):
+        """Return a page of limit matched lines and where the selection is.
+        
+        offset None picks the page that centres the selected line.  The
+        result has the page 'offset' and 'lines' (and 'files' for a
+        multi-file corpus), the match 'count', whether the search is
+        'complete' and the 'selected' index.  A running
+        progressive search is not waited for.  Raises ValueError for a
+        negative offset or limit.
+        """
+        if limit < 0 or (offset is not None and offset < 0):
+            raise ValueError(f"offset and limit must not be negative, got {offset} and {limit}")
+        job = self._pending
+        if job is not None and job.complete:
+            self._finish_pending()
+            job = None
+        
+        matches = self.matches if job is None else job.indices[:]
+        count = len(matches) if job is not None else self._count(matches)
+        if offset is None:
+            offset = max(0, min(self.selected_index - limit // 2, count - limit))
+        return {
+            'offset': offset,
+            'count': count,
+            'complete': job is None,
+            'selected': self.selected_index,
+            **self._page(matches, offset, offset + limit),
+        }
+    
+    def _set_results(self, indices):
+        """Show the lines at indices and keep the selection in bounds."""
+        self.matches = indices
+        self._match_count = None
+        self._fuzzy_limit = None
+        
+        # Reset selection if out of bounds
+        if self.selected_index >= len(indices):
+            self.selected_index = 0
+    
+    def _cancel_pending(self):
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+    
+    def _finish_pending(self):
+        """Wait for the background search and adopt its full result set."""
+        job = self._pending
+        if job is None:
+            return
+        job.wait()
+        self._adopt_pending()
+        self._set_results(job.indices)
+    
+    def _adopt_pending(self):
+        """Move a completed background search onto the narrowing stack."""
+        job = self._pending
+        if job is not None and job.complete:
+            self._pending = None
+            self._narrowing_stack.extend(job.narrowed)
+            self._narrowing_stack.append((job.search_pattern, job.indices))
+    
+    def _take_over(self, search_pattern):
+        """Narrow a running background search whose pattern search_pattern contains.
+        
+        Returns None if there is none.  Otherwise the search is stopped and
+        (chunks, narrowed, restore) returned: chunks checks the lines it
+        found so far, then the hits of the rest of its scan; narrowed lists
+        the stack entries complete once chunks is exhausted, and restore()
+        resumes the stopped search, as long as chunks is not being iterated.
+        """
+        self._adopt_pending()
+        job = self._pending
+        if job is None or job.search_pattern not in search_pattern:
+            return None
+        rest = job.detach()
+        if job.complete:
+            # Finished while being stopped
+            self._adopt_pending()
+            return None
+        self._pending = None
+        # The stack was pruned to patterns the job's contains when it started
+        scanned = job.indices[:]
+        self._note_scan(scanned)
+        search = self.corpus.search
+        
+        def chunks():
+            yield from self.corpus.search_chunks(search_pattern, scanned)
+            for hits in rest:
+                # Keep the stopped search's results growing, for restore()
+                job.indices.extend(hits)
+                yield search(search_pattern, hits)
+        
+        def restore():
+            return _BackgroundSearch(job.search_pattern, job.indices, rest, job.narrowed)
+        
+        return chunks(), job.narrowed + [(job.search_pattern, job.indices)], restore
+    
+    def _narrowing_base(self, search_pattern):
+        """Return (cached_indices, candidates, depth) to use for search_pattern.
+        
+        cached_indices is the stored result when the pattern was seen before;
+        otherwise candidates is the smaller of the narrowest stored superset
+        and the trigram index candidates, or None for the whole corpus.
+        depth counts the stored results search_pattern narrows.  The stack is
+        left alone: callers drop the rest only once their scan can no longer
+        be cancelled, since the results shown may be among them.
+        """
+        self._adopt_pending()
+        stack = self._narrowing_stack
+        
+        # Skip cached patterns the new one no longer contains (backspace, paste)
+        depth = len(stack)
+        while depth and stack[depth - 1][0] not in search_pattern:
+            depth -= 1
+        
+        if depth and stack[depth - 1][0] == search_pattern:
+            self._note('cache_hits')
+            return stack[depth - 1][1], None, depth
+        candidates = stack[depth - 1][1] if depth else None
+        
+        if self.index is not None:
+            indexed = self.index.candidates(search_pattern, None if candidates is None else len(candidates))
+            if indexed is not None:
+                self._note('index_hits')
+                candidates = indexed
+        return None, candidates, depth
+    
+    def _note(self, name, n=1):
+        if self.metrics is not None:
+            self.metrics.count(name, n)
+    
+    def _note_scan(self, candidates):
+        """Count a scan of candidates, or of the whole corpus if None."""
+        if candidates is None:
+            # The length of a lazily indexed corpus is not known up front
+            self._note('full_scans')
+        else:
+            self._note('narrowed_scans')
+            self._note('lines_scanned', len(candidates))
+    
+    def _narrow(self, search_pattern, cancelled=None):
+        """Return matching line indices, scanning only the narrowest cached set."""
+        cached, candidates, depth = self._narrowing_base(search_pattern)
+        if cached is not None:
+            del self._narrowing_stack[depth:]
+            return cached
+        
+        self._note_scan(candidates)
+        # Chunks keep the temporary lists of boxed indices small
+        indices = array('I')
+        for hits in self.corpus.search_chunks(search_pattern, candidates):
+            if cancelled is not None and cancelled():
+                raise SearchCancelled(search_pattern)
+            indices.extend(hits)
+        del self._narrowing_stack[depth:]
+        self._narrowing_stack.append((search_pattern, indices))
+        return indices
+    
+    def peek(self, pattern, cancelled=None):
+        """Return the line update_filter(pattern) would select, leaving the filter unchanged.
+        
+        The scan starts from the same stored results as update_filter() and
+        stops as soon as the selected line is known, so peeking is cheap
+        enough to do speculatively.  Like update_filter(), it keeps the
+        selection's position among the matches if there are enough of them.
+        """
+        index = self.peek_index(pattern, cancelled)
+        return "" if index is None else self.corpus.line(index)
+    
+    def peek_index(self, pattern, cancelled=None):
+        """Like peek(), but return the corpus index of the line, or None if nothing matches."""
+        if not pattern:
+            return 0 if self.corpus.has_line(0) else None
+        fold = self.corpus.fold
+        search_pattern = fold(pattern) if fold else pattern
+        cached, candidates, _ = self._narrowing_base(search_pattern)
+        if cached is not None:
+            indices = cached
+        else:
+            self._note_scan(candidates)
+            indices = array('I')
+            for hits in self.corpus.search_chunks(search_pattern, candidates):
+                if cancelled is not None and cancelled():
+                    raise SearchCancelled(pattern)
+                indices.extend(hits)
+                if len(indices) > self.selected_index:
+                    break
+        # Out of bounds selections go back to the first match, as in _set_results()
+        if len(indices) > self.selected_index:
+            return indices[self.selected_index]
+        return indices[0] if indices else None
+    
+    def follow(self):
+        """Start tracking lines appended to the corpus; see refresh()."""
+        self._line_count = len(self.corpus)
+        self._last_line = self.corpus.line(self._line_count - 1) if self._line_count else None
+    
+    def refresh(self):
+        """Add the matches among lines appended to the corpus since the last refresh.
+        
+        Only the new lines are checked, against the current pattern and the
+        cached narrowing results, together with the previous last line if
+        the follower replaced it with its completed text.  Returns True if
+        the match count or the selected line changed.
+        """
+        if self._line_count is None:
+            return False
+        self._finish_pending()
+        start, stop = self._line_count, len(self.corpus)
+        replaced = start > 0 and stop >= start and self.corpus.line(start - 1) != self._last_line
+        if stop < start or (stop == start and not replaced):
+            return False
+        self._line_count = stop
+        self._last_line = self.corpus.line(stop - 1)
+        if self.matches is None:
+            # Every line is a match
+            return True
+        
+        before = (self._count(self.matches), self.get_selected_line())
+        changed = replaced and self.get_selected_index() == start - 1
+        if replaced:
+            # Check the completed line again, dropping its old result
+            start -= 1
+            for stack in (self._narrowing_stack, self._query_stack, self._fuzzy_stack):
+                for entry in stack:
+                    indices = entry[1]
+                    if indices and indices[-1] == start:
+                        indices.pop()
+        new_lines = range(start, stop)
+        # The current results are held by one of the stacks
+        for search_pattern, indices in self._narrowing_stack:
+            _extend_sorted(indices, self.corpus.search(search_pattern, new_lines))
+        for query, indices in self._query_stack:
+            _extend_sorted(indices, self._scan_query(query, new_lines, None, use_index=False))
+        for i, (search_pattern, indices, best, limit) in enumerate(self._fuzzy_stack):
+            hits = fuzzy_search(self.corpus, self.masks, search_pattern, new_lines, limit=0)[0]
+            if hits or replaced:
+                # The new matches were never ranked against the others
+                self._fuzzy_stack[i] = (search_pattern, indices, None, limit)
+            _extend_sorted(indices, hits)
+        if self._fuzzy_limit is not None:
+            self.update_filter_fuzzy(self.current_pattern, limit=self._fuzzy_limit)
+        return changed or (self._count(self.matches), self.get_selected_line()) != before
+    
+    def memory_usage(self):
+        """Return approximate bytes held by the corpus, its folded copy and index."""
+        usage = dict(self.corpus.memory_usage())
+        if self.index is not None:
+            usage.update(self.index.memory_usage())
+            usage['total_bytes'] += usage['index_bytes']
+        if self.masks is not None:
+            usage.update(self.masks.memory_usage())
+            usage['total_bytes'] += usage['mask_bytes']
+        return usage
+    
+    def get_selected_index(self):
+        """Get the corpus index of the currently selected line, or None if there is none."""
+        index = self.selected_index
+        if self.matches is not None:
+            if not 0 <= index < len(self.matches):
+                return None
+            index = self.matches[index]
+        # Check has_line() instead of len(), which is costly for lazy corpora
+        return index if self.corpus.has_line(index) else None
+    
     def get_selected_line(self):
         """Get the currently selected line."""
-        if self.filtered_lines and 0 <= self.selected_index < len(self.filtered_lines):
-            return self.filtered_lines[self.selected_index]
-        return ""
+        index = self.get_selected_index()
+        return "" if index is None else self.corpus.line(index)
     
     def move_selection(self, delta):
         """Move selection up or down."""
-        if not self.filtered_lines:
-            return self.get_selected_line()
-        
-        self.selected_index = max(0, min(len(self.filtered_lines) - 1, self.selected_index + delta))
+        self._finish_pending()
+        index = max(0, self.selected_index + delta)
+        if self.matches is not None:
+            if self.matches:
+                self.selected_index = min(len(self.matches) - 1, index)
+        elif self.corpus.has_line(index):
+            self.selected_index = index
+        elif self.corpus.has_line(0):
+            # Moved past the end; only now is the line count needed
+            self.selected_index = len(self.corpus) - 1
         return self.get_selected_line()
@@ -1,142 +1,280 @@
 #!/usr/bin/env python3
 """
-Incremental search filter server using Windows named pipes.
+Incremental search filter server using Windows named pipes or Unix sockets.
 Receives input filename via pipe, performs incremental search, and sends back selected line.
 """
 import argparse
+import asyncio
 import sys
-import win32pipe
-import win32file
-import pywintypes
-import tomli
 import os
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-from search_filter import IncrementalSearchFilter
+from corpus_loader import CorpusLoader
+from corpus_pool import CorpusPool
+from metrics import Metrics
+from multi_file import FileSet
+from query import compile_query
+from session import FilterSession
+from transport import StreamSender, serve_stream, start_server
 
 
 class PipeServer:
-    """Windows named pipe server for incremental search."""
+    """Incremental search server over a Windows named pipe or Unix socket.
     
-    def __init__(self, pipe_name, encoding='utf-8', case_sensitive=False):
+    Runs on asyncio with one FilterSession per client connection.  Requests
+    are handled on a thread pool, so a slow scan for one client does not
+    block the others.
+    """
+    
+    def __init__(self, pipe_name, encoding='utf-8', case_sensitive=False, casefold=False,
+                 backend='list', progressive=False, workers=1, chunk_size=4 << 20,
+                 parallel_threshold=200000, trigram_index=False, cache=None,
+                 memory_budget=1 << 30, transport='pipe', socket_path=None, max_sessions=64,
+                 mode='substring', fuzzy_limit=1000, fuzzy_prefilter=False,
+                 follow=False, follow_interval=1.0, stats_file=None, stats_interval=60.0,
+                 load_workers=0, preload=None):
         self.pipe_name = pipe_name
+        # "pipe" listens on pipe_name, "unix" on socket_path
+        self.transport = transport
+        self.socket_path = socket_path
         self.encoding = encoding
-        self.case_sensitive = case_sensitive
-        self.filter = None
+        # Answer searches once the selected line is known, finish in background
+        self.progressive = progressive
+        # Default search mode and number of ranked fuzzy matches
+        self.mode = mode
+        self.fuzzy_limit = fuzzy_limit
+        # Default for inits that do not say whether to follow the file
+        self.follow = follow
+        self.follow_interval = follow_interval
+        self.loader = CorpusLoader(
+            encoding, case_sensitive, casefold, backend, workers, chunk_size,
+            parallel_threshold, trigram_index, cache, fuzzy_prefilter, load_workers,
+        )
+        # Recently used corpora stay loaded up to memory_budget bytes
+        self.pool = CorpusPool(self.loader, memory_budget)
+        # Connections beyond max_sessions are refused
+        self.max_sessions = max_sessions
+        self.sessions = set()
+        self.executor = None
+        # Request timings and search counters, reported by "stats"
+        self.metrics = Metrics()
+        # Started and stopped by "profile" messages
+        self.profiler = None
+        # Append a stats snapshot to stats_file every stats_interval seconds
+        self.stats_file = stats_file
+        self.stats_interval = stats_interval
+        # Files and directories loaded and pinned in the pool at startup
+        self.preload = list(preload or [])
+        # Milliseconds taken by each startup phase
+        self.startup = {}
+    
+    @property
+    def address(self):
+        """Pipe name or socket path the server listens on."""
+        return self.pipe_name if self.transport == 'pipe' else self.socket_path
+    
+    def note_startup(self, phase, seconds):
+        """Record how long a startup phase took; "stats" reports the phases."""
+        self.startup[phase] = round(seconds * 1000, 3)
+    
+    def stats(self):
+        """Return pool, session, cache and request statistics."""
+        query_cache = compile_query.cache_info()
+        return {
+            'status': 'ok',
+            'pool': self.pool.stats(),
+            'sessions': len(self.sessions),
+            'max_sessions': self.max_sessions,
+            'query_cache': {'hits': query_cache.hits, 'misses': query_cache.misses},
+            'profiling': self.profiler is not None and self.profiler.running,
+            'startup': dict(self.startup),
+            **self.metrics.snapshot(),
+        }
     
-    def load_file(self, filename):
-        """Load input file for filtering."""
+    def profile(self, msg_obj):
+        """Start or stop the sampling profiler, or report what it has seen."""
+        action = msg_obj.get('action', 'report')
+        if action == 'start':
+            # A zero interval would busy-loop and a string would kill the sampler
+            interval = msg_obj.get('interval', 0.005)
+            if isinstance(interval, bool) or not isinstance(interval, (int, float)) or not 0 < interval < float('inf'):
+                return {'status': 'error', 'message': f'Invalid profile interval: {interval!r}'}
+            from profiler import SamplingProfiler
+            if self.profiler is not None:
+                self.profiler.stop()
+            self.profiler = SamplingProfiler(interval)
+            self.profiler.start()
+            return {'status': 'ok', 'profiling': True}
+        if action not in ('stop', 'report'):
+            return {'status': 'error', 'message': f'Unknown profile action: {action}'}
+        limit = msg_obj.get('limit', 20)
+        if isinstance(limit, bool) or not isinstance(limit, int) or limit <= 0:
+            return {'status': 'error', 'message': f'Invalid profile limit: {limit!r}'}
+        if self.profiler is None:
+            return {'status': 'error', 'message': 'Profiler was never started'}
+        if action == 'stop':
+            self.profiler.stop()
+        return {'status': 'ok', 'profiling': self.profiler.running,
+                **self.profiler.report(limit)}
+    
+    def _handle_server_message(self, msg_obj):
+        """Answer a "stats" or "profile" request, which needs no session."""
         try:
-            with open(filename, 'r', encoding=self.encoding) as f:
-                lines = f.read().splitlines()
-            self.filter = IncrementalSearchFilter(lines, self.case_sensitive)
-            return True
+            if msg_obj.get('type') == 'stats':
+                return self.stats()
+            return self.profile(msg_obj)
+        except (KeyError, TypeError, ValueError) as e:
+            return {'status': 'error', 'message': f'Invalid message format: {e}'}
         except Exception as e:
-            print(f"Error loading file {filename}: {e}", file=sys.stderr)
-            return False
+            # Answer anyway, so that the client's connection stays usable
+            print(f"Error handling {msg_obj.get('type')} request: {e}", file=sys.stderr)
+            return {'status': 'error', 'message': f'Internal error: {e}'}
     
-    def handle_client(self, pipe_handle):
-        """Handle a single client connection."""
+    def _handle_session_message(self, session, msg_obj, submitted):
+        started = time.perf_counter()
+        self.metrics.record('executor_wait', started - submitted)
         try:
-            # Read input filename
-            data = b""
-            while True:
-                try:
-                    result, chunk = win32file.ReadFile(pipe_handle, 4096)
-                    data += chunk
-                    if result == 0 and len(chunk) < 4096:
-                        break
-                except pywintypes.error as e:
-                    if e.args[0] == 109:  # ERROR_BROKEN_PIPE
-                        break
-                    raise
-            
-            if not data:
-                return
-            
-            message = data.decode(self.encoding).strip()
-            
-            # Parse message
+            return session.handle_message(msg_obj)
+        finally:
+            msg_type = msg_obj.get('type')
+            if msg_type not in ('init', 'search', 'peek', 'results', 'window', 'move'):
+                msg_type = 'other'
+            self.metrics.record(f'filter.{msg_type}', time.perf_counter() - started)
+    
+    async def handle_message(self, session, msg_obj):
+        """Handle one request of a session on the thread pool."""
+        loop = asyncio.get_running_loop()
+        if msg_obj.get('type') in ('stats', 'profile'):
+            return await loop.run_in_executor(self.executor, self._handle_server_message, msg_obj)
+        return await loop.run_in_executor(self.executor, self._handle_session_message,
+                                          session, msg_obj, time.perf_counter())
+    
+    def _append_stats(self):
+        with open(self.stats_file, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'time': time.time(), **self.stats()}) + '\n')
+    
+    async def dump_stats(self):
+        """Append a stats snapshot to stats_file as a JSON line every stats_interval seconds."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            try:
+                await loop.run_in_executor(self.executor, self._append_stats)
+            except OSError as e:
+                print(f"Error writing stats file: {e}", file=sys.stderr)
+    
+    def _preload_one(self, name):
+        source = FileSet(directory=name) if os.path.isdir(name) else name
+        self.pool.release(self.pool.acquire(source, pin=True))
+    
+    async def preload_files(self):
+        """Load the preload files one by one, so that inits for them attach to a ready corpus."""
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        for name in self.preload:
+            load_started = time.perf_counter()
             try:
-                msg_obj = json.loads(message)
-                msg_type = msg_obj.get('type')
-                
-                if msg_type == 'init':
-                    # Initialize with input filename
-                    filename = msg_obj.get('filename')
-                    if self.load_file(filename):
-                        response = json.dumps({'status': 'ok', 'line': self.filter.get_selected_line()})
-                        win32file.WriteFile(pipe_handle, (response + '\n').encode(self.encoding))
-                    else:
-                        response = json.dumps({'status': 'error', 'message': 'Failed to load file'})
-                        win32file.WriteFile(pipe_handle, (response + '\n').encode(self.encoding))
-                
-                elif msg_type == 'search':
-                    # Update search pattern
-                    if self.filter:
-                        pattern = msg_obj.get('pattern', '')
-                        line = self.filter.update_filter(pattern)
-                        response = json.dumps({'status': 'ok', 'line': line})
-                        win32file.WriteFile(pipe_handle, (response + '\n').encode(self.encoding))
-                
-                elif msg_type == 'move':
-                    # Move selection
-                    if self.filter:
-                        delta = msg_obj.get('delta', 0)
-                        line = self.filter.move_selection(delta)
-                        response = json.dumps({'status': 'ok', 'line': line})
-                        win32file.WriteFile(pipe_handle, (response + '\n').encode(self.encoding))
-                
-            except (json.JSONDecodeError, KeyError) as e:
-                response = json.dumps({'status': 'error', 'message': f'Invalid message format: {e}'})
-                win32file.WriteFile(pipe_handle, (response + '\n').encode(self.encoding))
+                await loop.run_in_executor(self.executor, self._preload_one, name)
+            except Exception as e:
+                print(f"Error preloading {name}: {e}", file=sys.stderr)
+                continue
+            print(f"Preloaded {name} in {(time.perf_counter() - load_started) * 1000:.1f} ms")
+        self.note_startup('preload', time.perf_counter() - started)
+    
+    async def push_update(self, session, sender):
+        """Send a followed file's update notification to a client, if there is news."""
+        loop = asyncio.get_running_loop()
+        update = await loop.run_in_executor(self.executor, session.refresh)
+        if update is not None and not sender.writer.is_closing():
+            sender.writer.write(sender.encode(update))
+    
+    async def handle_client(self, reader, writer):
+        """Serve requests from one client until it disconnects."""
+        if len(self.sessions) >= self.max_sessions:
+            response = {'status': 'error', 'message': 'Too many sessions'}
+            writer.write(json.dumps(response).encode(self.encoding) + b'\n')
+            await writer.drain()
+            writer.close()
+            return
         
+        session = FilterSession(self.pool, self.progressive, self.mode, self.fuzzy_limit,
+                                self.follow, self.follow_interval, self.metrics)
+        loop = asyncio.get_running_loop()
+        # Notifications are written in the framing negotiated for responses
+        sender = StreamSender(writer, self.encoding)
+        session.on_update = lambda: asyncio.run_coroutine_threadsafe(
+            self.push_update(session, sender), loop)
+        self.sessions.add(session)
+        print(f"Client connected ({len(self.sessions)} sessions)")
+        try:
+            await serve_stream(
+                reader, writer,
+                lambda msg_obj: self.handle_message(session, msg_obj),
+                self.encoding,
+                session.on_received,
+                self.metrics,
+                sender,
+            )
         except Exception as e:
             print(f"Error handling client: {e}", file=sys.stderr)
         finally:
-            win32file.CloseHandle(pipe_handle)
+            self.sessions.discard(session)
+            session.close()
+            writer.close()
+            print("Client disconnected")
+    
+    async def serve(self):
+        """Accept clients until cancelled."""
+        started = time.perf_counter()
+        # One thread per session, so each can have a request in flight, and
+        # one for preloading
+        self.executor = ThreadPoolExecutor(self.max_sessions + 1)
+        # Preloading starts before listening and goes on in the background
+        preloading = asyncio.ensure_future(self.preload_files()) if self.preload else None
+        listener = await start_server(self.transport, self.pipe_name, self.socket_path,
+                                      self.handle_client)
+        self.note_startup('listen', time.perf_counter() - started)
+        phases = ', '.join(f"{phase} {ms:.1f} ms" for phase, ms in self.startup.items())
+        print(f"Listening ({phases})")
+        dumping = asyncio.ensure_future(self.dump_stats()) if self.stats_file else None
+        try:
+            await asyncio.Event().wait()
+        finally:
+            if preloading is not None:
+                preloading.cancel()
+            if dumping is not None:
+                dumping.cancel()
+            if self.profiler is not None:
+                self.profiler.stop()
+            listener.close()
+            for session in list(self.sessions):
+                session.close()
+            self.executor.shutdown(wait=False)
+            self.pool.close()
+            self.loader.close()
     
     def run(self):
-        """Run the pipe server."""
-        print(f"Starting server on pipe: {self.pipe_name}")
+        """Run the server."""
+        print(f"Starting server on {self.transport}: {self.address}")
         print("Press Ctrl+C to stop")
-        
-        while True:
-            try:
-                # Create named pipe
-                pipe_handle = win32pipe.CreateNamedPipe(
-                    self.pipe_name,
-                    win32pipe.PIPE_ACCESS_DUPLEX,
-                    win32pipe.PIPE_TYPE_MESSAGE | win32pipe.PIPE_READMODE_MESSAGE | win32pipe.PIPE_WAIT,
-                    1,  # Max instances
-                    65536,  # Out buffer size
-                    65536,  # In buffer size
-                    0,  # Default timeout
-                    None
-                )
-                
-                print(f"Waiting for client connection...")
-                
-                # Wait for client
-                win32pipe.ConnectNamedPipe(pipe_handle, None)
-                print("Client connected")
-                
-                # Handle client
-                self.handle_client(pipe_handle)
-                print("Client disconnected")
-                
-            except KeyboardInterrupt:
-                print("\nShutting down server...")
-                break
-            except Exception as e:
-                print(f"Server error: {e}", file=sys.stderr)
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            print("\nShutting down server...")
 
 
 def load_config(config_filename):
     """Load configuration from TOML file."""
     try:
+        try:
+            import tomllib
+        except ImportError:
+            # Python before 3.11
+            import tomli as tomllib
         with open(config_filename, 'rb') as f:
-            return tomli.load(f)
+            return tomllib.load(f)
     except Exception as e:
         print(f"Error loading config file: {e}", file=sys.stderr)
         sys.exit(1)
@@ -144,7 +282,7 @@ def load_config(config_filename):
 
 def main():
     parser = argparse.ArgumentParser(
-        description="Incremental search filter server using Windows named pipes"
+        description="Incremental search filter server using Windows named pipes or Unix sockets"
     )
     parser.add_argument(
         '--config-filename',
@@ -154,14 +292,47 @@ def main():
     args = parser.parse_args()
     
     # Load configuration
+    started = time.perf_counter()
     config = load_config(args.config_filename)
+    config_time = time.perf_counter() - started
     
     pipe_name = config.get('pipe', {}).get('name', '\\\\.\\pipe\\cat_incremental_search_filter')
+    transport = config.get('transport', {}).get('kind', 'pipe')
+    socket_path = config.get('transport', {}).get('socket_path', '/tmp/cat_incremental_search_filter.sock')
     encoding = config.get('encoding', {}).get('default', 'utf-8')
     case_sensitive = config.get('search', {}).get('case_sensitive', False)
+    casefold = config.get('search', {}).get('casefold', False)
+    backend = config.get('search', {}).get('backend', 'list')
+    progressive = config.get('search', {}).get('progressive', False)
+    workers = config.get('search', {}).get('workers', 1)
+    chunk_size = config.get('search', {}).get('chunk_size', 4 << 20)
+    parallel_threshold = config.get('search', {}).get('parallel_threshold', 200000)
+    trigram_index = config.get('search', {}).get('trigram_index', False)
+    mode = config.get('search', {}).get('mode', 'substring')
+    fuzzy_limit = config.get('search', {}).get('fuzzy_limit', 1000)
+    fuzzy_prefilter = config.get('search', {}).get('fuzzy_prefilter', False)
+    cache_directory = config.get('cache', {}).get('directory', '')
+    cache_max_bytes = config.get('cache', {}).get('max_bytes', 1 << 30)
+    cache = None
+    if cache_directory:
+        from index_cache import IndexCache
+        cache = IndexCache(cache_directory, cache_max_bytes)
+    memory_budget = config.get('pool', {}).get('memory_budget', 1 << 30)
+    max_sessions = config.get('server', {}).get('max_sessions', 64)
+    follow = config.get('follow', {}).get('enabled', False)
+    follow_interval = config.get('follow', {}).get('interval', 1.0)
+    stats_file = config.get('stats', {}).get('file', '') or None
+    stats_interval = config.get('stats', {}).get('interval', 60.0)
+    load_workers = config.get('files', {}).get('load_workers', 0)
+    preload = config.get('preload', {}).get('files', [])
     
     # Start server
-    server = PipeServer(pipe_name, encoding, case_sensitive)
+    server = PipeServer(pipe_name, encoding, case_sensitive, casefold, backend, progressive,
+                        workers, chunk_size, parallel_threshold, trigram_index, cache,
+                        memory_budget, transport, socket_path, max_sessions,
+                        mode, fuzzy_limit, fuzzy_prefilter, follow, follow_interval,
+                        stats_file, stats_interval, load_workers, preload)
+    server.note_startup('config', config_time)
     server.run()
 
 
@@ -0,0 +1,254 @@
+"""
+Per-connection search sessions (platform-independent).
+
+Each client connection gets a session holding its own filter, so the
+pattern and selection of one client never affect another.  Sessions get
+their corpora from a shared CorpusPool and only read them, so clients
+searching the same file share one loaded copy.
+
+A search is superseded once a newer search from the same client has
+arrived: if it is still queued it is skipped, and if it is running its scan
+is cancelled.  Either way it is answered with status "superseded".
+
+A session following its file is told when lines are appended; refresh()
+then updates its results and returns the notification to push, if any.
+
+An init may name several files or a directory instead of one file; they are
+searched as one corpus and results name the file of each line.
+"""
+import sys
+import threading
+
+from multi_file import FileSet
+from query import QueryError
+from search_filter import WINDOW_LIMIT, IncrementalSearchFilter, SearchCancelled
+
+
+# Search modes: substring match in file order, ranked fuzzy match, or
+# multi-term query
+MODES = {'substring', 'fuzzy', 'query'}
+
+
+class FilterSession:
+    """Filter state of one client connection."""
+    
+    def __init__(self, pool, progressive=False, mode='substring', fuzzy_limit=1000,
+                 follow=False, follow_interval=1.0, metrics=None):
+        self.pool = pool
+        # Defaults for searches that do not give progressive or mode
+        self.progressive = progressive
+        self.mode = mode
+        # Ranked lines kept by a fuzzy search
+        self.fuzzy_limit = fuzzy_limit
+        self.loaded = None
+        self.filter = None
+        # Most recently received search request, set as requests arrive,
+        # and the one handled last
+        self.latest_search = None
+        self._handled_search = None
+        # Default for inits that do not give follow, and the polling interval
+        self.follow = follow
+        self.follow_interval = follow_interval
+        self.follower = None
+        # Called without arguments, from the follower's thread, when refresh()
+        # may have news
+        self.on_update = None
+        # Optional metrics.Metrics shared with the session's filters
+        self.metrics = metrics
+        # Requests and refreshes both change the filter
+        self._lock = threading.Lock()
+    
+    def on_received(self, msg_obj):
+        """Note a request as soon as it arrives, before earlier ones finish."""
+        if msg_obj.get('type') == 'search':
+            self.latest_search = msg_obj
+    
+    def is_superseded(self, msg_obj):
+        """Return True if a newer search than msg_obj has arrived."""
+        latest = self.latest_search
+        return latest is not None and latest is not msg_obj
+    
+    def search_waiting(self):
+        """Return True if a search has arrived that has not been handled yet."""
+        latest = self.latest_search
+        return latest is not None and latest is not self._handled_search
+    
+    def load_file(self, filename):
+        """Load input file for filtering."""
+        try:
+            loaded = self.pool.acquire(filename)
+        except Exception as e:
+            print(f"Error loading file {filename}: {e}", file=sys.stderr)
+            return False
+        
+        self.close()
+        self.loaded = loaded
+        self.filter = IncrementalSearchFilter(corpus=loaded.corpus, index=loaded.index,
+                                              masks=loaded.masks, metrics=self.metrics,
+                                              files=loaded.files)
+        return True
+    
+    def start_following(self):
+        """Follow the loaded file; raises ValueError if it cannot be followed."""
+        self.follower = self.loaded.follow(self.follow_interval)
+        self.filter.follow()
+        self.follower.subscribe(self._lines_added)
+    
+    def _lines_added(self):
+        if self.on_update is not None:
+            self.on_update()
+    
+    def refresh(self):
+        """Take in lines appended to a followed file.
+        
+        Returns an "update" notification when the match count or selected
+        line changed, or when the file was truncated, else None.
+        """
+        with self._lock:
+            if self.follower is None:
+                return None
+            if self.follower.truncated:
+                update = {'type': 'update', 'status': 'truncated'}
+            elif self.filter.refresh():
+                update = {'type': 'update', 'status': 'ok'}
+            else:
+                return None
+            update.update(
+                count=self.filter.get_results(0, 0)['count'],
+                line=self.filter.get_selected_line(),
+                pattern=self.filter.current_pattern,
+            )
+            return update
+    
+    def close(self):
+        """Return the session's corpus to the pool."""
+        if self.follower is not None:
+            self.follower.unsubscribe(self._lines_added)
+            self.follower = None
+        if self.loaded is not None:
+            self.pool.release(self.loaded)
+        self.loaded = None
+        self.filter = None
+    
+    def _with_location(self, response, index):
+        """Add the file and line number of corpus line index for a multi-file corpus."""
+        files = self.loaded.files
+        if files is not None and index is not None:
+            response['file'], response['line_number'] = files.locate(index)
+        return response
+    
+    def _with_window(self, response, msg_obj):
+        """Add the page around the selection when the request asks for one."""
+        limit = msg_obj.get('window')
+        if limit:
+            response['window'] = self.filter.get_window(None, limit)
+        return response
+    
+    def handle_message(self, msg_obj):
+        """Handle one request and return its response."""
+        with self._lock:
+            return self._handle_message(msg_obj)
+    
+    def _handle_message(self, msg_obj):
+        try:
+            msg_type = msg_obj.get('type')
+            
+            if msg_type == 'init':
+                # Initialize with input filename, or with several files
+                if 'files' in msg_obj or 'directory' in msg_obj:
+                    source = FileSet(msg_obj.get('files'), msg_obj.get('directory'),
+                                     msg_obj.get('include'), msg_obj.get('exclude'))
+                else:
+                    source = msg_obj.get('filename')
+                if not self.load_file(source):
+                    return {'status': 'error', 'message': 'Failed to load file'}
+                # The follow default only applies to single files
+                if msg_obj.get('follow', self.follow and not isinstance(source, FileSet)):
+                    try:
+                        self.start_following()
+                    except ValueError as e:
+                        self.close()
+                        return {'status': 'error', 'message': str(e)}
+                response = {'status': 'ok', 'line': self.filter.get_selected_line()}
+                files = self.loaded.files
+                if files is not None:
+                    response['file_count'] = len(files)
+                    if files.skipped:
+                        response['skipped'] = files.skipped
+                return self._with_location(response, self.filter.get_selected_index())
+            
+            if msg_type not in ('search', 'peek', 'results', 'window', 'move'):
+                return {'status': 'error', 'message': f'Unknown message type: {msg_type}'}
+            if not self.filter:
+                return {'status': 'error', 'message': 'No file loaded'}
+            
+            if msg_type == 'search':
+                # Update search pattern, unless a newer one is waiting
+                pattern = msg_obj.get('pattern', '')
+                mode = msg_obj.get('mode', self.mode)
+                if mode not in MODES:
+                    return {'status': 'error', 'message': f'Unknown search mode: {mode}'}
+                self._handled_search = msg_obj
+                cancelled = lambda: self.is_superseded(msg_obj)
+                try:
+                    if cancelled():
+                        raise SearchCancelled(pattern)
+                    if mode == 'fuzzy':
+                        line = self.filter.update_filter_fuzzy(pattern, cancelled, self.fuzzy_limit)
+                    elif mode == 'query':
+                        line = self.filter.update_filter_query(pattern, cancelled)
+                    elif msg_obj.get('progressive', self.progressive):
+                        line = self.filter.update_filter_progressive(pattern, cancelled)
+                    else:
+                        line = self.filter.update_filter(pattern, cancelled)
+                except SearchCancelled:
+                    if self.metrics is not None:
+                        self.metrics.count('superseded')
+                    return {'status': 'superseded', 'pattern': pattern}
+                except QueryError as e:
+                    return {'status': 'error', 'message': str(e), 'pattern': pattern}
+                response = {'status': 'ok', 'line': line, 'pattern': pattern}
+                self._with_location(response, self.filter.get_selected_index())
+                return self._with_window(response, msg_obj)
+            
+            if msg_type == 'peek':
+                # Speculative substring search; it gives way to real searches
+                pattern = msg_obj.get('pattern', '')
+                if msg_obj.get('mode', self.mode) != 'substring':
+                    return {'status': 'error', 'message': 'Peek only supports substring mode'}
+                try:
+                    if self.search_waiting():
+                        raise SearchCancelled(pattern)
+                    index = self.filter.peek_index(pattern, self.search_waiting)
+                except SearchCancelled:
+                    return {'status': 'superseded', 'pattern': pattern}
+                line = "" if index is None else self.loaded.corpus.line(index)
+                return self._with_location({'status': 'ok', 'line': line, 'pattern': pattern}, index)
+            
+            if msg_type == 'results':
+                # Report match count and more matched lines
+                results = self.filter.get_results(
+                    msg_obj.get('offset', 0),
+                    msg_obj.get('limit', 0),
+                    msg_obj.get('wait', False),
+                )
+                return {'status': 'ok', **results, 'pattern': self.filter.current_pattern}
+            
+            if msg_type == 'window':
+                # Report a page of matched lines around the selection
+                window = self.filter.get_window(msg_obj.get('offset'), msg_obj.get('limit', WINDOW_LIMIT))
+                return {'status': 'ok', **window, 'pattern': self.filter.current_pattern}
+            
+            # Move selection
+            delta = msg_obj.get('delta', 0)
+            line = self.filter.move_selection(delta)
+            response = {'status': 'ok', 'line': line, 'pattern': self.filter.current_pattern}
+            self._with_location(response, self.filter.get_selected_index())
+            return self._with_window(response, msg_obj)
+        
+        except (KeyError, TypeError, ValueError) as e:
+            return {'status': 'error', 'message': f'Invalid message format: {e}'}
+        except Exception as e:
+            # Answer anyway, so that the client's connection stays usable
+            print(f"Error handling {msg_obj.get('type')} request: {e}", file=sys.stderr)
+            return {'status': 'error', 'message': f'Internal error: {e}'}
@@ -0,0 +1,447 @@
+"""
+Connection transports for the search server and its clients.
+
+A transport carries a long-lived, bidirectional byte stream framed as
+newline-delimited JSON: each request and each response is one JSON object
+on its own line.  An init request may negotiate binary framing instead, in
+which messages are length-prefixed frames whose lists of lines are sent as
+raw UTF-8 rather than JSON strings.  Windows named pipes and AF_UNIX sockets are supported;
+the blocking named pipe connection needs pywin32, imported on first use, and is
+only available on Windows.  Servers use the asyncio functions at the end of this module;
+clients use the blocking Connection classes.
+"""
+import asyncio
+import json
+import os
+import socket
+import stat
+import struct
+import time
+
+# pywin32 modules, imported by _import_win32() when a named pipe is first used
+win32file = pywintypes = None
+
+
+def _import_win32():
+    """Import pywin32 for the blocking named pipe connection."""
+    global win32file, pywintypes
+    if win32file is None:
+        try:
+            import win32file
+            import pywintypes
+        except ImportError:
+            raise RuntimeError("Named pipes require pywin32 on Windows") from None
+
+
+TRANSPORTS = {'pipe', 'unix'}
+
+# Bytes requested per read from the underlying stream
+READ_SIZE = 65536
+# Longest request line the asyncio servers accept
+MAX_MESSAGE = 1 << 24
+
+ERROR_BROKEN_PIPE = 109
+
+# Message framings an init request can ask for
+FRAMINGS = {'json', 'binary'}
+
+# Binary frame header: where the lines go (0 nowhere, 1 "lines", 2 "window"
+# "lines"), bytes of JSON metadata, bytes of lines, number of lines.  The
+# metadata and the newline-joined UTF-8 lines follow.
+FRAME_HEADER = struct.Struct('!BIII')
+
+
+def encode_frame(obj):
+    """Encode obj as a binary frame, sending its list of lines, if any, as raw UTF-8."""
+    field, lines, metadata = 0, None, obj
+    if isinstance(obj.get('lines'), list):
+        field, lines = 1, obj['lines']
+        metadata = {key: value for key, value in obj.items() if key != 'lines'}
+    elif isinstance(obj.get('window'), dict) and isinstance(obj['window'].get('lines'), list):
+        field, lines = 2, obj['window']['lines']
+        window = {key: value for key, value in obj['window'].items() if key != 'lines'}
+        metadata = {**obj, 'window': window}
+    metadata = json.dumps(metadata).encode('utf-8')
+    payload = '\n'.join(lines).encode('utf-8', 'surrogatepass') if lines else b''
+    count = len(lines) if lines else 0
+    return FRAME_HEADER.pack(field, len(metadata), len(payload), count) + metadata + payload
+
+
+def frame_size(header):
+    """Return the number of bytes following a frame header."""
+    _, metadata_size, payload_size, _ = FRAME_HEADER.unpack(header)
+    return metadata_size + payload_size
+
+
+def decode_frame(header, body):
+    """Decode a binary frame; raises ValueError if it is malformed."""
+    field, metadata_size, _, count = FRAME_HEADER.unpack(header)
+    obj = json.loads(body[:metadata_size].decode('utf-8'))
+    if not isinstance(obj, dict):
+        raise ValueError("expected a JSON object")
+    if field:
+        target = obj if field == 1 else obj.get('window')
+        if field > 2 or not isinstance(target, dict):
+            raise ValueError(f"no place for the lines of field {field}")
+        lines = body[metadata_size:].decode('utf-8', 'surrogatepass').split('\n') if count else []
+        if len(lines) != count:
+            raise ValueError(f"frame has {len(lines)} lines, header says {count}")
+        target['lines'] = lines
+    return obj
+
+
+def negotiate_framing(msg_obj):
+    """Return the framing an init request asks for, or None to keep the current one."""
+    if msg_obj.get('type') != 'init' or 'framing' not in msg_obj:
+        return None
+    # Peers that do not know the framing asked for fall back to JSON
+    return msg_obj['framing'] if msg_obj['framing'] in FRAMINGS else 'json'
+
+
+class Connection:
+    """Byte stream carrying newline-delimited messages."""
+    
+    def __init__(self):
+        self._buffer = bytearray()
+        # "binary" once an init has negotiated binary frames
+        self.framing = 'json'
+    
+    def read_chunk(self):
+        """Return the next bytes from the stream, or b'' at end of stream."""
+        raise NotImplementedError
+    
+    def write(self, data):
+        """Write all of data to the stream."""
+        raise NotImplementedError
+    
+    def close(self):
+        """Close the stream."""
+        raise NotImplementedError
+    
+    def recv_line(self):
+        """Return the next line without its newline, or None at end of stream."""
+        scanned = 0
+        while True:
+            end = self._buffer.find(b'\n', scanned)
+            if end >= 0:
+                line = bytes(self._buffer[:end])
+                del self._buffer[:end + 1]
+                return line
+            scanned = len(self._buffer)
+            chunk = self.read_chunk()
+            if not chunk:
+                # A final line without a newline is still a message
+                line = bytes(self._buffer) if self._buffer else None
+                self._buffer.clear()
+                return line
+            self._buffer += chunk
+    
+    def recv_exactly(self, size):
+        """Return the next size bytes, or None if the stream ends first."""
+        while len(self._buffer) < size:
+            chunk = self.read_chunk()
+            if not chunk:
+                self._buffer.clear()
+                return None
+            self._buffer += chunk
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+    
+    def recv_frame(self):
+        """Return the (header, body) of the next binary frame, or None at end of stream."""
+        header = self.recv_exactly(FRAME_HEADER.size)
+        if header is None:
+            return None
+        body = self.recv_exactly(frame_size(header))
+        if body is None:
+            return None
+        return header, body
+    
+    def send_line(self, data):
+        """Write data followed by a newline."""
+        self.write(data + b'\n')
+    
+    def send_json(self, obj, encoding='utf-8'):
+        """Write obj as one JSON line."""
+        self.send_line(json.dumps(obj).encode(encoding))
+    
+    def recv_json(self, encoding='utf-8'):
+        """Read one JSON line, or return None at end of stream."""
+        line = self.recv_line()
+        if line is None:
+            return None
+        return json.loads(line.decode(encoding))
+    
+    def send_message(self, obj, encoding='utf-8'):
+        """Write obj as a JSON line or a binary frame, depending on framing."""
+        if self.framing == 'binary':
+            self.write(encode_frame(obj))
+        else:
+            self.send_json(obj, encoding)
+    
+    def recv_message(self, encoding='utf-8'):
+        """Read one message in the current framing, or return None at end of stream."""
+        if self.framing != 'binary':
+            return self.recv_json(encoding)
+        frame = self.recv_frame()
+        if frame is None:
+            return None
+        return decode_frame(*frame)
+
+
+class SocketConnection(Connection):
+    """Connection over a stream socket."""
+    
+    def __init__(self, sock):
+        super().__init__()
+        self._sock = sock
+    
+    def read_chunk(self):
+        try:
+            return self._sock.recv(READ_SIZE)
+        except ConnectionResetError:
+            return b''
+    
+    def write(self, data):
+        self._sock.sendall(data)
+    
+    def close(self):
+        try:
+            # Wakes a thread blocked reading, and tells the peer now
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+
+
+class NamedPipeConnection(Connection):
+    """Connection over a Windows named pipe handle in byte mode."""
+    
+    def __init__(self, handle):
+        super().__init__()
+        self._handle = handle
+    
+    def read_chunk(self):
+        try:
+            _, data = win32file.ReadFile(self._handle, READ_SIZE)
+        except pywintypes.error as e:
+            if e.args[0] == ERROR_BROKEN_PIPE:
+                return b''
+            raise
+        return data
+    
+    def write(self, data):
+        win32file.WriteFile(self._handle, data)
+    
+    def close(self):
+        win32file.CloseHandle(self._handle)
+
+
+def _remove_stale_socket(path):
+    """Remove a socket left behind by a server that did not shut down cleanly."""
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def connect(transport, pipe_name, socket_path):
+    """Connect to a server on the configured transport."""
+    if transport == 'pipe':
+        _import_win32()
+        handle = win32file.CreateFile(
+            pipe_name,
+            win32file.GENERIC_READ | win32file.GENERIC_WRITE,
+            0,
+            None,
+            win32file.OPEN_EXISTING,
+            0,
+            None
+        )
+        return NamedPipeConnection(handle)
+    if transport == 'unix':
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(socket_path)
+        return SocketConnection(sock)
+    raise ValueError(f"Unknown transport {transport!r}, expected one of {sorted(TRANSPORTS)}")
+
+
+def _parse_request(line, encoding):
+    """Return (msg_obj, None) for a valid request line, else (None, error response)."""
+    try:
+        msg_obj = json.loads(line.decode(encoding))
+        if not isinstance(msg_obj, dict):
+            raise ValueError("expected a JSON object")
+    except ValueError as e:
+        return None, {'status': 'error', 'message': f'Invalid message format: {e}'}
+    return msg_obj, None
+
+
+def _parse_frame(header, body):
+    """Like _parse_request() for a binary frame."""
+    try:
+        return decode_frame(header, body), None
+    except ValueError as e:
+        return None, {'status': 'error', 'message': f'Invalid message format: {e}'}
+
+
+class StreamSender:
+    """Encodes messages for an asyncio stream in the framing negotiated on it."""
+    
+    def __init__(self, writer, encoding='utf-8'):
+        self.writer = writer
+        self.encoding = encoding
+        self.framing = 'json'
+    
+    def encode(self, obj):
+        """Return obj as the bytes of one message."""
+        if self.framing == 'binary':
+            return encode_frame(obj)
+        return json.dumps(obj).encode(self.encoding) + b'\n'
+
+
+class AsyncListener:
+    """Running asyncio server(s) returned by start_server()."""
+    
+    def __init__(self, servers, socket_path=None):
+        self._servers = servers
+        self._socket_path = socket_path
+    
+    def close(self):
+        """Stop accepting connections and remove the socket file, if any."""
+        for server in self._servers:
+            server.close()
+        if self._socket_path is not None:
+            try:
+                os.remove(self._socket_path)
+            except OSError:
+                pass
+
+
+async def start_server(transport, pipe_name, socket_path, client_connected):
+    """Start an asyncio server that runs client_connected(reader, writer) per client."""
+    if transport == 'unix':
+        _remove_stale_socket(socket_path)
+        server = await asyncio.start_unix_server(client_connected, socket_path, limit=MAX_MESSAGE)
+        return AsyncListener([server], socket_path)
+    if transport == 'pipe':
+        loop = asyncio.get_running_loop()
+        # start_serving_pipe() is not a documented asyncio API; README.md
+        # lists the manual Windows check to repeat when this code changes
+        if not hasattr(loop, 'start_serving_pipe'):
+            raise RuntimeError("Named pipes require the Windows proactor event loop")
+        
+        def protocol_factory():
+            reader = asyncio.StreamReader(limit=MAX_MESSAGE)
+            return asyncio.StreamReaderProtocol(reader, client_connected)
+        
+        return AsyncListener(await loop.start_serving_pipe(protocol_factory, pipe_name))
+    raise ValueError(f"Unknown transport {transport!r}, expected one of {sorted(TRANSPORTS)}")
+
+
+async def serve_stream(reader, writer, handle_message, encoding='utf-8', on_received=None,
+                       metrics=None, sender=None):
+    """Answer requests on an asyncio stream until the client disconnects.
+    
+    handle_message is a coroutine function.  Requests are answered in order,
+    so a client may send several before reading any response, and a
+    request's "id" is copied into its response.  Requests are read ahead
+    while earlier ones are handled, and on_received(msg_obj) is called for
+    each as soon as it arrives, so the handler can tell when a queued
+    request has been made obsolete.
+    
+    If metrics (a metrics.Metrics) is given, each request's decode, queue,
+    handle, encode and write times are recorded, along with byte counts.
+    Time spent waiting for a request to arrive is idle time and not recorded.
+    
+    An init request's "framing" is answered in the current framing, then
+    applies to every later message in both directions.  Pass a StreamSender
+    for writer to also write other messages, such as notifications, in the
+    negotiated framing.
+    """
+    if sender is None:
+        sender = StreamSender(writer, encoding)
+    queue = asyncio.Queue()
+    
+    async def read_requests():
+        framing = sender.framing
+        try:
+            while True:
+                if framing == 'binary':
+                    header = await reader.readexactly(FRAME_HEADER.size)
+                    size = frame_size(header)
+                    if size > MAX_MESSAGE:
+                        raise ValueError(size)
+                    body = await reader.readexactly(size)
+                    received = time.perf_counter()
+                    msg_obj, response = _parse_frame(header, body)
+                    size += len(header)
+                else:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    if not line.strip():
+                        continue
+                    received = time.perf_counter()
+                    msg_obj, response = _parse_request(line, encoding)
+                    size = len(line)
+                if metrics is not None:
+                    metrics.record('decode', time.perf_counter() - received)
+                    metrics.count('bytes_read', size)
+                if msg_obj is not None:
+                    # Requests after a negotiating init come in its framing
+                    framing = negotiate_framing(msg_obj) or framing
+                    if on_received is not None:
+                        on_received(msg_obj)
+                queue.put_nowait((msg_obj, response, received))
+        except ValueError:
+            # Request longer than MAX_MESSAGE
+            queue.put_nowait((None, {'status': 'error', 'message': 'Message too long'},
+                              time.perf_counter()))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            queue.put_nowait(None)
+    
+    reading = asyncio.ensure_future(read_requests())
+    try:
+        while True:
+            request = await queue.get()
+            if request is None:
+                break
+            msg_obj, response, received = request
+            started = time.perf_counter()
+            framing = None
+            if msg_obj is not None:
+                framing = negotiate_framing(msg_obj)
+                response = await handle_message(msg_obj)
+                if framing is not None:
+                    response['framing'] = framing
+                if 'id' in msg_obj:
+                    response['id'] = msg_obj['id']
+            handled = time.perf_counter()
+            data = sender.encode(response)
+            encoded = time.perf_counter()
+            writer.write(data)
+            if framing is not None:
+                sender.framing = framing
+            try:
+                await writer.drain()
+            except ConnectionError:
+                # The client left without reading its response
+                break
+            if metrics is not None:
+                written = time.perf_counter()
+                metrics.record('queue', started - received)
+                metrics.record('handle', handled - started)
+                metrics.record('encode', encoded - handled)
+                metrics.record('write', written - encoded)
+                metrics.record('request', written - received)
+                metrics.count('requests')
+                metrics.count('bytes_written', len(data))
+                if msg_obj is None:
+                    metrics.count('invalid_requests')
+    finally:
+        reading.cancel()
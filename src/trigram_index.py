@@ -0,0 +1,217 @@
+"""
+Trigram inverted index for sub-linear substring lookup (platform-independent).
+
+Every three-character substring of the case-folded lines maps to a sorted
+posting list of the line indices that contain it.  A pattern of three or
+more characters can only match lines that appear in the posting list of
+each of its trigrams, so intersecting those lists yields a small candidate
+set that is then verified with a real substring check.
+"""
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+
+
+class TrigramIndex:
+    """Trigram index over a corpus, built incrementally in the background."""
+    
+    # Lines indexed between checks for cancellation
+    BATCH_LINES = 4096
+    # Above this share of the corpus, checking candidates one by one is
+    # slower than scanning the whole corpus, which is searched as one buffer
+    MAX_CANDIDATE_SHARE = 0.1
+    # Posting lists longer than this many times the candidates found so far
+    # are not intersected, nor are lists past this share of the lines the
+    # caller would scan without the index
+    INTERSECT_RATIO = 4
+    INTERSECT_BUDGET = 0.25
+    
+    def __init__(self, corpus, on_complete=None):
+        self._corpus = corpus
+        self._postings = {}
+        # Lines [0, indexed_lines) are in the index; later lines are not yet
+        self.indexed_lines = 0
+        self.complete = False
+        # Called with the index once every line is indexed (e.g. to cache it)
+        self._on_complete = on_complete
+        # Held while a batch is built, so update_line() never runs mid-batch
+        self._batch_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+    
+    @classmethod
+    def from_postings(cls, corpus, postings):
+        """Create a complete index from prebuilt postings (e.g. CachedPostings)."""
+        index = cls(corpus)
+        index._postings = postings
+        index.indexed_lines = len(corpus)
+        index.complete = True
+        return index
+    
+    @property
+    def postings(self):
+        """Mapping of trigram to sorted line indices."""
+        return self._postings
+    
+    def build(self):
+        """Index every remaining line of the corpus."""
+        postings = self._postings
+        fold = self._corpus.fold
+        lines = self._corpus.lines
+        index = self.indexed_lines
+        while not self._stop.is_set() and self._corpus.has_line(index):
+            stop = index + self.BATCH_LINES
+            with self._batch_lock:
+                while index < stop and self._corpus.has_line(index):
+                    line = lines[index]
+                    if fold:
+                        line = fold(line)
+                    for trigram in {line[j:j + 3] for j in range(len(line) - 2)}:
+                        posting = postings.get(trigram)
+                        if posting is None:
+                            posting = postings[trigram] = array('I')
+                        posting.append(index)
+                    index += 1
+                # Publish the batch only after all its postings are appended
+                self.indexed_lines = index
+        if not self._corpus.has_line(index):
+            self.complete = True
+            if self._on_complete is not None:
+                self._on_complete(self)
+    
+    def start(self):
+        """Build the index in a daemon thread so loading does not block."""
+        self._thread = threading.Thread(target=self.build, daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """Stop a background build after the current batch."""
+        self._stop.set()
+    
+    def update(self):
+        """Index lines appended to the corpus after the build completed.
+        
+        A background build still running picks them up by itself.  Prebuilt
+        postings are read-only, so their appended lines stay unindexed.
+        """
+        if self.complete and isinstance(self._postings, dict):
+            # The cache key describes the file as loaded, not as it grew
+            self._on_complete = None
+            self.complete = False
+            self.build()
+    
+    def update_line(self, index):
+        """Index the new text of the last line after the corpus replaced it.
+        
+        Postings of the old text are kept; they only add a candidate that
+        fails the substring check.  Prebuilt postings are read-only, so the
+        line is left unindexed instead.
+        """
+        with self._batch_lock:
+            if index >= self.indexed_lines:
+                # Not indexed yet: the build reads the new text
+                return
+            if not isinstance(self._postings, dict):
+                self.indexed_lines = index
+                return
+            self._on_complete = None
+            line = self._corpus.lines[index]
+            if self._corpus.fold:
+                line = self._corpus.fold(line)
+            postings = self._postings
+            for trigram in {line[j:j + 3] for j in range(len(line) - 2)}:
+                posting = postings.get(trigram)
+                if posting is None:
+                    posting = postings[trigram] = array('I')
+                # The line is the last one, so it can only be at the end
+                if not posting or posting[-1] != index:
+                    posting.append(index)
+    
+    def wait(self):
+        """Block until a background build has finished."""
+        if self._thread is not None:
+            self._thread.join()
+    
+    def candidates(self, search_pattern, cap=None):
+        """Return sorted indices of lines that may contain search_pattern.
+        
+        Returns None when the index cannot narrow the search: patterns
+        shorter than three characters, or when the candidates would be more
+        than MAX_CANDIDATE_SHARE of the corpus, e.g. while most of it is not
+        indexed yet, or at least cap (the size of the set the caller would
+        scan otherwise).  Lines not yet indexed are always included.
+        """
+        if len(search_pattern) < 3:
+            return None
+        indexed = self.indexed_lines
+        if indexed == 0:
+            return None
+        if not self.complete or self._corpus.has_line(indexed):
+            total = len(self._corpus)
+        else:
+            total = indexed
+        limit = total * self.MAX_CANDIDATE_SHARE - (total - indexed)
+        if cap is not None:
+            limit = min(limit, cap - 1 - (total - indexed))
+        if limit < 0:
+            return None
+        
+        lists = []
+        for trigram in {search_pattern[j:j + 3] for j in range(len(search_pattern) - 2)}:
+            posting = self._postings.get(trigram)
+            if posting is None:
+                lists = [array('I')]
+                break
+            lists.append(posting)
+        lists.sort(key=len)
+        
+        smallest, others = lists[0], lists[1:]
+        if cap is not None and len(smallest) >= cap:
+            # Scanning the caller's set costs no more than intersecting
+            return None
+        
+        # Set intersections run in C, unlike bisecting list by list.  Candidates
+        # are checked by the scan anyway, so intersecting stops at a list much
+        # longer than the result so far, or once it has cost a good part of
+        # the scan it is meant to shorten
+        budget = (total if cap is None else cap) * self.INTERSECT_BUDGET
+        work = len(smallest)
+        common = None
+        for posting in others:
+            work += len(posting)
+            size = len(smallest) if common is None else len(common)
+            if len(posting) > self.INTERSECT_RATIO * size or work > budget:
+                break
+            if common is None:
+                common = set(smallest)
+            common.intersection_update(posting)
+        result = smallest if common is None else sorted(common)
+        # Postings may run past indexed_lines while a batch is being built
+        result = result[:bisect_left(result, indexed)]
+        if len(result) > limit:
+            return None
+        
+        result = list(result)
+        result.extend(range(indexed, total))
+        return result
+    
+    def memory_usage(self):
+        """Return approximate bytes held by the index."""
+        postings = self._postings
+        if not isinstance(postings, dict):
+            # Prebuilt postings are mapped from disk rather than on the heap
+            return {
+                'index_bytes': 0,
+                'mapped_index_bytes': postings.nbytes,
+                'trigrams': len(postings),
+                'indexed_lines': self.indexed_lines,
+            }
+        index_bytes = sys.getsizeof(postings)
+        for trigram, posting in list(postings.items()):
+            index_bytes += sys.getsizeof(trigram) + sys.getsizeof(posting)
+        return {
+            'index_bytes': index_bytes,
+            'trigrams': len(postings),
+            'indexed_lines': self.indexed_lines,
+        }
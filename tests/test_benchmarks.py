@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the benchmark corpora and baseline comparison.
+"""
+import unittest
+import sys
+import os
+import tempfile
+
+# Add benchmarks directory to path to import the benchmark modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from corpora import GENERATORS, generate_lines, typing_session, write_corpus
+from run_benchmarks import compare, percentile, run_case
+
+
+class TestBenchmarks(unittest.TestCase):
+    """Test cases for the benchmark helpers."""
+    
+    def test_corpora_are_deterministic(self):
+        """Test that every run measures the same lines."""
+        for kind in GENERATORS:
+            lines = generate_lines(kind, 50)
+            self.assertEqual(lines, generate_lines(kind, 50), kind)
+            self.assertEqual(len(set(lines)), 50, kind)
+            self.assertFalse(any('\n' in line for line in lines), kind)
+    
+    def test_typing_session(self):
+        """Test that a session types, backspaces, clears and pastes."""
+        patterns = typing_session('log')
+        self.assertEqual(patterns[:5], ['e', 'er', 'err', 'erro', 'error'])
+        self.assertEqual(patterns[5:7], ['erro', 'err'])
+        self.assertIn('error timeout', patterns)
+        self.assertEqual(patterns[-2:], ['', 'connection reset'])
+        self.assertIn('error !au', typing_session('log', 'query'))
+    
+    def test_percentile(self):
+        """Test nearest-rank percentiles."""
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 99), 7)
+    
+    def test_compare(self):
+        """Test that only slowdowns beyond tolerance and slack are regressions."""
+        baseline = {'log/10/list': {'p50_ms': 10.0, 'p99_ms': 20.0, 'init_s': 1.0}}
+        results = {
+            'log/10/list': {'p50_ms': 12.0, 'p99_ms': 40.0, 'init_s': 0.5},
+            'code/10/list': {'p50_ms': 99.0},
+        }
+        self.assertEqual(compare(results, baseline), ['log/10/list p99_ms: 40.0 (baseline 20.0)'])
+    
+    def test_run_case(self):
+        """Test a small case end to end, in process and through a server over a socket."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'code.txt')
+            write_corpus(filename, 'code', 200)
+            for engine in ['list', 'protocol', 'binary']:
+                metrics = run_case(filename, 'code', engine, 1)
+                self.assertEqual(metrics['lines'], 200)
+                self.assertEqual(metrics['keystrokes'], len(typing_session('code')))
+                self.assertLessEqual(metrics['p50_ms'], metrics['p99_ms'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the corpus backends.
+"""
+import unittest
+import sys
+import os
+import tempfile
+
+# Add src directory to path to import corpus module
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from corpus import BufferCorpus, LineCorpus, MmapCorpus, create_corpus
+from search_filter import IncrementalSearchFilter
+
+
+class TestBufferCorpus(unittest.TestCase):
+    """Test cases for the single-buffer corpus backend."""
+    
+    def setUp(self):
+        """Set up test data."""
+        self.test_lines = [
+            "apple",
+            "",
+            "banana",
+            "Apple Pie",
+            "BANANA SPLIT",
+            "İstanbul",
+            "Straße",
+        ]
+    
+    def test_lines_round_trip(self):
+        """Test that lines are recovered from the joined buffer."""
+        corpus = BufferCorpus(self.test_lines)
+        self.assertEqual(len(corpus), len(self.test_lines))
+        self.assertEqual(list(corpus.lines), self.test_lines)
+        self.assertEqual(corpus.lines[-1], "Straße")
+        self.assertEqual(corpus.lines[1:3], ["", "banana"])
+        with self.assertRaises(IndexError):
+            corpus.lines[len(self.test_lines)]
+    
+    def test_matches_list_backend(self):
+        """Test that the buffer backend returns the same indices as the list backend."""
+        for case_sensitive, casefold in [(False, False), (True, False), (False, True)]:
+            list_corpus = LineCorpus(self.test_lines, case_sensitive, casefold)
+            buffer_corpus = BufferCorpus(self.test_lines, case_sensitive, casefold)
+            for pattern in ["a", "an", "apple", "Apple", "ss", "stan", "i̇s", "e\nb", "zzz"]:
+                if list_corpus.fold:
+                    pattern = list_corpus.fold(pattern)
+                self.assertEqual(
+                    buffer_corpus.search(pattern),
+                    list_corpus.search(pattern),
+                    (pattern, case_sensitive, casefold),
+                )
+                self.assertEqual(
+                    buffer_corpus.search(pattern, [0, 2, 3]),
+                    list_corpus.search(pattern, [0, 2, 3]),
+                )
+    
+    def test_one_hit_per_line(self):
+        """Test that repeated matches in one line report the line once."""
+        corpus = BufferCorpus(["aaaa", "a", "b"])
+        self.assertEqual(corpus.search("a"), [0, 1])
+        self.assertEqual(corpus.search("aa"), [0])
+    
+    def test_filter_with_buffer_backend(self):
+        """Test the filter API on top of the buffer backend."""
+        filter = IncrementalSearchFilter(self.test_lines, backend='buffer')
+        self.assertEqual(filter.get_selected_line(), "apple")
+        
+        filter.update_filter("ap")
+        self.assertEqual(filter.filtered_lines, ["apple", "Apple Pie"])
+        filter.update_filter("apple ")
+        self.assertEqual(filter.filtered_lines, ["Apple Pie"])
+        self.assertEqual(filter.move_selection(1), "Apple Pie")
+        
+        filter.update_filter("")
+        self.assertEqual(len(filter.filtered_lines), len(self.test_lines))
+        self.assertGreater(filter.memory_usage()['total_bytes'], 0)
+    
+    def test_unknown_backend(self):
+        """Test that an unknown backend name is rejected."""
+        with self.assertRaises(ValueError):
+            create_corpus(self.test_lines, 'nope')
+
+
+class TestMmapCorpus(unittest.TestCase):
+    """Test cases for the memory-mapped corpus backend."""
+    
+    def setUp(self):
+        """Write test data to a temporary file."""
+        self.test_lines = ["apple", "", "banana", "Apple Pie", "BANANA SPLIT", "Straße",
+                           "300 \u212a", "\u0130zmir", "p\u0130"]
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+    
+    def make_corpus(self, content, **kwargs):
+        fd, path = tempfile.mkstemp(dir=self.tmpdir.name)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        corpus = MmapCorpus(path, **kwargs)
+        self.addCleanup(corpus.close)
+        return corpus
+    
+    def test_lines_match_splitlines(self):
+        """Test line boundaries for different line endings."""
+        for content in [b"", b"a", b"a\n", b"a\nb", b"a\r\nb\r\n", b"\n\nx\n"]:
+            corpus = self.make_corpus(content)
+            self.assertEqual(list(corpus.lines), content.decode().splitlines(), content)
+            self.assertEqual(len(corpus), len(content.decode().splitlines()), content)
+    
+    def test_lazy_line_scan(self):
+        """Test that reading the first line does not scan the whole file."""
+        content = "\n".join(f"line {i}" for i in range(100000)).encode()
+        corpus = self.make_corpus(content)
+        corpus.SCAN_CHUNK = 4096
+        self.assertEqual(corpus.line(0), "line 0")
+        self.assertLess(corpus._scanned, len(content))
+        self.assertEqual(len(corpus), 100000)
+    
+    def test_matches_list_backend(self):
+        """Test that byte-level search agrees with the list backend."""
+        content = "\n".join(self.test_lines).encode()
+        for case_sensitive, casefold in [(False, False), (True, False), (False, True)]:
+            list_corpus = LineCorpus(self.test_lines, case_sensitive, casefold)
+            mmap_corpus = self.make_corpus(content, case_sensitive=case_sensitive, casefold=casefold)
+            for pattern in ["a", "an", "apple", "Apple", "ss", "straße", "zzz", "k", "i", "pi", "izmir"]:
+                if list_corpus.fold:
+                    pattern = list_corpus.fold(pattern)
+                self.assertEqual(
+                    mmap_corpus.search(pattern),
+                    list_corpus.search(pattern),
+                    (pattern, case_sensitive, casefold),
+                )
+                self.assertEqual(
+                    mmap_corpus.search(pattern, [0, 2, 3]),
+                    list_corpus.search(pattern, [0, 2, 3]),
+                )
+    
+    def test_filter_with_mmap_corpus(self):
+        """Test the filter API on top of a memory-mapped corpus."""
+        corpus = self.make_corpus("\n".join(self.test_lines).encode())
+        filter = IncrementalSearchFilter(corpus=corpus)
+        self.assertEqual(filter.get_selected_line(), "apple")
+        
+        self.assertEqual(filter.update_filter("banana"), "banana")
+        self.assertEqual(filter.move_selection(1), "BANANA SPLIT")
+        self.assertEqual(filter.update_filter("nothing"), "")
+        self.assertEqual(filter.memory_usage()['mapped_bytes'], corpus._size)
+    
+    def test_unsupported_encoding(self):
+        """Test that encodings whose bytes cannot be matched directly are rejected."""
+        for encoding in ['utf-16', 'cp932', 'shift_jis', 'euc-jp', 'iso2022_jp']:
+            with self.assertRaises(ValueError, msg=encoding):
+                self.make_corpus(b"", encoding=encoding)
+        
+        corpus = self.make_corpus("caf\u00e9\nK\n".encode('cp1252'), encoding='cp1252')
+        self.assertEqual(corpus.search("\u00e9"), [0])
+        self.assertEqual(corpus.search("k"), [1])
+
+
+if __name__ == '__main__':
+    unittest.main()
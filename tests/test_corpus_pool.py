@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the loaded corpus pool.
+"""
+import unittest
+import sys
+import os
+import tempfile
+import threading
+import time
+
+# Add src directory to path to import corpus_pool module
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from corpus_loader import CorpusLoader
+from corpus_pool import CorpusPool
+
+
+class CountingLoader(CorpusLoader):
+    """Loader that counts loads and closes."""
+    
+    def __init__(self):
+        super().__init__()
+        self.loads = 0
+        self.closed = []
+    
+    def load(self, filename):
+        self.loads += 1
+        loaded = super().load(filename)
+        loaded.close = lambda: self.closed.append(loaded)
+        return loaded
+
+
+class TestCorpusPool(unittest.TestCase):
+    """Test cases for CorpusPool."""
+    
+    def setUp(self):
+        """Create two input files."""
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.files = []
+        for name in ['a.txt', 'b.txt']:
+            path = os.path.join(tmpdir.name, name)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(f"{name}\nsecond line\n")
+            self.files.append(path)
+        self.loader = CountingLoader()
+    
+    def test_switching_files_does_not_reload(self):
+        """Test that a pooled file is reused."""
+        pool = CorpusPool(self.loader)
+        a = pool.acquire(self.files[0])
+        pool.release(a)
+        b = pool.acquire(self.files[1])
+        pool.release(b)
+        self.assertIs(pool.acquire(self.files[0]), a)
+        self.assertEqual(self.loader.loads, 2)
+        
+        stats = pool.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+        self.assertAlmostEqual(stats['hit_rate'], 1 / 3)
+        self.assertEqual(stats['entries'], 2)
+        self.assertGreater(stats['resident_bytes'], 0)
+    
+    def test_resident_bytes_include_background_builds(self):
+        """Test that an entry is measured again once its index and masks are built."""
+        with open(self.files[0], 'w', encoding='utf-8') as f:
+            f.write("".join(f"line {i} of the file\n" for i in range(20000)))
+        pool = CorpusPool(CorpusLoader(trigram_index=True, fuzzy_prefilter=True))
+        self.addCleanup(pool.close)
+        loaded = pool.acquire(self.files[0])
+        self.addCleanup(pool.release, loaded)
+        loaded.index.wait()
+        loaded.masks.wait()
+        
+        corpus_bytes = loaded.corpus.memory_usage()['total_bytes']
+        expected = (corpus_bytes + loaded.index.memory_usage()['index_bytes']
+                    + loaded.masks.memory_usage()['mask_bytes'])
+        deadline = time.monotonic() + 5
+        while pool.stats()['resident_bytes'] != expected:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        self.assertGreater(expected, corpus_bytes)
+    
+    def test_changed_file_is_reloaded(self):
+        """Test that a file modified on disk is loaded again."""
+        pool = CorpusPool(self.loader)
+        a = pool.acquire(self.files[0])
+        with open(self.files[0], 'a', encoding='utf-8') as f:
+            f.write("third line\n")
+        a2 = pool.acquire(self.files[0])
+        self.assertIsNot(a2, a)
+        self.assertEqual(len(a2.corpus), 3)
+        self.assertEqual(pool.stats()['invalidations'], 1)
+        
+        # The stale copy is closed once its user releases it
+        self.assertEqual(self.loader.closed, [])
+        pool.release(a)
+        self.assertEqual(self.loader.closed, [a])
+    
+    def test_memory_budget_evicts_lru(self):
+        """Test that the least recently used file is evicted over budget."""
+        pool = CorpusPool(self.loader, memory_budget=1)
+        a = pool.acquire(self.files[0])
+        pool.release(a)
+        b = pool.acquire(self.files[1])
+        self.assertEqual(self.loader.closed, [a])
+        self.assertEqual(pool.stats()['files'], [os.path.abspath(self.files[1])])
+        self.assertEqual(pool.stats()['evictions'], 1)
+        
+        # The only entry is kept even when it exceeds the budget
+        pool.release(b)
+        self.assertEqual(self.loader.closed, [a])
+        pool.close()
+        self.assertEqual(self.loader.closed, [a, b])
+    
+    def test_pinned_entry_is_not_evicted(self):
+        """Test that a pinned file stays loaded over budget, also after a reload."""
+        pool = CorpusPool(self.loader, memory_budget=1)
+        a = pool.acquire(self.files[0], pin=True)
+        pool.release(a)
+        pool.release(pool.acquire(self.files[1]))
+        b = pool.acquire(self.files[1])
+        self.assertEqual(self.loader.closed, [])
+        self.assertEqual(pool.stats()['pinned'], [os.path.abspath(self.files[0])])
+        
+        with open(self.files[0], 'a', encoding='utf-8') as f:
+            f.write("third line\n")
+        pool.release(pool.acquire(self.files[0]))
+        self.assertEqual(self.loader.closed, [a])
+        self.assertEqual(pool.stats()['pinned'], [os.path.abspath(self.files[0])])
+        pool.release(b)
+    
+    def test_concurrent_acquire_loads_once(self):
+        """Test that a file requested while it is loading attaches to that load."""
+        started = threading.Event()
+        finish = threading.Event()
+        load = self.loader.load
+        
+        def slow_load(filename):
+            started.set()
+            finish.wait(5)
+            return load(filename)
+        
+        self.loader.load = slow_load
+        pool = CorpusPool(self.loader)
+        results = []
+        first = threading.Thread(target=lambda: results.append(pool.acquire(self.files[0])))
+        first.start()
+        started.wait(5)
+        second = threading.Thread(target=lambda: results.append(pool.acquire(self.files[0])))
+        second.start()
+        # Give the second request time to find the load in progress
+        time.sleep(0.05)
+        finish.set()
+        first.join()
+        second.join()
+        self.assertIs(results[0], results[1])
+        self.assertEqual(self.loader.loads, 1)
+        self.assertEqual((pool.stats()['hits'], pool.stats()['misses']), (1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
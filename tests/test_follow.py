@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Unit tests for following growing files.
+"""
+import unittest
+import sys
+import os
+import tempfile
+
+# Add src directory to path to import follow module
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from corpus import create_corpus
+from corpus_loader import CorpusLoader
+from corpus_pool import CorpusPool
+from search_filter import IncrementalSearchFilter, SearchCancelled
+from session import FilterSession
+
+
+class TestAppendLines(unittest.TestCase):
+    """Test cases for appending lines to a corpus."""
+    
+    def test_append_lines(self):
+        """Test that appended lines are searchable in every appendable backend."""
+        for backend in ['list', 'buffer']:
+            corpus = create_corpus(["Apple", "banana"], backend)
+            self.assertEqual(corpus.search("a"), [0, 1])
+            corpus.append_lines(["APRICOT", "cherry"])
+            self.assertEqual(len(corpus), 4, backend)
+            self.assertEqual(corpus.line(2), "APRICOT", backend)
+            self.assertEqual(corpus.search("ap"), [0, 2], backend)
+            self.assertEqual(corpus.search("ch", [0, 3]), [3], backend)
+    
+    def test_replace_last_line(self):
+        """Test that the last line can be replaced in every appendable backend."""
+        for backend in ['list', 'buffer']:
+            corpus = create_corpus(["Apple", "ban"], backend)
+            self.assertEqual(corpus.search("banana"), [])
+            corpus.replace_last_line("Banana")
+            corpus.append_lines(["cherry"])
+            self.assertEqual(list(corpus.lines), ["Apple", "Banana", "cherry"], backend)
+            self.assertEqual(corpus.search("banana"), [1], backend)
+    
+    def test_buffer_tail(self):
+        """Test that appended lines kept apart from the buffer search like the rest."""
+        for casefold in [False, True]:
+            corpus = create_corpus(["Straße", "apple", "par"], 'buffer', casefold=casefold)
+            corpus.TAIL_LINES = 2
+            corpus.search("a")
+            expected = ["Straße", "apple", "partial"]
+            corpus.replace_last_line("partial")
+            # Until the tail is joined on, the buffer is not copied
+            buffer = corpus._text
+            for batch in [["STRASSE b"], ["x"], ["ßa", "apple pie"], ["y"]]:
+                corpus.append_lines(batch)
+                expected.extend(batch)
+                self.assertEqual(list(corpus.lines), expected, casefold)
+                reference = create_corpus(expected, 'list', casefold=casefold)
+                for pattern in ["a", "ss", "partial", "apple", "y"]:
+                    pattern = reference.fold(pattern)
+                    self.assertEqual(corpus.search(pattern), reference.search(pattern), (casefold, pattern))
+                    self.assertEqual(corpus.search(pattern, [1, 2, len(expected) - 1]),
+                                     reference.search(pattern, [1, 2, len(expected) - 1]), (casefold, pattern))
+                self.assertEqual(list(corpus.search_lines), list(reference.search_lines))
+                if len(expected) == 4:
+                    self.assertIs(corpus._text, buffer)
+            self.assertEqual(len(corpus.line_offsets()), len(expected) + 1)
+            self.assertEqual(list(corpus.lines), expected)
+    
+    def test_append_to_empty_buffer(self):
+        """Test appending to a buffer corpus without lines."""
+        corpus = create_corpus([], 'buffer')
+        corpus.append_lines(["one", "two"])
+        self.assertEqual(list(corpus.lines), ["one", "two"])
+
+
+class TestFollow(unittest.TestCase):
+    """Test cases for FileFollower and filter refresh."""
+    
+    def setUp(self):
+        """Create an input file and a loader with every index enabled."""
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.filename = os.path.join(tmpdir.name, 'app.log')
+        with open(self.filename, 'w', encoding='utf-8') as f:
+            f.write("start server\nerror: disk full\n")
+        self.loader = CorpusLoader(trigram_index=True, fuzzy_prefilter=True)
+    
+    def append(self, text):
+        with open(self.filename, 'a', encoding='utf-8') as f:
+            f.write(text)
+    
+    def test_poll_adds_complete_lines(self):
+        """Test that only lines ending in a newline are added."""
+        loaded = self.loader.load(self.filename)
+        self.addCleanup(loaded.close)
+        follower = loaded.follow(interval=3600)
+        self.assertEqual(follower.poll(), 0)
+        
+        self.append("error: timeout\nwarn")
+        self.assertEqual(follower.poll(), 1)
+        self.assertEqual(len(loaded.corpus), 3)
+        self.append("ing: slow\n")
+        self.assertEqual(follower.poll(), 1)
+        self.assertEqual(loaded.corpus.line(3), "warning: slow")
+        
+        # The index and masks cover the appended lines
+        loaded.index.wait()
+        loaded.masks.wait()
+        # Narrow the search however many of these few lines are candidates
+        loaded.index.MAX_CANDIDATE_SHARE = 1.0
+        self.assertEqual(loaded.index.candidates("timeout"), [2])
+        self.assertEqual(loaded.masks.candidates("slow"), [3])
+    
+    def test_partial_last_line(self):
+        """Test that a last line loaded while being written is completed, not split."""
+        with open(self.filename, 'w', encoding='utf-8') as f:
+            f.write("start\nerror: par")
+        loaded = self.loader.load(self.filename)
+        self.addCleanup(loaded.close)
+        loaded.index.wait()
+        loaded.masks.wait()
+        loaded.index.MAX_CANDIDATE_SHARE = 1.0
+        follower = loaded.follow(interval=3600)
+        filter = IncrementalSearchFilter(corpus=loaded.corpus, index=loaded.index, masks=loaded.masks)
+        filter.follow()
+        filter.update_filter("error: par")
+        
+        self.append("tial write\nnext\n")
+        self.assertEqual(follower.poll(), 1)
+        self.assertEqual(list(loaded.corpus.lines), ["start", "error: partial write", "next"])
+        self.assertEqual(loaded.index.candidates("write"), [1])
+        self.assertEqual(loaded.masks.candidates("wt"), [1])
+        self.assertTrue(filter.refresh())
+        self.assertEqual(filter.get_selected_line(), "error: partial write")
+        self.assertEqual(filter.filtered_lines, ["error: partial write"])
+        filter.update_filter("error: partial")
+        self.assertEqual(filter.filtered_lines, ["error: partial write"])
+        self.assertFalse(filter.refresh())
+    
+    def test_truncated_file_stops_following(self):
+        """Test that a shrinking file is reported rather than followed."""
+        loaded = self.loader.load(self.filename)
+        self.addCleanup(loaded.close)
+        follower = loaded.follow(interval=3600)
+        calls = []
+        follower.subscribe(lambda: calls.append(None))
+        with open(self.filename, 'w', encoding='utf-8') as f:
+            f.write("new\n")
+        self.assertEqual(follower.poll(), 0)
+        self.assertTrue(follower.truncated)
+        self.assertFalse(loaded.following)
+        self.assertEqual(len(calls), 1)
+    
+    def test_mmap_backend_cannot_follow(self):
+        """Test that following needs a corpus that can grow."""
+        loaded = CorpusLoader(backend='mmap').load(self.filename)
+        self.addCleanup(loaded.close)
+        with self.assertRaises(ValueError):
+            loaded.follow()
+    
+    def test_refresh(self):
+        """Test that refresh checks only appended lines in each search mode."""
+        loaded = self.loader.load(self.filename)
+        self.addCleanup(loaded.close)
+        follower = loaded.follow(interval=3600)
+        filter = IncrementalSearchFilter(corpus=loaded.corpus, index=loaded.index, masks=loaded.masks)
+        filter.follow()
+        filter.update_filter("err")
+        filter.update_filter("error")
+        
+        self.append("error: timeout\ninfo: ok\n")
+        follower.poll()
+        self.assertTrue(filter.refresh())
+        self.assertEqual(filter.filtered_lines, ["error: disk full", "error: timeout"])
+        self.assertFalse(filter.refresh())
+        # The narrowing cache covers the new lines too
+        filter.update_filter("err")
+        self.assertEqual(len(filter.filtered_lines), 2)
+        
+        filter.update_filter_query("error !disk")
+        self.append("error: disk again\n")
+        follower.poll()
+        self.assertFalse(filter.refresh())
+        self.assertEqual(filter.filtered_lines, ["error: timeout"])
+        
+        filter.update_filter_fuzzy("eout", limit=1)
+        self.append("error: out\n")
+        follower.poll()
+        self.assertTrue(filter.refresh())
+        self.assertEqual(filter.filtered_lines, ["error: out"])
+        self.assertEqual(filter.get_results()['count'], 2)
+    
+    def test_refresh_after_cancelled_search(self):
+        """Test that a cancelled search leaves the results shown to be refreshed."""
+        never = lambda: True
+        for update in ['update_filter', 'update_filter_query', 'update_filter_fuzzy']:
+            corpus = create_corpus(["ab1", "ab2", "cd"], 'list')
+            filter = IncrementalSearchFilter(corpus=corpus)
+            filter.follow()
+            getattr(filter, update)("ab")
+            with self.assertRaises(SearchCancelled):
+                getattr(filter, update)("cd", cancelled=never)
+            corpus.append_lines(["ab3"])
+            self.assertTrue(filter.refresh(), update)
+            self.assertEqual(filter.get_results()['count'], 3, update)
+            self.assertIn("ab3", filter.filtered_lines, update)
+    
+    def test_session_update(self):
+        """Test the update notifications of a session following its file."""
+        pool = CorpusPool(self.loader)
+        self.addCleanup(pool.close)
+        session = FilterSession(pool, follow_interval=3600)
+        updates = []
+        session.on_update = lambda: updates.append(session.refresh())
+        response = session.handle_message({'type': 'init', 'filename': self.filename, 'follow': True})
+        self.assertEqual(response['status'], 'ok')
+        session.handle_message({'type': 'search', 'pattern': 'error'})
+        
+        self.append("info: ok\nerror: timeout\n")
+        session.follower.poll()
+        self.assertEqual(updates, [{'type': 'update', 'status': 'ok', 'count': 2,
+                                    'line': 'error: disk full', 'pattern': 'error'}])
+        self.append("info: still ok\n")
+        session.follower.poll()
+        self.assertEqual(updates[-1], None)
+        
+        # Sessions loading the grown file share the followed copy
+        other = FilterSession(pool)
+        other.handle_message({'type': 'init', 'filename': self.filename})
+        self.assertIs(other.loaded, session.loaded)
+        other.close()
+        follower = session.follower
+        session.close()
+        self.assertEqual(follower._subscribers, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Unit tests for fuzzy matching and ranking.
+"""
+import unittest
+import sys
+import os
+
+# Add src directory to path to import fuzzy module
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from corpus import LineCorpus, create_corpus
+from fuzzy import (
+    CharMasks, best_possible, char_mask, compile_pattern, fuzzy_search, is_subsequence, score_match,
+)
+from metrics import Metrics
+from search_filter import IncrementalSearchFilter, SearchCancelled
+
+
+class TestFuzzyMatching(unittest.TestCase):
+    """Test cases for the fuzzy matching functions."""
+    
+    def test_char_mask(self):
+        """Test that a line's mask covers the masks of its subsequences."""
+        line = char_mask("src/main.py")
+        self.assertEqual(line & char_mask("smp"), char_mask("smp"))
+        self.assertNotEqual(line & char_mask("x"), char_mask("x"))
+    
+    def test_is_subsequence(self):
+        """Test the in-order character check."""
+        self.assertTrue(is_subsequence("smp", "src/main.py"))
+        self.assertFalse(is_subsequence("pms", "src/main.py"))
+    
+    def test_scoring_prefers_tight_and_boundary_matches(self):
+        """Test that consecutive and word-start matches score higher."""
+        self.assertGreater(score_match("main", "main.py", 3), score_match("main", "m_a_i_n", 6))
+        self.assertGreater(score_match("mp", "main.py", 5), score_match("mp", "xmxxpx", 4))
+        # The match is tightened to start as late as possible
+        self.assertEqual(score_match("ab", "a--ab", 4), score_match("ab", "ab", 1))
+    
+    def test_masks_include_unmasked_lines(self):
+        """Test that lines not yet masked are always candidates."""
+        corpus = LineCorpus(["abc", "xyz", "abc", "xyz", "abc"])
+        masks = CharMasks(corpus)
+        
+        class StopAfterFirstBatch:
+            def __init__(self):
+                self.checks = 0
+            
+            def is_set(self):
+                self.checks += 1
+                return self.checks > 1
+        
+        masks.BATCH_LINES = 2
+        masks._stop = StopAfterFirstBatch()
+        masks.build()
+        self.assertEqual(masks.masked_lines, 2)
+        self.assertEqual(masks.candidates("ab"), [0, 2, 3, 4])
+        self.assertEqual(masks.candidates("ab", [1, 3]), [3])
+    
+    def test_fuzzy_search_and_top_matches(self):
+        """Test that only the best matches are kept, ties in file order."""
+        corpus = LineCorpus(["m_a_i_n", "main.py", "other", "xmain", "main.c"], casefold=True)
+        masks = CharMasks(corpus)
+        indices, best = fuzzy_search(corpus, masks, "main", limit=2)
+        self.assertEqual(list(indices), [0, 1, 3, 4])
+        self.assertEqual(best, [1, 4])
+        self.assertEqual(fuzzy_search(corpus, masks, "main")[1], [1, 4, 0, 3])
+        self.assertIsNone(fuzzy_search(corpus, masks, "main", cancelled=lambda: True))
+    
+    def test_bounded_scoring(self):
+        """Test that pruning by best_possible() keeps the exact ranking in every backend."""
+        lines = [f"{'x' * (i % 7)}e{'_' * (i % 5)}r r{'y' * (i % 3)} {i}" for i in range(300)]
+        lines += ["err", "Error", "e-r-r"]
+        for pattern in ["e", "er", "err", "r r", "xer"]:
+            for i, line in enumerate(lines):
+                match = compile_pattern(pattern).search(line.lower())
+                if match:
+                    end = match.end() - 1
+                    self.assertGreaterEqual(best_possible(pattern, line.lower(), end),
+                                            score_match(pattern, line.lower(), end), (pattern, line))
+            for backend in ['list', 'buffer']:
+                corpus = create_corpus(lines, backend)
+                masks = CharMasks(corpus)
+                indices, everything = fuzzy_search(corpus, masks, pattern)
+                self.assertEqual(fuzzy_search(corpus, masks, pattern, limit=5), (indices, everything[:5]))
+
+
+class TestFuzzyFilter(unittest.TestCase):
+    """Test cases for IncrementalSearchFilter.update_filter_fuzzy."""
+    
+    def setUp(self):
+        """Set up test data."""
+        self.lines = [
+            "src/server.py",
+            "src/search_filter.py",
+            "tests/test_search.py",
+            "README.md",
+            "src/session.py",
+        ]
+    
+    def test_ranked_results(self):
+        """Test that results are ranked best first and counted in full."""
+        filter = IncrementalSearchFilter(self.lines)
+        self.assertEqual(filter.update_filter_fuzzy("SRCH"), "src/search_filter.py")
+        results = filter.get_results(limit=10)
+        self.assertEqual(results['count'], 2)
+        self.assertEqual(results['lines'], ["src/search_filter.py", "tests/test_search.py"])
+        
+        filter.update_filter_fuzzy("spy", limit=1)
+        self.assertEqual(len(filter.filtered_lines), 1)
+        self.assertEqual(filter.get_results()['count'], 4)
+        
+        # A substring search afterwards counts its own matches
+        filter.update_filter("src")
+        self.assertEqual(filter.get_results()['count'], 3)
+    
+    def test_narrowing_uses_previous_matches(self):
+        """Test that a longer pattern only checks the previous matches."""
+        filter = IncrementalSearchFilter(self.lines)
+        filter.update_filter_fuzzy("ss")
+        base = filter._fuzzy_stack[-1][1]
+        filter.update_filter_fuzzy("ssn")
+        self.assertTrue(set(filter._fuzzy_stack[-1][1]) <= set(base))
+        self.assertEqual(filter.get_selected_line(), "src/session.py")
+        
+        # A pattern that is not an extension starts over
+        filter.update_filter_fuzzy("rd")
+        self.assertEqual([entry[0] for entry in filter._fuzzy_stack], ["rd"])
+    
+    def test_same_pattern_reuses_ranking(self):
+        """Test that searching the same pattern again does not rank it again."""
+        metrics = Metrics()
+        filter = IncrementalSearchFilter(self.lines, metrics=metrics)
+        filter.update_filter_fuzzy("spy", limit=2)
+        ranked = list(filter.filtered_lines)
+        filter.update_filter("s")
+        filter.update_filter_fuzzy("spy", limit=2)
+        self.assertEqual(list(filter.filtered_lines), ranked)
+        self.assertEqual(filter.get_results()['count'], 4)
+        counters = metrics.snapshot()['counters']
+        self.assertEqual(counters['cache_hits'], 1)
+        self.assertEqual(counters['full_scans'], 2)
+        
+        # Another limit ranks the same matches again
+        filter.update_filter_fuzzy("spy", limit=1)
+        self.assertEqual(len(filter.filtered_lines), 1)
+        self.assertEqual(metrics.snapshot()['counters']['narrowed_scans'], 1)
+    
+    def test_cancelled(self):
+        """Test that a cancelled fuzzy search keeps the previous results."""
+        filter = IncrementalSearchFilter(self.lines)
+        filter.update_filter_fuzzy("readme")
+        with self.assertRaises(SearchCancelled):
+            filter.update_filter_fuzzy("srv", lambda: True)
+        self.assertEqual(filter.current_pattern, "readme")
+        self.assertEqual(filter.get_selected_line(), "README.md")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the on-disk index cache and cached corpus loading.
+"""
+import unittest
+import sys
+import os
+import tempfile
+import time
+from array import array
+
+# Add src directory to path to import index_cache module
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from corpus_loader import CorpusLoader
+from index_cache import (
+    CachedPostings, IndexCache, file_fingerprint, load_offsets, offsets_parts, postings_parts,
+)
+from search_filter import IncrementalSearchFilter
+
+
+class TestIndexCache(unittest.TestCase):
+    """Test cases for IndexCache."""
+    
+    def setUp(self):
+        """Create a source file and an empty cache directory."""
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.source = os.path.join(tmpdir.name, 'input.txt')
+        with open(self.source, 'w', encoding='utf-8') as f:
+            f.write("apple\nBanana\nStraße\n")
+        self.cache = IndexCache(os.path.join(tmpdir.name, 'cache'))
+    
+    def test_round_trip(self):
+        """Test storing and loading an artifact."""
+        fingerprint = file_fingerprint(self.source)
+        offsets = array('Q', [0, 6, 13, 21])
+        self.assertTrue(self.cache.store(self.source, 'offsets', fingerprint, offsets_parts(offsets)))
+        artifact = self.cache.load(self.source, 'offsets', fingerprint)
+        self.assertEqual(list(load_offsets(artifact)), list(offsets))
+        self.assertIsNone(self.cache.load(self.source, 'other', fingerprint))
+    
+    def test_changed_file_invalidates(self):
+        """Test that artifacts are ignored once the source file changes."""
+        fingerprint = file_fingerprint(self.source)
+        self.cache.store(self.source, 'offsets', fingerprint, [array('Q', [0])])
+        with open(self.source, 'a', encoding='utf-8') as f:
+            f.write("cherry\n")
+        self.assertIsNone(self.cache.load(self.source, 'offsets', file_fingerprint(self.source)))
+        
+        # Same size and mtime but different content
+        size, mtime_ns, _ = fingerprint
+        self.assertIsNone(self.cache.load(self.source, 'offsets', (size, mtime_ns, b'x' * 16)))
+    
+    def test_lru_eviction(self):
+        """Test that the least recently used artifacts are evicted first."""
+        fingerprint = file_fingerprint(self.source)
+        payload = [b'x' * 1000]
+        self.cache.max_bytes = 2500
+        for kind in ['a', 'b']:
+            self.cache.store(self.source, kind, fingerprint, payload)
+        # Make 'a' older than 'b', then use it
+        path_a = self.cache._path(self.source, 'a')
+        os.utime(path_a, (1, 1))
+        os.utime(self.cache._path(self.source, 'b'), (2, 2))
+        self.assertIsNotNone(self.cache.load(self.source, 'a', fingerprint))
+        
+        self.cache.store(self.source, 'c', fingerprint, payload)
+        self.assertIsNotNone(self.cache.load(self.source, 'a', fingerprint))
+        self.assertIsNone(self.cache.load(self.source, 'b', fingerprint))
+        self.assertIsNotNone(self.cache.load(self.source, 'c', fingerprint))
+    
+    def test_cached_postings(self):
+        """Test trigram postings lookups from a mapped artifact."""
+        fingerprint = file_fingerprint(self.source)
+        postings = {'app': array('I', [0, 4]), 'ße': array('I', [2]), 'ban': array('I', [1])}
+        self.cache.store(self.source, 'trigrams', fingerprint, postings_parts(postings))
+        cached = CachedPostings(self.cache.load(self.source, 'trigrams', fingerprint))
+        self.assertEqual(len(cached), 3)
+        self.assertEqual(list(cached.get('app')), [0, 4])
+        self.assertEqual(list(cached.get('ße')), [2])
+        self.assertIsNone(cached.get('zzz'))
+
+
+class TestCachedLoading(unittest.TestCase):
+    """Test cases for CorpusLoader with a cache directory."""
+    
+    def setUp(self):
+        """Create a source file and a loader with a cache."""
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.source = os.path.join(tmpdir.name, 'input.txt')
+        with open(self.source, 'w', encoding='utf-8') as f:
+            f.write("apple\nStraße\nBANANA SPLIT\nbanana\n")
+        self.cache = IndexCache(os.path.join(tmpdir.name, 'cache'))
+    
+    def load(self, **kwargs):
+        loader = CorpusLoader(cache=self.cache, **kwargs)
+        loaded = loader.load(self.source)
+        self.addCleanup(loaded.close)
+        if loaded.index is not None:
+            loaded.index.wait()
+        return loaded
+    
+    def test_second_load_uses_cache(self):
+        """Test that a repeat load reuses offsets, folded copy and index."""
+        first = self.load(backend='mmap', casefold=True, trigram_index=True)
+        # Wait for the background cache fill
+        for _ in range(200):
+            if first.corpus._folded is not None:
+                break
+            time.sleep(0.01)
+        self.assertIsNotNone(first.corpus._folded)
+        
+        second = self.load(backend='mmap', casefold=True, trigram_index=True)
+        self.assertTrue(second.corpus._complete)
+        self.assertIsNotNone(second.corpus._folded)
+        self.assertIsInstance(second.index.postings, CachedPostings)
+        
+        filter = IncrementalSearchFilter(corpus=second.corpus, index=second.index)
+        self.assertEqual(filter.update_filter("STRASSE"), "Straße")
+        self.assertEqual(filter.update_filter("banana"), "BANANA SPLIT")
+        self.assertEqual(len(filter.filtered_lines), 2)
+        self.assertIn('mapped_index_bytes', filter.memory_usage())
+    
+    def wait_for(self, kind):
+        fingerprint = file_fingerprint(self.source)
+        for _ in range(200):
+            if self.cache.load(self.source, kind, fingerprint):
+                return True
+            time.sleep(0.01)
+        return False
+    
+    def test_buffer_reuses_line_offsets(self):
+        """Test that a repeat buffer load takes its line offsets from the cache."""
+        first = self.load(backend='buffer')
+        self.assertTrue(self.wait_for('line-starts-utf-8'))
+        second = self.load(backend='buffer')
+        self.assertEqual(list(second.corpus.lines), list(first.corpus.lines))
+        self.assertEqual(second.corpus.line_offsets(), first.corpus.line_offsets())
+        filter = IncrementalSearchFilter(corpus=second.corpus)
+        self.assertEqual(filter.update_filter("banana"), "BANANA SPLIT")
+        second.append_lines(["banana bread"])
+        self.assertEqual(len(filter.corpus.search("banana")), 3)
+        
+        # Other line boundaries are not in the file text as they are in the buffer
+        with open(self.source, 'wb') as f:
+            f.write(b"apple\r\nbanana\r\n")
+        self.load(backend='buffer')
+        self.assertFalse(self.wait_for('line-starts-utf-8'))
+
+
+if __name__ == '__main__':
+    unittest.main()
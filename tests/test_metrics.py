@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the request metrics and the sampling profiler.
+"""
+import asyncio
+import unittest
+import sys
+import os
+import threading
+import time
+
+# Add src directory to path to import the metrics modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from metrics import Histogram, Metrics
+from profiler import SamplingProfiler
+from server import PipeServer
+
+
+def busy_loop(stop):
+    """Keep a thread busy until stop is set."""
+    while not stop.is_set():
+        sum(range(1000))
+
+
+class TestMetrics(unittest.TestCase):
+    """Test cases for counters and histograms."""
+    
+    def test_histogram(self):
+        """Test totals over every sample and percentiles over the recent window."""
+        histogram = Histogram(window=100)
+        for ms in range(1, 201):
+            histogram.record(ms / 1000)
+        snapshot = histogram.snapshot()
+        self.assertEqual(snapshot['count'], 200)
+        self.assertEqual(snapshot['total_ms'], 20100.0)
+        self.assertEqual(snapshot['max_ms'], 200.0)
+        self.assertEqual(snapshot['p50_ms'], 151.0)
+        self.assertEqual(snapshot['p99_ms'], 200.0)
+        self.assertEqual(Histogram().snapshot()['p50_ms'], 0.0)
+    
+    def test_counters_and_spans(self):
+        """Test counting and timing from several threads."""
+        metrics = Metrics()
+        
+        def work():
+            for _ in range(1000):
+                metrics.count('hits')
+            with metrics.span('work'):
+                time.sleep(0.01)
+        
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        metrics.count('lines', 5)
+        
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['counters'], {'hits': 4000, 'lines': 5})
+        self.assertEqual(snapshot['timings']['work']['count'], 4)
+        self.assertGreaterEqual(snapshot['timings']['work']['p50_ms'], 10)
+    
+    def test_span_records_on_error(self):
+        """Test that a span that raises is still timed."""
+        metrics = Metrics()
+        with self.assertRaises(KeyError):
+            with metrics.span('failing'):
+                raise KeyError('x')
+        self.assertEqual(metrics.snapshot()['timings']['failing']['count'], 1)
+
+
+class TestSamplingProfiler(unittest.TestCase):
+    """Test cases for the sampling profiler."""
+    
+    def test_finds_busy_function(self):
+        """Test that a busy thread's function tops the report and idle threads are skipped."""
+        stop = threading.Event()
+        busy = threading.Thread(target=busy_loop, args=(stop,))
+        idle = threading.Thread(target=stop.wait)
+        busy.start()
+        idle.start()
+        profiler = SamplingProfiler(0.001)
+        profiler.start()
+        self.assertTrue(profiler.running)
+        # Reports can be taken while the sampler adds to the counts
+        deadline = time.monotonic() + 0.2
+        while time.monotonic() < deadline:
+            profiler.report()
+        profiler.stop()
+        stop.set()
+        busy.join()
+        idle.join()
+        
+        self.assertFalse(profiler.running)
+        report = profiler.report(limit=5)
+        self.assertGreater(report['samples'], 0)
+        functions = [entry['function'] for entry in report['functions']]
+        self.assertTrue(any(f.startswith('busy_loop (test_metrics.py:') for f in functions), functions)
+        self.assertFalse(any(f.startswith('wait ') for f in functions), functions)
+    
+    def test_profile_messages(self):
+        """Test that invalid profile requests get an error response."""
+        server = PipeServer('test', transport='unix', socket_path='unused')
+        
+        def request(**msg_obj):
+            return asyncio.run(server.handle_message(None, {'type': 'profile', **msg_obj}))
+        
+        self.assertEqual(request()['message'], 'Profiler was never started')
+        for interval in [0, -1, 'x', True, None]:
+            response = request(action='start', interval=interval)
+            self.assertEqual(response['status'], 'error', interval)
+            self.assertIsNone(server.profiler)
+        
+        self.assertEqual(request(action='start', interval=0.001), {'status': 'ok', 'profiling': True})
+        self.addCleanup(server.profiler.stop)
+        for limit in ['x', 0, -5, 1.5]:
+            self.assertEqual(request(limit=limit)['status'], 'error', limit)
+        self.assertTrue(server.profiler.running)
+        response = request(action='stop', limit=3)
+        self.assertEqual(response['status'], 'ok')
+        self.assertFalse(response['profiling'])
+
+
+if __name__ == '__main__':
+    unittest.main()
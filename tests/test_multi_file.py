@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the multi-file corpus helpers.
+"""
+import unittest
+import sys
+import os
+import tempfile
+
+# Add src directory to path to import multi_file module
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from corpus import BufferCorpus
+from corpus_loader import CorpusLoader
+from corpus_pool import CorpusPool
+from multi_file import FileSet, read_files, read_files_joined
+from parallel_scan import ScanPool
+
+
+class TestMultiFile(unittest.TestCase):
+    """Test cases for FileSet, FileTable and read_files."""
+    
+    def setUp(self):
+        """Create a small directory tree."""
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.root = tmpdir.name
+        self.write('b.txt', "bravo one\nbravo two\n")
+        self.write('a.py', "alpha\n")
+        self.write('empty.txt', "")
+        self.write('src/c.py', "charlie one\ncharlie two\ncharlie three\n")
+        self.write('build/d.py', "delta\n")
+        self.write('.git/config', "[core]\n")
+        with open(os.path.join(self.root, 'logo.png'), 'wb') as f:
+            f.write(b'\x89PNG\0\0data')
+    
+    def write(self, name, text):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+    
+    def names(self, file_set):
+        return [file_set.display_name(name) for name in file_set.expand()]
+    
+    def test_directory_walk(self):
+        """Test walk order, default excludes and include/exclude globs."""
+        self.assertEqual(self.names(FileSet(directory=self.root)),
+                         ['a.py', 'b.txt', 'empty.txt', 'logo.png', 'build/d.py', 'src/c.py'])
+        self.assertEqual(self.names(FileSet(directory=self.root, include=['*.py'], exclude=['build'])),
+                         ['a.py', 'src/c.py'])
+        self.assertEqual(self.names(FileSet(directory=self.root, include=['src/*'])), ['src/c.py'])
+        
+        with self.assertRaises(ValueError):
+            FileSet()
+        with self.assertRaises(TypeError):
+            FileSet(files='a.py')
+    
+    def test_read_files(self):
+        """Test that lines are concatenated and mapped back to their files."""
+        lines, files, skipped = read_files(FileSet(directory=self.root, exclude=['build']), workers=2)
+        self.assertEqual(lines, ['alpha', 'bravo one', 'bravo two',
+                                 'charlie one', 'charlie two', 'charlie three'])
+        self.assertEqual(skipped, ['logo.png'])
+        self.assertEqual(files.skipped, ['logo.png'])
+        self.assertEqual(len(files), 4)
+        self.assertEqual(files.locate(0), ('a.py', 1))
+        self.assertEqual(files.locate(2), ('b.txt', 2))
+        # The empty file owns no lines
+        self.assertEqual(files.locate(3), ('src/c.py', 1))
+        self.assertEqual(files.locate(5), ('src/c.py', 3))
+        self.assertEqual(files.name_of(4), 'src/c.py')
+    
+    def test_read_files_joined(self):
+        """Test that worker processes build the same buffer a list of lines would."""
+        file_set = FileSet(directory=self.root, exclude=['build'])
+        lines, _, _ = read_files(file_set)
+        pool = ScanPool(2)
+        self.addCleanup(pool.close)
+        text, offsets, files, skipped = read_files_joined(file_set, pool)
+        corpus = BufferCorpus.from_text(text, offsets)
+        self.assertEqual(list(corpus.lines), lines)
+        self.assertEqual(corpus.search('one'), [1, 3])
+        self.assertEqual(skipped, ['logo.png'])
+        self.assertEqual(files.locate(3), ('src/c.py', 1))
+        
+        loader = CorpusLoader(backend='buffer', load_workers=2)
+        self.addCleanup(loader.close)
+        loader.LOAD_POOL_BYTES = 0
+        loaded = loader.load(file_set)
+        self.addCleanup(loaded.close)
+        self.assertIsNotNone(loader.load_pool)
+        self.assertEqual(list(loaded.corpus.lines), lines)
+    
+    def test_pooled_file_set(self):
+        """Test that a file set is pooled and reloaded when one of its files changes."""
+        pool = CorpusPool(CorpusLoader(backend='mmap'))
+        self.addCleanup(pool.close)
+        file_set = FileSet(files=[os.path.join(self.root, 'a.py'), os.path.join(self.root, 'b.txt')])
+        loaded = pool.acquire(file_set)
+        self.assertEqual(list(loaded.corpus.lines), ['alpha', 'bravo one', 'bravo two'])
+        self.assertEqual(loaded.files.locate(1), (os.path.join(self.root, 'b.txt'), 1))
+        with self.assertRaises(ValueError):
+            loaded.follow()
+        pool.release(loaded)
+        
+        again = FileSet(files=[os.path.join(self.root, 'a.py'), os.path.join(self.root, 'b.txt')])
+        self.assertIs(pool.acquire(again), loaded)
+        pool.release(loaded)
+        self.write('b.txt', "bravo\n")
+        self.assertEqual(len(pool.acquire(again).corpus), 2)
+        self.assertEqual(pool.stats()['invalidations'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
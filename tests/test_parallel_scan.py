@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the parallel scan engine.
+"""
+import unittest
+import sys
+import os
+
+# Add src directory to path to import parallel_scan module
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from corpus import BufferCorpus, LineCorpus
+import parallel_scan
+from parallel_scan import ParallelCorpus, ScanPool, _scan_range
+from search_filter import IncrementalSearchFilter
+
+
+class TestParallelCorpus(unittest.TestCase):
+    """Test cases for ParallelCorpus on a small worker pool."""
+    
+    @classmethod
+    def setUpClass(cls):
+        """Start one pool for all tests."""
+        cls.pool = ScanPool(2)
+    
+    @classmethod
+    def tearDownClass(cls):
+        """Stop the pool."""
+        cls.pool.close()
+    
+    def setUp(self):
+        """Set up test data."""
+        self.test_lines = [f"Line {i} {'Straße' if i % 7 == 0 else 'road'}" for i in range(5000)]
+        self.test_lines[1234] = ""
+    
+    def make_corpus(self, base, threshold=0):
+        corpus = ParallelCorpus(base, self.pool, chunk_size=4096, threshold=threshold)
+        self.addCleanup(corpus.close)
+        return corpus
+    
+    def test_matches_serial_scan(self):
+        """Test that parallel results equal the serial backend, in order."""
+        for casefold in [False, True]:
+            serial = LineCorpus(self.test_lines, casefold=casefold)
+            parallel = self.make_corpus(LineCorpus(self.test_lines, casefold=casefold))
+            candidates = serial.search(serial.fold("1"))
+            for pattern in ["line 1", "99", "straße", "strasse", "road", "zzz"]:
+                pattern = serial.fold(pattern)
+                self.assertEqual(parallel.search(pattern), serial.search(pattern), pattern)
+                self.assertEqual(
+                    parallel.search(pattern, candidates),
+                    serial.search(pattern, candidates),
+                    pattern,
+                )
+        self.assertGreater(len(parallel._chunks), 1)
+        self.assertGreater(parallel.memory_usage()['shared_bytes'], 0)
+    
+    def test_below_threshold_stays_serial(self):
+        """Test that small scans never build the shared segment."""
+        corpus = self.make_corpus(BufferCorpus(self.test_lines), threshold=len(self.test_lines) + 1)
+        self.assertEqual(corpus.search("line 4999"), [4999])
+        self.assertIsNone(corpus._shm)
+    
+    def test_appended_lines(self):
+        """Test that lines appended after the shared copy was made are still scanned."""
+        new_lines = ["new road", "Line 5001 road"]
+        serial = LineCorpus(self.test_lines + new_lines)
+        corpus = self.make_corpus(LineCorpus(list(self.test_lines)))
+        corpus.search("road")
+        corpus.append_lines(new_lines)
+        candidates = list(range(4990, 5002))
+        for pattern in ["road", "line 500"]:
+            self.assertEqual(corpus.search(pattern), serial.search(pattern), pattern)
+            self.assertEqual(corpus.search(pattern, candidates), serial.search(pattern, candidates))
+        self.assertEqual(corpus.search("new"), [5000])
+    
+    def test_abandoned_scan_skips_queued_chunks(self):
+        """Test that a scan's token ends when the caller stops iterating, so workers skip its chunks."""
+        corpus = self.make_corpus(LineCorpus(self.test_lines))
+        chunks = corpus.search_chunks("road")
+        self.assertTrue(next(chunks))
+        self.assertEqual(len(self.pool._free_slots), parallel_scan.CANCEL_SLOTS - 1)
+        chunks.close()
+        self.assertEqual(len(self.pool._free_slots), parallel_scan.CANCEL_SLOTS)
+        
+        # Run a worker task in this process
+        parallel_scan._init_worker(self.pool._tokens)
+        self.addCleanup(parallel_scan._init_worker, None)
+        self.addCleanup(lambda: parallel_scan._attached.pop(corpus._shm.name).close())
+        slot, token = self.pool.begin()
+        task = (corpus._shm.name, corpus._offsets_at, corpus._count, slot, token,
+                0, corpus._chunks[0][1], b'road')
+        self.assertTrue(_scan_range(task))
+        self.pool.end(slot)
+        self.assertEqual(_scan_range(task), [])
+    
+    def test_filter_with_parallel_corpus(self):
+        """Test the filter API, including narrowing, on a parallel corpus."""
+        filter = IncrementalSearchFilter(corpus=self.make_corpus(LineCorpus(self.test_lines)))
+        self.assertEqual(filter.update_filter("line 3"), "Line 3 road")
+        self.assertEqual(len(filter.filtered_lines), 1111)
+        self.assertEqual(filter.update_filter("line 31"), "Line 31 road")
+        self.assertEqual(len(filter.filtered_lines), 111)
+        self.assertEqual(filter.update_filter_progressive("line 4"), "Line 4 road")
+        self.assertEqual(filter.get_results(wait=True)['count'], 1111)
+
+
+if __name__ == '__main__':
+    unittest.main()
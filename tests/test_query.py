@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the multi-term query language.
+"""
+import unittest
+import sys
+import os
+
+# Add src directory to path to import query module
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from query import QueryError, Term, compile_query, parse_term
+from search_filter import IncrementalSearchFilter
+
+
+class TestQueryPlan(unittest.TestCase):
+    """Test cases for parsing and planning queries."""
+    
+    def test_parse_term(self):
+        """Test the term syntax."""
+        self.assertEqual(parse_term("Foo", str.lower), Term('substring', 'foo', False))
+        self.assertEqual(parse_term("!^Src", str.lower), Term('prefix', 'src', True))
+        self.assertEqual(parse_term("re:/\\d+MS/", str.lower), Term('regex', '\\d+MS', False))
+        self.assertEqual(parse_term("!re:/ab", None), Term('regex', 'ab', True))
+        self.assertEqual(parse_term("!", None), Term('substring', '!', False))
+    
+    def test_plan_is_cached(self):
+        """Test that the same pattern reuses its compiled plan."""
+        self.assertIs(compile_query("foo re:/x+/"), compile_query("foo re:/x+/"))
+        self.assertIsNot(compile_query("foo"), compile_query("foo", case_sensitive=True))
+    
+    def test_driver_is_longest_literal_term(self):
+        """Test that the longest positive literal term is scanned for."""
+        self.assertEqual(compile_query("ab !longest ^abc re:/x/ abcd").driver.text, "abcd")
+        self.assertEqual(compile_query("^src re:/x/").driver, Term('prefix', 'src', False))
+        self.assertIsNone(compile_query("!foo re:/x/").driver)
+    
+    def test_narrows(self):
+        """Test which query changes keep the previous matches valid."""
+        self.assertTrue(compile_query("foo bar").narrows(compile_query("foo")))
+        self.assertTrue(compile_query("foo barx").narrows(compile_query("foo bar")))
+        self.assertTrue(compile_query("^srcx").narrows(compile_query("^src")))
+        self.assertTrue(compile_query("^src").narrows(compile_query("sr")))
+        self.assertFalse(compile_query("foo !barx").narrows(compile_query("foo !bar")))
+        self.assertFalse(compile_query("re:/ab/").narrows(compile_query("re:/a/")))
+        self.assertFalse(compile_query("foo").narrows(compile_query("foo bar")))
+    
+    def test_invalid_regex(self):
+        """Test that a bad regex raises QueryError."""
+        with self.assertRaises(QueryError):
+            compile_query("re:/(/")
+
+
+class TestQueryFilter(unittest.TestCase):
+    """Test cases for IncrementalSearchFilter.update_filter_query."""
+    
+    def setUp(self):
+        """Set up test data."""
+        self.lines = [
+            "src/server.py 12ms",
+            "src/search.py 3ms",
+            "tests/test_search.py 40ms",
+            "README.md",
+            "Src/barfoo.py",
+        ]
+    
+    def test_terms(self):
+        """Test AND, NOT, prefix and regex terms in every backend."""
+        cases = {
+            "src": [0, 1, 4],
+            "src !bar": [0, 1],
+            "^src re:/\\d+ms/": [0, 1],
+            "!^src": [2, 3],
+            "py !re:/\\d/": [4],
+            "re:/^SRC/": [0, 1, 4],
+        }
+        for backend in ['list', 'buffer']:
+            filter = IncrementalSearchFilter(self.lines, backend=backend)
+            for pattern, expected in cases.items():
+                filter.update_filter_query(pattern)
+                self.assertEqual(filter.filtered_lines, [self.lines[i] for i in expected], (backend, pattern))
+    
+    def test_case_sensitive(self):
+        """Test that every term kind honours case sensitivity."""
+        filter = IncrementalSearchFilter(self.lines, case_sensitive=True)
+        filter.update_filter_query("^Src re:/bar/")
+        self.assertEqual(filter.filtered_lines, ["Src/barfoo.py"])
+        filter.update_filter_query("re:/SRC/")
+        self.assertEqual(filter.filtered_lines, [])
+    
+    def test_appended_term_narrows(self):
+        """Test that appending a term only checks the previous matches."""
+        filter = IncrementalSearchFilter(self.lines)
+        filter.update_filter_query("py")
+        self.assertEqual(len(filter._query_stack), 1)
+        filter.update_filter_query("py ^src")
+        filter.update_filter_query("py ^src !bar")
+        self.assertEqual([len(indices) for _, indices in filter._query_stack], [4, 3, 2])
+        self.assertEqual(filter.get_selected_line(), "src/server.py 12ms")
+        
+        # Editing the negated term invalidates only that level
+        filter.update_filter_query("py ^src !barx")
+        self.assertEqual([len(indices) for _, indices in filter._query_stack], [4, 3, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,11 +6,15 @@ These tests verify the search functionality without requiring Windows named pipe
 import unittest
 import sys
 import os
+from array import array
+from unittest import mock
 
 # Add src directory to path to import search_filter module
 sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
 
-from search_filter import IncrementalSearchFilter
+import corpus
+from metrics import Metrics
+from search_filter import IncrementalSearchFilter, SearchCancelled
 
 
 class TestIncrementalSearchFilter(unittest.TestCase):
@@ -163,6 +167,252 @@ class TestIncrementalSearchFilter(unittest.TestCase):
         # Selection should be reset to 0 since filtered list only has 2 items
         self.assertEqual(filter.selected_index, 0)
     
+    def test_narrowing_reuses_previous_matches(self):
+        """Test that extending the pattern only scans the previous result set."""
+        filter = IncrementalSearchFilter(self.test_lines)
+        
+        filter.update_filter("an")
+        self.assertEqual(len(filter.filtered_lines), 2)
+        
+        # Lines outside the "an" result set are never rescanned
+        self.test_lines[0] = "banana bread"
+        filter.update_filter("ana")
+        self.assertEqual(filter.filtered_lines, ["banana", "BANANA SPLIT"])
+    
+    def test_backspace_pops_cached_matches(self):
+        """Test that backspacing returns the cached result set."""
+        filter = IncrementalSearchFilter(self.test_lines)
+        
+        filter.update_filter("a")
+        filter.update_filter("ap")
+        filter.update_filter("app")
+        self.assertEqual(len(filter._narrowing_stack), 3)
+        
+        result = filter.update_filter("ap")
+        self.assertIn(result, ["apple", "grape", "Apple Pie"])
+        self.assertEqual(len(filter.filtered_lines), 3)
+        self.assertEqual(len(filter._narrowing_stack), 2)
+        
+        # Unrelated pattern discards the stack
+        filter.update_filter("fig")
+        self.assertEqual(filter.filtered_lines, ["fig"])
+        self.assertEqual(len(filter._narrowing_stack), 1)
+    
+    def test_metrics(self):
+        """Test that scans and narrowing cache hits are counted."""
+        metrics = Metrics()
+        filter = IncrementalSearchFilter(self.test_lines, metrics=metrics)
+        
+        filter.update_filter("a")
+        filter.update_filter("an")
+        filter.update_filter("a")
+        self.assertEqual(metrics.snapshot()['counters'], {
+            'full_scans': 1,
+            'narrowed_scans': 1,
+            'lines_scanned': 6,
+            'cache_hits': 1,
+        })
+    
+    def test_peek(self):
+        """Test that peeking finds the line a search would select and leaves the filter as it was."""
+        filter = IncrementalSearchFilter(self.test_lines)
+        filter.update_filter("a")
+        filter.update_filter("an")
+        filter.move_selection(1)
+        stack = list(filter._narrowing_stack)
+        
+        # The selection keeps its position, or goes back to the first match
+        self.assertEqual(filter.peek("a"), "banana")
+        self.assertEqual(filter.peek("e"), "cherry")
+        self.assertEqual(filter.peek("split"), "BANANA SPLIT")
+        self.assertEqual(filter.peek("xyz"), "")
+        self.assertEqual(filter.peek(""), "apple")
+        self.assertEqual(filter._narrowing_stack, stack)
+        self.assertEqual(filter.current_pattern, "an")
+        self.assertEqual(filter.get_selected_line(), "BANANA SPLIT")
+        
+        for pattern in ["a", "e", "split"]:
+            peeked = filter.peek(pattern)
+            self.assertEqual(filter.update_filter(pattern), peeked, pattern)
+            filter.update_filter("an")
+            filter.move_selection(1)
+    
+    def test_folded_corpus_built_once(self):
+        """Test that the lowercase corpus is built lazily and reused."""
+        filter = IncrementalSearchFilter(self.test_lines)
+        self.assertIsNone(filter.corpus._search_lines)
+        
+        filter.update_filter("a")
+        folded = filter.corpus.search_lines
+        self.assertEqual(folded[7], "apple pie")
+        # Already-lowercase lines share the original string
+        self.assertIs(folded[0], self.test_lines[0])
+        
+        filter.update_filter("b")
+        self.assertIs(filter.corpus.search_lines, folded)
+    
+    def test_casefold_option(self):
+        """Test Unicode case folding matches beyond lower()."""
+        lines = ["Straße", "STRASSE", "street"]
+        
+        filter = IncrementalSearchFilter(lines)
+        filter.update_filter("strasse")
+        self.assertEqual(filter.filtered_lines, ["STRASSE"])
+        
+        filter = IncrementalSearchFilter(lines, casefold=True)
+        filter.update_filter("strasse")
+        self.assertEqual(filter.filtered_lines, ["Straße", "STRASSE"])
+    
+    def test_memory_usage(self):
+        """Test memory accounting of the folded copy."""
+        filter = IncrementalSearchFilter(self.test_lines)
+        self.assertEqual(filter.memory_usage()['folded_bytes'], 0)
+        
+        filter.update_filter("a")
+        usage = filter.memory_usage()
+        self.assertGreater(usage['folded_bytes'], 0)
+        self.assertEqual(usage['total_bytes'], usage['original_bytes'] + usage['folded_bytes'])
+        
+        # Case-sensitive search reuses the original lines
+        filter = IncrementalSearchFilter(self.test_lines, case_sensitive=True)
+        filter.update_filter("a")
+        self.assertEqual(filter.memory_usage()['folded_bytes'], 0)
+    
+    def test_progressive_search(self):
+        """Test that a progressive search returns early and finishes in the background."""
+        lines = [f"line {i}" for i in range(1000)]
+        with mock.patch.object(corpus, 'CHUNK_LINES', 10):
+            filter = IncrementalSearchFilter(lines)
+            result = filter.update_filter_progressive("line 1")
+            self.assertEqual(result, "line 1")
+            
+            results = filter.get_results(limit=2, wait=True)
+            self.assertTrue(results['complete'])
+            self.assertEqual(results['count'], 111)
+            self.assertEqual(results['lines'], ["line 1", "line 10"])
+            self.assertEqual(len(filter.filtered_lines), 111)
+            
+            # The finished result is cached for narrowing
+            filter.update_filter_progressive("line 19")
+            self.assertEqual(filter.get_results(wait=True)['count'], 11)
+            self.assertEqual(filter.update_filter_progressive("line 1"), "line 1")
+            self.assertEqual(filter.get_results()['count'], 111)
+    
+    def test_progressive_search_cancelled_by_new_pattern(self):
+        """Test that a newer pattern replaces a running progressive search."""
+        lines = [f"line {i}" for i in range(1000)]
+        with mock.patch.object(corpus, 'CHUNK_LINES', 10):
+            filter = IncrementalSearchFilter(lines)
+            filter.update_filter_progressive("line")
+            self.assertEqual(filter.update_filter("line 999"), "line 999")
+            self.assertEqual(filter.get_results()['count'], 1)
+            self.assertEqual(filter.move_selection(1), "line 999")
+    
+    def test_cancelled_search_keeps_progressive_search(self):
+        """Test that a cancelled search leaves a running progressive search to finish."""
+        # Enough chunks that the background scan is still running
+        lines = [f"line {i}" for i in range(200000)]
+        with mock.patch.object(corpus, 'CHUNK_LINES', 10):
+            filter = IncrementalSearchFilter(lines)
+            filter.update_filter_progressive("line")
+            with self.assertRaises(SearchCancelled):
+                filter.update_filter("line 9", lambda: True)
+            self.assertEqual(filter.current_pattern, "line")
+            results = filter.get_results(wait=True)
+            self.assertEqual((results['count'], results['complete']), (200000, True))
+    
+    def test_progressive_typing_narrows(self):
+        """Test that typing on during a progressive search narrows its results instead of rescanning."""
+        lines = [f"line {i}" for i in range(200000)]
+        metrics = Metrics()
+        with mock.patch.object(corpus, 'CHUNK_LINES', 10):
+            filter = IncrementalSearchFilter(lines, metrics=metrics)
+            for pattern in ["l", "li", "lin", "line", "line 1", "line 12"]:
+                filter.update_filter_progressive(pattern)
+            results = filter.get_results(limit=2, wait=True)
+            self.assertEqual((results['count'], results['lines']), (11111, ["line 12", "line 120"]))
+            counters = metrics.snapshot()['counters']
+            self.assertEqual((counters['full_scans'], counters['narrowed_scans']), (1, 5))
+            # Backspacing finds every shorter pattern on the stack
+            self.assertEqual(filter.update_filter_progressive("line 1"), "line 1")
+            self.assertEqual(filter.get_results()['count'], 111111)
+            self.assertEqual(metrics.snapshot()['counters']['cache_hits'], 1)
+            
+            # A cancelled search leaves the one it took over scanning
+            filter.update_filter_progressive("line")
+            with self.assertRaises(SearchCancelled):
+                filter.update_filter_progressive("line 9", lambda: True)
+            results = filter.get_results(wait=True)
+            self.assertEqual((results['count'], results['complete']), (200000, True))
+    
+    def test_progressive_search_without_matches(self):
+        """Test a progressive search that finds nothing."""
+        filter = IncrementalSearchFilter(self.test_lines)
+        self.assertEqual(filter.update_filter_progressive("xyz"), "")
+        self.assertEqual(filter.get_results(), {'count': 0, 'complete': True, 'lines': []})
+    
+    def test_cancelled_search_keeps_previous_results(self):
+        """Test that a cancelled scan stops and leaves the old pattern in place."""
+        lines = [f"line {i}" for i in range(1000)]
+        with mock.patch.object(corpus, 'CHUNK_LINES', 10):
+            filter = IncrementalSearchFilter(lines)
+            filter.update_filter("line 5")
+            polls = []
+            
+            def cancelled():
+                polls.append(None)
+                return len(polls) > 3
+            
+            with self.assertRaises(SearchCancelled):
+                filter.update_filter("line 9", cancelled)
+            self.assertEqual(len(polls), 4)
+            self.assertEqual(filter.current_pattern, "line 5")
+            self.assertEqual(len(filter.filtered_lines), 111)
+            
+            with self.assertRaises(SearchCancelled):
+                filter.update_filter_progressive("line 9", lambda: True)
+            self.assertEqual(filter.current_pattern, "line 5")
+            self.assertEqual(filter.update_filter("line 9", lambda: False), "line 9")
+    
+    def test_window(self):
+        """Test paging through matches around the selection."""
+        lines = [f"line {i}" for i in range(100)]
+        filter = IncrementalSearchFilter(lines)
+        window = filter.get_window(limit=10)
+        self.assertEqual((window['offset'], window['count'], window['selected']), (0, 100, 0))
+        self.assertEqual(window['lines'], lines[:10])
+        
+        filter.move_selection(50)
+        window = filter.get_window(limit=10)
+        self.assertEqual((window['offset'], window['lines'][5]), (45, "line 50"))
+        filter.move_selection(100)
+        self.assertEqual(filter.get_window(limit=10)['lines'], lines[90:])
+        
+        filter.update_filter("line 1")
+        window = filter.get_window(offset=5, limit=3)
+        self.assertEqual(window, {'offset': 5, 'count': 11, 'complete': True, 'selected': 0,
+                                  'lines': ["line 14", "line 15", "line 16"]})
+        self.assertEqual(list(filter.matches), [1] + list(range(10, 20)))
+        
+        for offset, limit in [(-1, 3), (0, -1), (None, -5)]:
+            with self.assertRaises(ValueError):
+                filter.get_window(offset, limit)
+    
+    def test_matches_are_indices(self):
+        """Test that results are kept as an index array with a lazy line view."""
+        filter = IncrementalSearchFilter(self.test_lines)
+        self.assertIsNone(filter.matches)
+        self.assertIs(filter.filtered_lines, filter.original_lines)
+        
+        filter.update_filter("an")
+        self.assertEqual(filter.matches, array('I', [1, 8]))
+        self.assertEqual(filter.filtered_lines[-1], "BANANA SPLIT")
+        self.assertEqual(filter.filtered_lines[:1], ["banana"])
+        filter.update_filter_fuzzy("bn")
+        self.assertEqual(filter.matches, array('I', [1, 8]))
+        filter.update_filter_query("an !split")
+        self.assertEqual(filter.filtered_lines, ["banana"])
+    
     def test_empty_lines(self):
         """Test behavior with empty line list."""
         filter = IncrementalSearchFilter([])
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the non-blocking search client.
+"""
+import asyncio
+import unittest
+import sys
+import os
+import queue
+import socket
+import tempfile
+import threading
+import time
+
+# Add src directory to path to import search_client module
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from corpus_loader import CorpusLoader
+from corpus_pool import CorpusPool
+from search_client import SearchClient
+from session import FilterSession
+from transport import SocketConnection, serve_stream
+
+
+class TestSearchClient(unittest.TestCase):
+    """Test cases for SearchClient against a session served over a socket pair."""
+    
+    def setUp(self):
+        """Serve a session over a socket pair and connect a client to it."""
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.filename = os.path.join(tmpdir.name, 'input.txt')
+        with open(self.filename, 'w', encoding='utf-8') as f:
+            f.write("apple pie\nbanana split\napple juice\ncherry tart\n")
+        pool = CorpusPool(CorpusLoader())
+        self.addCleanup(pool.close)
+        self.session = FilterSession(pool)
+        self.addCleanup(self.session.close)
+        self.requests = []
+        
+        async def handle_message(msg_obj):
+            self.requests.append(msg_obj)
+            return self.session.handle_message(msg_obj)
+        
+        server_sock, client_sock = socket.socketpair()
+        self.server_sock = server_sock
+        
+        async def serve():
+            reader, writer = await asyncio.open_connection(sock=server_sock)
+            await serve_stream(reader, writer, handle_message)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+        
+        thread = threading.Thread(target=asyncio.run, args=(serve(),), daemon=True)
+        thread.start()
+        self.results = queue.Queue()
+        self.client = SearchClient(SocketConnection(client_sock), self.results.put, debounce=0.01)
+        self.addCleanup(thread.join, 5)
+        self.addCleanup(self.client.close)
+        response = self.client.init(self.filename)
+        self.assertEqual(response['framing'], 'binary')
+    
+    def result(self):
+        """Return the next response passed to on_result."""
+        return self.results.get(timeout=5)
+    
+    def searches(self):
+        """Return the patterns of the searches the server has received."""
+        return [r['pattern'] for r in self.requests if r['type'] == 'search']
+    
+    def test_burst_is_debounced(self):
+        """Test that only the last pattern of a burst of keys is sent."""
+        self.client.debounce = 0.5
+        for pattern in ['a', 'ap', 'app', 'appl', 'apple']:
+            self.client.search(pattern)
+        self.assertEqual(self.result(), {'status': 'ok', 'line': 'apple pie', 'pattern': 'apple'})
+        self.assertEqual(self.searches(), ['apple'])
+    
+    def test_cached_pattern_is_answered_locally(self):
+        """Test that backspacing is answered from the cache and the prefetched peek."""
+        self.client.search('ch')
+        self.assertEqual(self.result()['line'], 'cherry tart')
+        self.client.search('cherry')
+        self.assertEqual(self.result()['line'], 'cherry tart')
+        # The client peeks at "cherr" after the search for "cherry"
+        deadline = time.monotonic() + 5
+        while 'cherr' not in self.client._cache:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        
+        # Answered in the calling thread, before the server sees the pattern
+        self.client.debounce = 60
+        for pattern in ['ch', 'cherr']:
+            self.client.search(pattern)
+            self.assertEqual(self.results.get_nowait(), {'status': 'ok', 'line': 'cherry tart', 'pattern': pattern})
+        self.assertEqual(self.searches(), ['ch', 'cherry'])
+    
+    def test_unchanged_text_sends_nothing(self):
+        """Test that keys which leave the pattern alone, like arrows, are ignored."""
+        self.client.search('apple')
+        self.result()
+        self.client.search('apple')
+        self.client.search('apple')
+        self.assertEqual(self.client.request({'type': 'move', 'delta': 1})['line'], 'apple juice')
+        self.assertEqual(self.searches(), ['apple'])
+    
+    def test_request_waits_for_pending_search(self):
+        """Test that a request is sent after the search typed before it."""
+        self.client.debounce = 60
+        self.client.search('an')
+        response = self.client.request({'type': 'results', 'limit': 5})
+        self.assertEqual(response['lines'], ['banana split'])
+        self.assertEqual(self.result()['pattern'], 'an')
+    
+    def test_closed_connection_fails_requests(self):
+        """Test that requests fail once the server has gone."""
+        self.server_sock.shutdown(socket.SHUT_RDWR)
+        self.client._reader.join(5)
+        with self.assertRaises(ConnectionError):
+            self.client.request({'type': 'results'})
+
+
+if __name__ == '__main__':
+    unittest.main()
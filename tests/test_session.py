@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Unit tests for per-connection filter sessions.
+"""
+import unittest
+import sys
+import os
+import tempfile
+
+# Add src directory to path to import session module
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from corpus_loader import CorpusLoader
+from corpus_pool import CorpusPool
+from session import FilterSession
+
+
+class TestFilterSession(unittest.TestCase):
+    """Test cases for FilterSession."""
+    
+    def setUp(self):
+        """Create an input file and a shared pool."""
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.filename = os.path.join(tmpdir.name, 'input.txt')
+        with open(self.filename, 'w', encoding='utf-8') as f:
+            f.write("apple pie\nbanana split\napple juice\ncherry tart\n")
+        self.pool = CorpusPool(CorpusLoader())
+        self.addCleanup(self.pool.close)
+    
+    def test_sessions_have_independent_state(self):
+        """Test that two sessions share the corpus but not the pattern."""
+        a = FilterSession(self.pool)
+        b = FilterSession(self.pool)
+        for session in (a, b):
+            response = session.handle_message({'type': 'init', 'filename': self.filename})
+            self.assertEqual(response, {'status': 'ok', 'line': 'apple pie'})
+        self.assertIs(a.filter.corpus, b.filter.corpus)
+        
+        self.assertEqual(a.handle_message({'type': 'search', 'pattern': 'apple'})['line'], 'apple pie')
+        self.assertEqual(b.handle_message({'type': 'search', 'pattern': 'tart'})['line'], 'cherry tart')
+        self.assertEqual(a.handle_message({'type': 'move', 'delta': 1})['line'], 'apple juice')
+        self.assertEqual(b.handle_message({'type': 'results'})['count'], 1)
+        self.assertEqual(a.handle_message({'type': 'results'})['count'], 2)
+    
+    def test_close_releases_corpus(self):
+        """Test that a closed session gives its corpus back to the pool."""
+        session = FilterSession(self.pool)
+        session.handle_message({'type': 'init', 'filename': self.filename})
+        loaded = session.loaded
+        session.close()
+        self.assertIsNone(session.filter)
+        self.assertIs(self.pool.acquire(self.filename), loaded)
+    
+    def test_superseded_search_is_skipped(self):
+        """Test that a queued search is skipped once a newer one has arrived."""
+        session = FilterSession(self.pool)
+        session.handle_message({'type': 'init', 'filename': self.filename})
+        first = {'type': 'search', 'pattern': 'ban'}
+        second = {'type': 'search', 'pattern': 'cherry'}
+        session.on_received(first)
+        session.on_received(second)
+        self.assertEqual(session.handle_message(first), {'status': 'superseded', 'pattern': 'ban'})
+        self.assertEqual(
+            session.handle_message(second),
+            {'status': 'ok', 'line': 'cherry tart', 'pattern': 'cherry'},
+        )
+        self.assertEqual(session.handle_message({'type': 'move', 'delta': 1})['pattern'], 'cherry')
+    
+    def test_peek(self):
+        """Test that a peek answers like a search without changing the session."""
+        session = FilterSession(self.pool)
+        session.handle_message({'type': 'init', 'filename': self.filename})
+        session.handle_message({'type': 'search', 'pattern': 'apple'})
+        session.handle_message({'type': 'move', 'delta': 1})
+        self.assertEqual(
+            session.handle_message({'type': 'peek', 'pattern': 'appl'}),
+            {'status': 'ok', 'line': 'apple juice', 'pattern': 'appl'},
+        )
+        self.assertEqual(session.handle_message({'type': 'peek', 'pattern': 'juice'})['line'], 'apple juice')
+        self.assertEqual(session.handle_message({'type': 'results'})['count'], 2)
+        self.assertEqual(session.handle_message({'type': 'move', 'delta': 0})['line'], 'apple juice')
+        
+        # A search waiting behind the peek goes first
+        search = {'type': 'search', 'pattern': 'cherry'}
+        session.on_received(search)
+        self.assertEqual(session.handle_message({'type': 'peek', 'pattern': 'b'})['status'], 'superseded')
+        session.handle_message(search)
+        self.assertEqual(session.handle_message({'type': 'peek', 'pattern': 'b'})['line'], 'banana split')
+        self.assertEqual(session.handle_message({'type': 'peek', 'pattern': 'b', 'mode': 'fuzzy'})['status'], 'error')
+    
+    def test_fuzzy_mode(self):
+        """Test that the mode field selects ranked fuzzy matching."""
+        session = FilterSession(self.pool, fuzzy_limit=1)
+        session.handle_message({'type': 'init', 'filename': self.filename})
+        response = session.handle_message({'type': 'search', 'pattern': 'aple', 'mode': 'fuzzy'})
+        self.assertEqual(response, {'status': 'ok', 'line': 'apple pie', 'pattern': 'aple'})
+        results = session.handle_message({'type': 'results', 'limit': 5})
+        self.assertEqual((results['count'], results['lines']), (2, ['apple pie']))
+        self.assertEqual(session.handle_message({'type': 'search', 'pattern': 'a', 'mode': 'regex'})['status'], 'error')
+    
+    def test_window(self):
+        """Test the window request, windows attached to search and move, and negative pages."""
+        session = FilterSession(self.pool)
+        session.handle_message({'type': 'init', 'filename': self.filename})
+        response = session.handle_message({'type': 'search', 'pattern': 'apple', 'window': 5})
+        self.assertEqual(response['window']['lines'], ['apple pie', 'apple juice'])
+        response = session.handle_message({'type': 'move', 'delta': 1, 'window': 1})
+        self.assertEqual(response['window']['lines'], ['apple juice'])
+        self.assertNotIn('window', session.handle_message({'type': 'move', 'delta': 0}))
+        
+        response = session.handle_message({'type': 'window', 'offset': 1})
+        self.assertEqual(response, {'status': 'ok', 'offset': 1, 'count': 2, 'complete': True,
+                                    'selected': 1, 'lines': ['apple juice'], 'pattern': 'apple'})
+        
+        for request in [{'type': 'window', 'offset': -1}, {'type': 'window', 'limit': -1},
+                        {'type': 'move', 'delta': 0, 'window': -1},
+                        {'type': 'results', 'offset': -1}, {'type': 'results', 'limit': -1}]:
+            response = session.handle_message(request)
+            self.assertEqual(response['status'], 'error')
+            self.assertTrue(response['message'].startswith('Invalid message format'), response)
+    
+    def test_multiple_files(self):
+        """Test that a directory init searches every file and names the file of each line."""
+        directory = os.path.dirname(self.filename)
+        with open(os.path.join(directory, 'more.txt'), 'w', encoding='utf-8') as f:
+            f.write("banana bread\napple crumble\n")
+        session = FilterSession(self.pool, follow=True)
+        response = session.handle_message({'type': 'init', 'directory': directory})
+        self.assertEqual(response, {'status': 'ok', 'line': 'apple pie', 'file_count': 2,
+                                    'file': 'input.txt', 'line_number': 1})
+        
+        response = session.handle_message({'type': 'search', 'pattern': 'banana', 'window': 5})
+        self.assertEqual((response['line'], response['file'], response['line_number']),
+                         ('banana split', 'input.txt', 2))
+        self.assertEqual(response['window']['files'], ['input.txt', 'more.txt'])
+        response = session.handle_message({'type': 'move', 'delta': 1})
+        self.assertEqual((response['line'], response['file'], response['line_number']),
+                         ('banana bread', 'more.txt', 1))
+        response = session.handle_message({'type': 'peek', 'pattern': 'crumble'})
+        self.assertEqual((response['file'], response['line_number']), ('more.txt', 2))
+        response = session.handle_message({'type': 'results', 'limit': 10})
+        self.assertEqual(response['files'], ['input.txt', 'more.txt'])
+        
+        response = session.handle_message({'type': 'init', 'files': [self.filename], 'follow': True})
+        self.assertEqual(response, {'status': 'error', 'message': 'Follow mode needs a single file'})
+        response = session.handle_message({'type': 'init', 'files': self.filename})
+        self.assertEqual(response['status'], 'error')
+    
+    def test_errors(self):
+        """Test responses to requests that cannot be served."""
+        session = FilterSession(self.pool)
+        self.assertEqual(session.handle_message({'type': 'search', 'pattern': 'a'})['message'], 'No file loaded')
+        self.assertEqual(session.handle_message({'type': 'init', 'filename': self.filename + '.missing'})['status'], 'error')
+        self.assertEqual(session.handle_message({'type': 'bogus'})['status'], 'error')
+        
+        # An unexpected failure is answered and leaves the session usable
+        session.handle_message({'type': 'init', 'filename': self.filename})
+        
+        def fail(delta):
+            raise OSError("disk gone")
+        
+        session.filter.move_selection = fail
+        self.assertEqual(session.handle_message({'type': 'move', 'delta': 1}),
+                         {'status': 'error', 'message': 'Internal error: disk gone'})
+        self.assertEqual(session.handle_message({'type': 'search', 'pattern': 'cherry'})['line'], 'cherry tart')
+
+
+if __name__ == '__main__':
+    unittest.main()
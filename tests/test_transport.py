@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the connection transports.
+"""
+import asyncio
+import unittest
+import sys
+import os
+import socket
+import tempfile
+import threading
+
+# Add src directory to path to import transport module
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from metrics import Metrics
+from transport import (
+    FRAME_HEADER, SocketConnection, connect, decode_frame, encode_frame, serve_stream, start_server,
+)
+
+
+def echo_handler(msg_obj):
+    """Answer every request with its pattern."""
+    return {'status': 'ok', 'line': msg_obj.get('pattern', '')}
+
+
+class TestConnection(unittest.TestCase):
+    """Test cases for newline-delimited framing."""
+    
+    def setUp(self):
+        """Create a connected pair of socket connections."""
+        a, b = socket.socketpair()
+        self.left = SocketConnection(a)
+        self.right = SocketConnection(b)
+        self.addCleanup(self.left.close)
+        self.addCleanup(self.right.close)
+    
+    def test_lines_split_across_reads(self):
+        """Test that several lines in one write and partial writes are framed."""
+        self.left.write(b'first\nsec')
+        self.left.write(b'ond\nthird')
+        self.left.close()
+        self.assertEqual(self.right.recv_line(), b'first')
+        self.assertEqual(self.right.recv_line(), b'second')
+        # A final unterminated line is still returned
+        self.assertEqual(self.right.recv_line(), b'third')
+        self.assertIsNone(self.right.recv_line())
+    
+    def test_large_message(self):
+        """Test that messages larger than one read are not truncated."""
+        lines = ['x' * 100000, 'y' * 70000]
+        writer = threading.Thread(target=self.left.send_json, args=({'lines': lines},))
+        writer.start()
+        self.assertEqual(self.right.recv_json(), {'lines': lines})
+        writer.join()
+    
+    def test_binary_frames(self):
+        """Test that messages with and without lines survive binary framing."""
+        messages = [
+            {'status': 'ok', 'count': 3, 'lines': ['a', '', 'é 日本 \r'], 'id': 1},
+            {'status': 'ok', 'line': 'x', 'window': {'offset': 0, 'lines': ['']}},
+            {'status': 'ok', 'lines': []},
+            {'type': 'search', 'pattern': 'foo\nbar'},
+            {'status': 'ok', 'lines': ['x' * 100000] * 3},
+        ]
+        self.left.framing = self.right.framing = 'binary'
+        writer = threading.Thread(target=lambda: [self.left.send_message(m) for m in messages])
+        writer.start()
+        self.assertEqual([self.right.recv_message() for _ in messages], messages)
+        writer.join()
+        self.left.close()
+        self.assertIsNone(self.right.recv_message())
+    
+    def test_malformed_frames(self):
+        """Test that frames whose header does not match their body are rejected."""
+        frame = encode_frame({'lines': ['a', 'b']})
+        header, body = frame[:FRAME_HEADER.size], frame[FRAME_HEADER.size:]
+        self.assertEqual(decode_frame(header, body), {'lines': ['a', 'b']})
+        field, metadata_size, payload_size, _ = FRAME_HEADER.unpack(header)
+        with self.assertRaises(ValueError):
+            decode_frame(FRAME_HEADER.pack(field, metadata_size, payload_size, 3), body)
+        with self.assertRaises(ValueError):
+            decode_frame(FRAME_HEADER.pack(2, metadata_size, payload_size, 2), body)
+
+
+class TestUnixSocketTransport(unittest.TestCase):
+    """Test cases for a blocking client of an asyncio server on a Unix socket."""
+    
+    def setUp(self):
+        """Start a server for echo_handler in an event loop thread and connect to it."""
+        if not hasattr(socket, 'AF_UNIX'):
+            self.skipTest("AF_UNIX sockets are not available")
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.path = os.path.join(tmpdir.name, 'server.sock')
+        # Set when serve_stream() has returned and the stream is closed
+        self.served = threading.Event()
+        
+        async def handle_message(msg_obj):
+            return echo_handler(msg_obj)
+        
+        async def client_connected(reader, writer):
+            await serve_stream(reader, writer, handle_message)
+            writer.close()
+            await writer.wait_closed()
+            self.served.set()
+        
+        loop = asyncio.new_event_loop()
+        listener = loop.run_until_complete(start_server('unix', None, self.path, client_connected))
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        
+        def stop():
+            loop.call_soon_threadsafe(listener.close)
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(5)
+            loop.close()
+        
+        self.addCleanup(stop)
+        self.connection = connect('unix', None, self.path)
+        self.addCleanup(self.served.wait, 5)
+        self.addCleanup(self.connection.close)
+    
+    def test_pipelined_requests_keep_order_and_ids(self):
+        """Test that several requests sent at once are answered in order."""
+        for i, pattern in enumerate(['a', 'ab', 'abc']):
+            self.connection.send_json({'type': 'search', 'pattern': pattern, 'id': i})
+        responses = [self.connection.recv_json() for _ in range(3)]
+        self.assertEqual(
+            responses,
+            [{'status': 'ok', 'line': p, 'id': i} for i, p in enumerate(['a', 'ab', 'abc'])],
+        )
+    
+    def test_connection_stays_open(self):
+        """Test that one connection serves requests after an invalid one."""
+        self.connection.send_line(b'not json')
+        self.assertEqual(self.connection.recv_json()['status'], 'error')
+        self.connection.send_json({'type': 'search', 'pattern': 'x'})
+        self.assertEqual(self.connection.recv_json(), {'status': 'ok', 'line': 'x'})
+    
+    def test_binary_framing(self):
+        """Test that an init negotiates binary frames for the messages after it."""
+        self.connection.send_json({'type': 'init', 'framing': 'binary', 'id': 1})
+        self.assertEqual(self.connection.recv_json(),
+                         {'status': 'ok', 'line': '', 'framing': 'binary', 'id': 1})
+        self.connection.framing = 'binary'
+        self.connection.send_message({'type': 'search', 'pattern': 'ü\nx'})
+        self.assertEqual(self.connection.recv_message(), {'status': 'ok', 'line': 'ü\nx'})
+        # An unknown framing falls back to JSON
+        self.connection.send_message({'type': 'init', 'framing': 'msgpack'})
+        self.assertEqual(self.connection.recv_message()['framing'], 'json')
+        self.connection.framing = 'json'
+        self.connection.send_json({'type': 'search', 'pattern': 'y'})
+        self.assertEqual(self.connection.recv_json(), {'status': 'ok', 'line': 'y'})
+    
+    def test_server_stops_when_client_disconnects(self):
+        """Test that serve_stream returns at end of stream."""
+        self.connection.close()
+        self.assertTrue(self.served.wait(5))
+    
+    def test_unknown_transport(self):
+        """Test that an unknown transport is rejected."""
+        with self.assertRaises(ValueError):
+            asyncio.run(start_server('tcp', None, None, None))
+        with self.assertRaises(ValueError):
+            connect('tcp', None, None)
+
+
+class TestAsyncServer(unittest.TestCase):
+    """Test cases for the asyncio server functions."""
+    
+    def setUp(self):
+        """Create a socket path."""
+        if not hasattr(socket, 'AF_UNIX'):
+            self.skipTest("AF_UNIX sockets are not available")
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.path = os.path.join(tmpdir.name, 'server.sock')
+    
+    def test_concurrent_clients(self):
+        """Test that a slow request does not hold up another client."""
+        async def handle_message(msg_obj):
+            if msg_obj['pattern'] == 'slow':
+                await asyncio.sleep(0.5)
+            return echo_handler(msg_obj)
+        
+        handlers = []
+        
+        async def client_connected(reader, writer):
+            handlers.append(asyncio.current_task())
+            await serve_stream(reader, writer, handle_message)
+            writer.close()
+            await writer.wait_closed()
+        
+        async def request(pattern):
+            reader, writer = await asyncio.open_unix_connection(self.path)
+            writer.write(f'{{"pattern": "{pattern}", "id": 1}}\n'.encode())
+            response = await reader.readline()
+            writer.close()
+            await writer.wait_closed()
+            return pattern, response
+        
+        async def run():
+            listener = await start_server('unix', None, self.path, client_connected)
+            order = []
+            for task in asyncio.as_completed([request('slow'), request('fast')]):
+                order.append(await task)
+            await asyncio.gather(*handlers)
+            listener.close()
+            return order
+        
+        order = asyncio.run(run())
+        self.assertEqual([pattern for pattern, _ in order], ['fast', 'slow'])
+        self.assertEqual(order[0][1], b'{"status": "ok", "line": "fast", "id": 1}\n')
+        self.assertFalse(os.path.exists(self.path))
+    
+    def test_requests_read_ahead(self):
+        """Test that on_received sees later requests while one is handled."""
+        received = []
+        seen_while_handling = []
+        
+        async def handle_message(msg_obj):
+            await asyncio.sleep(0.1)
+            seen_while_handling.append(len(received))
+            return echo_handler(msg_obj)
+        
+        async def run():
+            reader, writer = await asyncio.open_unix_connection(self.path)
+            writer.write(b'{"pattern": "a"}\n{"pattern": "ab"}\n')
+            responses = [await reader.readline(), await reader.readline()]
+            writer.close()
+            await writer.wait_closed()
+            return responses
+        
+        async def main():
+            done = asyncio.Event()
+            
+            async def client_connected(reader, writer):
+                await serve_stream(reader, writer, handle_message, on_received=received.append)
+                writer.close()
+                await writer.wait_closed()
+                done.set()
+            
+            listener = await start_server('unix', None, self.path, client_connected)
+            responses = await run()
+            await done.wait()
+            listener.close()
+            return responses
+        
+        responses = asyncio.run(main())
+        self.assertEqual([r['pattern'] for r in received], ['a', 'ab'])
+        self.assertEqual(seen_while_handling, [2, 2])
+        self.assertEqual(responses[1], b'{"status": "ok", "line": "ab"}\n')
+    
+    def test_metrics(self):
+        """Test that every request's stages are timed and its bytes counted."""
+        metrics = Metrics()
+        
+        async def handle_message(msg_obj):
+            await asyncio.sleep(0.05)
+            return echo_handler(msg_obj)
+        
+        async def main():
+            done = asyncio.Event()
+            
+            async def client_connected(reader, writer):
+                await serve_stream(reader, writer, handle_message, metrics=metrics)
+                writer.close()
+                await writer.wait_closed()
+                done.set()
+            
+            listener = await start_server('unix', None, self.path, client_connected)
+            reader, writer = await asyncio.open_unix_connection(self.path)
+            writer.write(b'{"pattern": "a"}\nnot json\n')
+            responses = [await reader.readline(), await reader.readline()]
+            writer.close()
+            await writer.wait_closed()
+            await done.wait()
+            listener.close()
+            return responses
+        
+        responses = asyncio.run(main())
+        snapshot = metrics.snapshot()
+        counters = snapshot['counters']
+        self.assertEqual(counters['requests'], 2)
+        self.assertEqual(counters['invalid_requests'], 1)
+        self.assertEqual(counters['bytes_read'], len(b'{"pattern": "a"}\nnot json\n'))
+        self.assertEqual(counters['bytes_written'], sum(map(len, responses)))
+        timings = snapshot['timings']
+        for stage in ['decode', 'queue', 'handle', 'encode', 'write', 'request']:
+            self.assertEqual(timings[stage]['count'], 2, stage)
+        self.assertGreaterEqual(timings['handle']['max_ms'], 50)
+        # The invalid request waited for the slow one
+        self.assertGreaterEqual(timings['queue']['max_ms'], 40)
+    
+    def test_binary_framing(self):
+        """Test that an init negotiates binary frames, also for read-ahead requests."""
+        async def handle_message(msg_obj):
+            return {'status': 'ok', 'lines': [msg_obj.get('pattern', '')] * 2}
+        
+        async def main():
+            done = asyncio.Event()
+            
+            async def client_connected(reader, writer):
+                await serve_stream(reader, writer, handle_message)
+                writer.close()
+                await writer.wait_closed()
+                done.set()
+            
+            listener = await start_server('unix', None, self.path, client_connected)
+            reader, writer = await asyncio.open_unix_connection(self.path)
+            # The search is sent before the init is answered
+            writer.write(b'{"type": "init", "framing": "binary"}\n'
+                         + encode_frame({'type': 'search', 'pattern': 'ab'}))
+            init = await reader.readline()
+            header = await reader.readexactly(FRAME_HEADER.size)
+            _, metadata_size, payload_size, _ = FRAME_HEADER.unpack(header)
+            search = decode_frame(header, await reader.readexactly(metadata_size + payload_size))
+            writer.close()
+            await writer.wait_closed()
+            await done.wait()
+            listener.close()
+            return init, search
+        
+        init, search = asyncio.run(main())
+        self.assertEqual(init, b'{"status": "ok", "lines": ["", ""], "framing": "binary"}\n')
+        self.assertEqual(search, {'status': 'ok', 'lines': ['ab', 'ab']})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the trigram index.
+"""
+import unittest
+import sys
+import os
+
+# Add src directory to path to import trigram_index module
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from corpus import LineCorpus
+from search_filter import IncrementalSearchFilter
+from trigram_index import TrigramIndex
+
+
+class TestTrigramIndex(unittest.TestCase):
+    """Test cases for TrigramIndex."""
+    
+    def setUp(self):
+        """Set up test data."""
+        self.test_lines = [
+            "apple",
+            "banana",
+            "Apple Pie",
+            "BANANA SPLIT",
+            "pineapple",
+            "ap",
+        ]
+        self.corpus = LineCorpus(self.test_lines)
+    
+    def make_index(self):
+        index = TrigramIndex(self.corpus)
+        # Narrow the search however many of these few lines are candidates
+        index.MAX_CANDIDATE_SHARE = 1.0
+        return index
+    
+    def test_candidates_contain_all_matches(self):
+        """Test that candidates are a superset of the real matches."""
+        index = self.make_index()
+        index.build()
+        self.assertTrue(index.complete)
+        for pattern in ["apple", "ana", "nan", "pie", "e p", "zzz"]:
+            candidates = index.candidates(pattern)
+            self.assertEqual(candidates, sorted(candidates))
+            self.assertEqual(self.corpus.search(pattern, candidates), self.corpus.search(pattern))
+        self.assertEqual(index.candidates("apple"), [0, 2, 4])
+        self.assertEqual(index.candidates("zzz"), [])
+    
+    def test_cap(self):
+        """Test that candidates no fewer than the caller's own set are not returned."""
+        index = self.make_index()
+        index.build()
+        self.assertEqual(index.candidates("apple", cap=4), [0, 2, 4])
+        self.assertIsNone(index.candidates("apple", cap=3))
+        self.assertIsNone(index.candidates("zzz", cap=0))
+    
+    def test_short_patterns_fall_back(self):
+        """Test that patterns shorter than a trigram are not narrowed."""
+        index = self.make_index()
+        index.build()
+        self.assertIsNone(index.candidates("ap"))
+    
+    def test_partial_index_includes_unindexed_lines(self):
+        """Test candidates while only part of the corpus is indexed."""
+        index = self.make_index()
+        self.assertIsNone(index.candidates("apple"))
+        
+        class StopAfterFirstBatch:
+            def __init__(self):
+                self.checks = 0
+            
+            def is_set(self):
+                self.checks += 1
+                return self.checks > 1
+        
+        index.BATCH_LINES = 2
+        index._stop = StopAfterFirstBatch()
+        index.build()
+        self.assertEqual(index.indexed_lines, 2)
+        self.assertFalse(index.complete)
+        self.assertEqual(index.candidates("apple"), [0, 2, 3, 4, 5])
+        self.assertEqual(index.candidates("zzz"), [2, 3, 4, 5])
+    
+    def test_large_share_falls_back(self):
+        """Test that candidates covering much of the corpus are not returned."""
+        lines = [f"line {i}" for i in range(1000)]
+        corpus = LineCorpus(lines)
+        index = TrigramIndex(corpus)
+        index.BATCH_LINES = 500
+        index._stop.is_set = iter([False, True]).__next__
+        index.build()
+        self.assertEqual(index.indexed_lines, 500)
+        # Half of the corpus is not indexed yet
+        self.assertIsNone(index.candidates("line 7"))
+        
+        index._stop.is_set = lambda: False
+        index.build()
+        self.assertIsNone(index.candidates("line"))
+        self.assertEqual(index.candidates("line 99"), [99] + list(range(990, 1000)))
+        self.assertEqual(index.candidates("line 999"), [999])
+    
+    def test_background_build(self):
+        """Test building in a background thread."""
+        index = self.make_index()
+        index.start()
+        index.wait()
+        self.assertTrue(index.complete)
+        usage = index.memory_usage()
+        self.assertEqual(usage['indexed_lines'], len(self.test_lines))
+        self.assertGreater(usage['index_bytes'], 0)
+    
+    def test_filter_uses_index(self):
+        """Test that the filter verifies only index candidates."""
+        index = self.make_index()
+        index.build()
+        filter = IncrementalSearchFilter(corpus=self.corpus, index=index)
+        
+        # Lines outside the candidate set are never checked
+        self.corpus.search_lines[5] = "apple"
+        self.assertEqual(filter.update_filter("apple"), "apple")
+        self.assertEqual(filter.filtered_lines, ["apple", "Apple Pie", "pineapple"])
+        self.assertEqual(filter.update_filter("ap"), "apple")
+        self.assertEqual(len(filter.filtered_lines), 4)
+        self.assertIn('index_bytes', filter.memory_usage())
+
+
+if __name__ == '__main__':
+    unittest.main()